@@ -1,6 +1,16 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from .models import *
+from . import exports
+
+
+def export_action(dataset, file_format):
+    """Action tải các dòng đã chọn (stream, không nạp hết vào bộ nhớ)"""
+    def action(modeladmin, request, queryset):
+        return exports.streaming_response(dataset, queryset, file_format)
+    action.__name__ = f'export_{file_format}'
+    return admin.action(description=f"Xuất {file_format.upper()} các dòng đã chọn")(action)
+
 
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
@@ -38,6 +48,8 @@ class SampleAdmin(admin.ModelAdmin):
 @admin.register(TermsOfService)
 class TermsOfServiceAdmin(admin.ModelAdmin):
     list_display = ('version', 'is_active', 'created_at', 'updated_by')
+    # Admin chỉ tự select_related các FK không null; FK null phải khai báo để tránh N+1
+    list_select_related = ('updated_by',)
     list_filter = ('is_active',)
     ordering = ('-created_at',)
 
@@ -49,6 +61,7 @@ class OrderAdmin(admin.ModelAdmin):
     search_fields = ('order_id', 'customer__username')
     readonly_fields = ('order_id', 'created_at', 'updated_at')
     ordering = ('-created_at',)
+    actions = [export_action('orders', 'csv'), export_action('orders', 'xlsx')]
     
     fieldsets = (
         ('Thông tin cơ bản', {
@@ -69,6 +82,7 @@ class OrderAdmin(admin.ModelAdmin):
 @admin.register(OrderProgress)
 class OrderProgressAdmin(admin.ModelAdmin):
     list_display = ('order', 'created_by', 'created_at')
+    list_select_related = ('order__customer', 'created_by')
     list_filter = ('created_at',)
     search_fields = ('order__order_id',)
     ordering = ('-created_at',)
@@ -77,15 +91,42 @@ class OrderProgressAdmin(admin.ModelAdmin):
 @admin.register(Payment)
 class PaymentAdmin(admin.ModelAdmin):
     list_display = ('order', 'amount', 'status', 'created_at', 'verified_by')
+    list_select_related = ('order__customer', 'verified_by')
     list_filter = ('status', 'created_at')
     search_fields = ('order__order_id', 'transaction_id')
     readonly_fields = ('created_at', 'verified_at')
     ordering = ('-created_at',)
+    actions = [export_action('payments', 'csv'), export_action('payments', 'xlsx')]
 
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
-    list_display = ('order', 'sender', 'is_read', 'created_at')
-    list_filter = ('is_read', 'created_at', 'sender__user_type')
+    list_display = ('order', 'sender', 'sender_type', 'created_at')
+    list_filter = ('sender_type', 'created_at')
     search_fields = ('order__order_id', 'sender__username', 'content')
-    ordering = ('-created_at',)
\ No newline at end of file
+    ordering = ('-created_at',)
+
+
+@admin.register(ReadCursor)
+class ReadCursorAdmin(admin.ModelAdmin):
+    list_display = ('order', 'participant', 'last_read_id', 'updated_at')
+    list_filter = ('participant',)
+    search_fields = ('order__order_id',)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'max_attempts', 'owner', 'run_after', 'updated_at')
+    list_select_related = ('owner',)
+    list_filter = ('status', 'name')
+    search_fields = ('name',)
+    readonly_fields = ('created_at', 'updated_at', 'locked_by', 'locked_until', 'last_error', 'result')
+    ordering = ('-created_at',)
+
+
+@admin.register(DashboardCounter)
+class DashboardCounterAdmin(admin.ModelAdmin):
+    list_display = ('key', 'value', 'updated_at')
+    search_fields = ('key',)
+    readonly_fields = ('key', 'value', 'updated_at')
+    ordering = ('key',)
@@ -0,0 +1,283 @@
+"""
+Báo cáo doanh thu và thời gian xử lý đơn theo tháng
+
+Order + Payment được đọc bằng 1 query dạng cột (values_list, LEFT JOIN payment)
+vào DataFrame rồi tổng hợp bằng pandas/NumPy; kết quả lưu vào MonthlyStat.
+Trang báo cáo chỉ đọc bảng này (vài chục dòng mỗi năm) nên không phụ thuộc
+độ dài lịch sử.
+
+Mỗi số liệu thuộc về tháng của sự kiện: tạo đơn (created_at), duyệt
+(approved_at), hoàn thành (completed_at), xác thực thanh toán (verified_at).
+Sự kiện mới luôn rơi vào tháng hiện tại và luôn cập nhật Order.updated_at, nên
+refresh() chỉ tính lại tháng hiện tại (cùng các tháng được làm mới lần cuối
+trước khi kết thúc) từ các đơn có updated_at trong kỳ.
+
+Làm mới: job 'analytics.refresh' (tự xếp khi mở trang báo cáo) hoặc
+python manage.py refresh_reports [--full]. MonthlyStat chỉ có 1 dòng cho mỗi
+(tháng, dịch vụ) và 1 dòng tổng mỗi tháng (ràng buộc unique): hai lần làm mới
+chạy song song thì lần ghi sau lỗi IntegrityError thay vì ghi trùng, job được
+chạy lại theo cơ chế retry của hàng đợi.
+"""
+
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Sum
+from django.db.models.functions import ExtractYear
+from django.utils import timezone
+
+# Field trong values_list -> tên cột trong DataFrame
+COLUMNS = (
+    ('service_type_id', 'service_type'),
+    ('status', 'status'),
+    ('created_at', 'created_at'),
+    ('approved_at', 'approved_at'),
+    ('completed_at', 'completed_at'),
+    ('payment__status', 'payment_status'),
+    ('payment__amount', 'amount'),
+    ('payment__verified_at', 'verified_at'),
+)
+DATE_COLUMNS = ('created_at', 'approved_at', 'completed_at', 'verified_at')
+
+COUNT_FIELDS = ('orders_created', 'orders_approved', 'orders_completed', 'payments_verified', 'turnaround_count')
+TURNAROUND_FIELDS = ('turnaround_avg_hours', 'turnaround_p50_hours', 'turnaround_p90_hours')
+
+READ_CHUNK_SIZE = 5000
+
+
+# ============= KỲ BÁO CÁO =============
+
+def month_start(value):
+    """Ngày đầu tháng (giờ địa phương) của datetime / date"""
+    if isinstance(value, datetime):
+        value = timezone.localtime(value).date()
+    return value.replace(day=1)
+
+
+def next_month(period):
+    return (period + timedelta(days=32)).replace(day=1)
+
+
+def period_start(period):
+    """Mốc bắt đầu tháng theo giờ địa phương (aware) để so sánh trực tiếp với cột datetime"""
+    return datetime.combine(period, time.min, tzinfo=timezone.get_current_timezone())
+
+
+# ============= ĐỌC VÀ TỔNG HỢP =============
+
+def load_frame(since=None, using=DEFAULT_DB_ALIAS):
+    """
+    1 query cho mọi đơn (có updated_at >= since nếu có). Cột thời gian được đổi
+    sang giờ địa phương để cắt tháng đúng như người dùng nhìn thấy.
+    """
+    import pandas as pd
+    from .models import Order
+
+    queryset = Order.objects.using(using).order_by()
+    if since is not None:
+        queryset = queryset.filter(updated_at__gte=since)
+    rows = queryset.values_list(*(field for field, _ in COLUMNS)).iterator(chunk_size=READ_CHUNK_SIZE)
+    frame = pd.DataFrame.from_records(list(rows), columns=[name for _, name in COLUMNS])
+
+    tz = timezone.get_current_timezone()
+    for column in DATE_COLUMNS:
+        frame[column] = pd.to_datetime(frame[column], utc=True).dt.tz_convert(tz).dt.tz_localize(None)
+    frame['amount'] = frame['amount'].astype('float64')
+    return frame
+
+
+def _group(frame, column, by_service):
+    """groupby theo tháng của `column` (và dịch vụ); dòng có `column` rỗng bị bỏ qua"""
+    keys = [frame[column].dt.to_period('M').rename('period')]
+    if by_service:
+        keys.append(frame['service_type'])
+    return frame.groupby(keys)
+
+
+def monthly_table(frame, by_service):
+    """DataFrame index (period[, service_type]) với các cột của MonthlyStat"""
+    import pandas as pd
+
+    completed = frame[frame['status'] == 'completed']
+    timed = completed[completed['approved_at'].notna()]
+    timed = timed.assign(hours=(timed['completed_at'] - timed['approved_at']).dt.total_seconds() / 3600)
+    verified = frame[frame['payment_status'] == 'verified']
+
+    turnaround = _group(timed, 'completed_at', by_service)['hours']
+    payments = _group(verified, 'verified_at', by_service)
+    table = pd.concat({
+        'orders_created': _group(frame, 'created_at', by_service).size(),
+        'orders_approved': _group(frame, 'approved_at', by_service).size(),
+        'orders_completed': _group(completed, 'completed_at', by_service).size(),
+        'payments_verified': payments.size(),
+        'revenue': payments['amount'].sum(),
+        'turnaround_count': turnaround.size(),
+        'turnaround_avg_hours': turnaround.mean(),
+        'turnaround_p50_hours': turnaround.quantile(0.5),
+        'turnaround_p90_hours': turnaround.quantile(0.9),
+    }, axis=1)
+    fill = dict.fromkeys(COUNT_FIELDS + ('revenue',), 0)
+    return table.fillna(fill)
+
+
+def build_stats(frame, refreshed_at):
+    """MonthlyStat (chưa lưu) cho mọi tháng có dữ liệu: từng dịch vụ + dòng tổng"""
+    import numpy as np
+    from .models import MonthlyStat
+
+    if frame.empty:
+        return []
+    stats = []
+    for by_service in (True, False):
+        table = monthly_table(frame, by_service)
+        for key, row in zip(table.index, table.to_dict('records')):
+            period, service_type = key if by_service else (key, None)
+            stats.append(MonthlyStat(
+                period=period.start_time.date(),
+                service_type_id=int(service_type) if service_type is not None else None,
+                revenue=round(row['revenue']),
+                refreshed_at=refreshed_at,
+                **{field: int(row[field]) for field in COUNT_FIELDS},
+                **{field: None if np.isnan(row[field]) else round(float(row[field]), 2) for field in TURNAROUND_FIELDS},
+            ))
+    return stats
+
+
+# ============= LÀM MỚI BẢNG TỔNG HỢP =============
+
+def stale_periods(now=None, using=DEFAULT_DB_ALIAS):
+    """
+    Tháng cần tính lại: tháng hiện tại, các tháng chưa có dòng tổng kể từ lần
+    làm mới cuối, và tháng được làm mới lần cuối trước khi tháng đó kết thúc.
+    """
+    from .models import MonthlyStat
+
+    now = now or timezone.now()
+    current = month_start(now)
+    refreshed = dict(
+        MonthlyStat.objects.using(using).filter(service_type=None).values_list('period', 'refreshed_at')
+    )
+    periods = {current}
+    for period, refreshed_at in refreshed.items():
+        if period < current and refreshed_at < period_start(next_month(period)):
+            periods.add(period)
+    if refreshed:
+        period = max(refreshed)
+        while period < current:
+            periods.add(period)
+            period = next_month(period)
+    return sorted(periods)
+
+
+def _save(stats, periods, refreshed_at, using, replace_all=False):
+    from .models import MonthlyStat
+
+    # Tháng không có sự kiện nào vẫn có dòng tổng, để biết đã được làm mới
+    covered = {stat.period for stat in stats if stat.service_type_id is None}
+    stats += [MonthlyStat(period=period, refreshed_at=refreshed_at) for period in periods if period not in covered]
+    with transaction.atomic(using=using):
+        queryset = MonthlyStat.objects.using(using)
+        if not replace_all:
+            queryset = queryset.filter(period__in=periods)
+        queryset.delete()
+        MonthlyStat.objects.using(using).bulk_create(stats, batch_size=1000)
+
+
+def refresh(now=None, using=DEFAULT_DB_ALIAS):
+    """Tính lại các tháng stale_periods(); chưa có dữ liệu tổng hợp thì dựng lại toàn bộ"""
+    from .models import MonthlyStat
+
+    now = now or timezone.now()
+    if not MonthlyStat.objects.using(using).exists():
+        return rebuild(now=now, using=using)
+    periods = stale_periods(now, using=using)
+    frame = load_frame(since=period_start(periods[0]), using=using)
+    stats = [stat for stat in build_stats(frame, now) if stat.period in periods]
+    _save(stats, periods, now, using)
+    return periods
+
+
+def rebuild(now=None, using=DEFAULT_DB_ALIAS):
+    """Dựng lại MonthlyStat cho toàn bộ lịch sử; trả về danh sách tháng"""
+    now = now or timezone.now()
+    stats = build_stats(load_frame(using=using), now)
+    period = min((stat.period for stat in stats), default=month_start(now))
+    periods = []
+    while period <= month_start(now):
+        periods.append(period)
+        period = next_month(period)
+    _save(stats, periods, now, using, replace_all=True)
+    return periods
+
+
+def schedule_refresh(now=None):
+    """Xếp job làm mới nếu tháng hiện tại cũ hơn ANALYTICS_REFRESH_MINUTES và chưa có job chờ"""
+    from .jobs import enqueue
+    from .models import Job, MonthlyStat
+
+    now = now or timezone.now()
+    refreshed_at = MonthlyStat.objects.filter(
+        period=month_start(now), service_type=None
+    ).values_list('refreshed_at', flat=True).first()
+    if refreshed_at and refreshed_at > now - timedelta(minutes=settings.ANALYTICS_REFRESH_MINUTES):
+        return None
+    if Job.objects.filter(name='analytics.refresh', status__in=('queued', 'running')).exists():
+        return None
+    return enqueue('analytics.refresh')
+
+
+# ============= ĐỌC CHO TRANG BÁO CÁO =============
+
+def yearly_totals():
+    """Tổng theo năm từ các dòng tổng: [{'year', 'revenue', 'orders_created', 'orders_completed'}]"""
+    from .models import MonthlyStat
+
+    return list(
+        MonthlyStat.objects.filter(service_type=None)
+        .annotate(year=ExtractYear('period')).values('year')
+        .annotate(revenue=Sum('revenue'), orders_created=Sum('orders_created'),
+                  orders_completed=Sum('orders_completed'))
+        .order_by('year')
+    )
+
+
+def year_report(year):
+    """
+    Số liệu 1 năm: months (dòng tổng từng tháng + doanh thu từng dịch vụ theo
+    thứ tự `services`) và by_service (cộng dồn cả năm cho từng dịch vụ).
+    """
+    from .models import MonthlyStat, ServiceType
+
+    rows = list(MonthlyStat.objects.filter(period__year=year).order_by('period'))
+    service_ids = sorted({row.service_type_id for row in rows if row.service_type_id is not None})
+    services = list(ServiceType.objects.filter(id__in=service_ids).order_by('name'))
+
+    revenue = {(row.period, row.service_type_id): row.revenue for row in rows}
+    months = [
+        {'stat': row, 'revenue_by_service': [revenue.get((row.period, service.id), 0) for service in services]}
+        for row in rows if row.service_type_id is None
+    ]
+
+    by_service = []
+    for service in services:
+        service_rows = [row for row in rows if row.service_type_id == service.id]
+        timed = sum(row.turnaround_count for row in service_rows)
+        by_service.append({
+            'service': service,
+            'revenue': sum(row.revenue for row in service_rows),
+            'orders_created': sum(row.orders_created for row in service_rows),
+            'orders_completed': sum(row.orders_completed for row in service_rows),
+            'payments_verified': sum(row.payments_verified for row in service_rows),
+            # Trung bình có trọng số theo số đơn; trung vị / p90 không cộng gộp được nên chỉ xem theo tháng
+            'turnaround_avg_hours': sum(
+                row.turnaround_avg_hours * row.turnaround_count for row in service_rows if row.turnaround_count
+            ) / timed if timed else None,
+        })
+    by_service.sort(key=lambda item: item['revenue'], reverse=True)
+    return {
+        'services': services,
+        'months': months,
+        'by_service': by_service,
+        'refreshed_at': max((row.refreshed_at for row in rows), default=None),
+    }
@@ -4,4 +4,8 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
-    verbose_name = 'Duy Hoàng Art Core'
\ No newline at end of file
+    verbose_name = 'Duy Hoàng Art Core'
+
+    def ready(self):
+        # Đăng ký các task nền cho core.jobs và signal handlers
+        from . import signals, tasks  # noqa: F401
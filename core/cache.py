@@ -0,0 +1,64 @@
+"""
+Cache có phiên bản (generation) cho các trang công khai
+
+Mỗi khi Sample, ServiceType hoặc TermsOfService thay đổi, signal sẽ đổi
+generation (sau khi transaction commit), nên mọi key cũ tự động hết hiệu lực
+mà không cần xóa từng key.
+
+Generation là một giá trị ngẫu nhiên mới ghi đè bằng set(), không phải incr():
+incr() của FileBasedCache là đọc-sửa-ghi nên hai lần tăng đồng thời có thể mất
+một lần. Với set(), lần ghi nào thắng cũng là giá trị chưa từng dùng, nên key
+cũ vẫn chắc chắn hết hiệu lực.
+"""
+
+import secrets
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+GENERATION_KEY = 'public:generation'
+
+# Thời gian sống của trang đã cache (giây); thay đổi dữ liệu vẫn hiện ngay nhờ generation
+PAGE_TIMEOUT = 60 * 15
+
+
+def _new_generation():
+    return secrets.token_hex(6)
+
+
+def get_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # add() để hai process không cùng ghi đè một generation mới
+        cache.add(GENERATION_KEY, _new_generation(), timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_generation():
+    """Làm mất hiệu lực toàn bộ cache trang công khai ngay lập tức"""
+    generation = _new_generation()
+    cache.set(GENERATION_KEY, generation, timeout=None)
+    return generation
+
+
+def bump_generation_on_commit(using=DEFAULT_DB_ALIAS):
+    """
+    Đổi generation sau khi transaction hiện tại commit (ngay lập tức nếu không
+    trong transaction). Đổi sớm hơn thì request đồng thời có thể đọc dữ liệu
+    chưa commit rồi cache nó dưới generation mới cho đến hết PAGE_TIMEOUT.
+    """
+    transaction.on_commit(bump_generation, using=using)
+
+
+def versioned_key(prefix, *parts):
+    """VD: versioned_key('home', 3, 2) -> 'home:g1a2b3c4d5e6f:3:2'"""
+    return ':'.join([prefix, f"g{get_generation()}", *(str(part) for part in parts)])
+
+
+def is_cacheable_request(request):
+    """Chỉ cache cho khách chưa đăng nhập và không có flash message đang chờ hiển thị"""
+    if request.method != 'GET' or request.user.is_authenticated:
+        return False
+    storage = getattr(request, '_messages', None)
+    return storage is None or len(storage) == 0
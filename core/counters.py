@@ -0,0 +1,264 @@
+"""
+Bộ đếm dashboard được duy trì tăng dần (incremental)
+
+Mỗi Order/Payment/Message "đóng góp" 0 hoặc 1 vào một số key. Khi bản ghi
+thay đổi, signal so sánh đóng góp cũ và mới rồi cộng phần chênh lệch vào
+DashboardCounter trong cùng transaction. Dashboard chỉ cần đọc vài dòng.
+
+Kiểm tra / dựng lại: python manage.py rebuild_counters [--check]
+"""
+
+from collections import Counter
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+# Key toàn cục (dashboard artist)
+ORDERS_PENDING = 'global:orders_pending'
+ORDERS_IN_PROGRESS = 'global:orders_in_progress'
+PAYMENTS_PENDING = 'global:payments_pending'
+UNREAD_FROM_CUSTOMERS = 'global:unread_from_customers'
+
+ARTIST_KEYS = (ORDERS_PENDING, ORDERS_IN_PROGRESS, PAYMENTS_PENDING, UNREAD_FROM_CUSTOMERS)
+
+
+def customer_key(customer_id, name):
+    """Key theo từng khách: orders_total, orders_completed, unread_from_artist"""
+    return f"customer:{customer_id}:{name}"
+
+
+def customer_keys(customer_id):
+    return tuple(
+        customer_key(customer_id, name)
+        for name in ('orders_total', 'orders_completed', 'unread_from_artist')
+    )
+
+
+# ============= ĐÓNG GÓP CỦA TỪNG BẢN GHI =============
+# Mỗi hàm nhận snapshot (dict các field) và trả về {key: 0/1}
+
+def order_contribution(state):
+    if not state:
+        return {}
+    status = state['status']
+    return {
+        ORDERS_PENDING: int(status == 'pending'),
+        ORDERS_IN_PROGRESS: int(status == 'in_progress'),
+        customer_key(state['customer_id'], 'orders_total'): 1,
+        customer_key(state['customer_id'], 'orders_completed'): int(status == 'completed'),
+    }
+
+
+def payment_contribution(state):
+    if not state:
+        return {}
+    return {PAYMENTS_PENDING: int(state['status'] == 'pending')}
+
+
+def message_contribution(state):
+    """Tin nhắn chưa đọc khi id > cursor đã đọc của bên nhận"""
+    from .models import ReadCursor
+
+    if not state:
+        return {}
+    reader = ReadCursor.other_side(state['sender_type'])
+    last_read_id = ReadCursor.objects.filter(
+        order_id=state['order_id'], participant=reader
+    ).values_list('last_read_id', flat=True).first() or 0
+    unread = int(state['id'] > last_read_id)
+    if state['sender_type'] == 'customer':
+        return {UNREAD_FROM_CUSTOMERS: unread}
+    return {customer_key(_customer_id(state), 'unread_from_artist'): unread}
+
+
+def _customer_id(state):
+    """Id khách hàng của đơn - ưu tiên object Order đã có sẵn trong cache của instance"""
+    from .models import Order
+
+    instance = state.get('instance')
+    order = instance._state.fields_cache.get('order') if instance is not None else None
+    if order is not None and order.pk == state['order_id']:
+        return order.customer_id
+    return Order.objects.filter(pk=state['order_id']).values_list('customer_id', flat=True).first()
+
+
+# Các field quyết định đóng góp của mỗi model
+TRACKED_FIELDS = {
+    'Order': ('status', 'customer_id'),
+    'Payment': ('status',),
+    'Message': ('id', 'sender_type', 'order_id'),
+}
+
+
+def snapshot(instance):
+    """
+    Lưu giá trị các field theo dõi. Đọc qua __dict__ để không kích hoạt query
+    với field bị defer; trả về None nếu thiếu field (chưa biết trạng thái).
+    """
+    values = {}
+    for field in TRACKED_FIELDS[type(instance).__name__]:
+        if field not in instance.__dict__:
+            return None
+        values[field] = instance.__dict__[field]
+    return values
+
+
+def load_snapshot(instance):
+    """Đọc trạng thái đang lưu trong DB (dùng khi snapshot lúc load bị thiếu)"""
+    fields = TRACKED_FIELDS[type(instance).__name__]
+    return type(instance)._base_manager.filter(pk=instance.pk).values(*fields).first() or {}
+
+
+CONTRIBUTIONS = {
+    'Order': order_contribution,
+    'Payment': payment_contribution,
+    'Message': message_contribution,
+}
+
+
+# ============= GHI / ĐỌC =============
+
+def apply_delta(delta):
+    """Cộng {key: chênh lệch} vào bảng DashboardCounter"""
+    from .models import DashboardCounter
+
+    delta = {key: value for key, value in delta.items() if value}
+    if not delta:
+        return
+    with transaction.atomic():
+        for key, value in delta.items():
+            updated = DashboardCounter.objects.filter(key=key).update(value=F('value') + value)
+            if not updated:
+                counter, created = DashboardCounter.objects.get_or_create(key=key, defaults={'value': value})
+                if not created:
+                    DashboardCounter.objects.filter(key=key).update(value=F('value') + value)
+
+
+def diff(old, new):
+    delta = Counter(new)
+    delta.subtract(old)
+    return delta
+
+
+def contribution(instance, state):
+    """{key: 0/1} mà `instance` đóng góp khi ở trạng thái `state`"""
+    if type(instance).__name__ == 'Message':
+        state = state and {**state, 'instance': instance}
+    return CONTRIBUTIONS[type(instance).__name__](state)
+
+
+def record_change(instance, old_state, new_state):
+    if old_state == new_state:
+        return
+    apply_delta(diff(contribution(instance, old_state), contribution(instance, new_state)))
+
+
+def record_delete(instance, old_contribution):
+    """Bản ghi đã xoá: trừ phần đóng góp đã tính lúc pre_delete"""
+    apply_delta(diff(old_contribution, {}))
+
+
+def messages_marked_read(count, sender_type, customer_id):
+    """Gọi khi ReadCursor tiến lên, `count` tin của `sender_type` vừa được đọc"""
+    if sender_type == 'customer':
+        apply_delta({UNREAD_FROM_CUSTOMERS: -count})
+    else:
+        apply_delta({customer_key(customer_id, 'unread_from_artist'): -count})
+
+
+def get_counters(keys):
+    """Đọc nhiều bộ đếm trong 1 query, key chưa có coi như 0"""
+    from .models import DashboardCounter
+
+    values = dict(DashboardCounter.objects.filter(key__in=keys).values_list('key', 'value'))
+    return {key: values.get(key, 0) for key in keys}
+
+
+# ============= DỰNG LẠI TỪ DỮ LIỆU GỐC =============
+
+def _models(apps, *names):
+    """Lấy model từ registry hiện tại, hoặc từ `apps` lịch sử khi chạy trong migration"""
+    if apps is None:
+        from django.apps import apps
+    return [apps.get_model('core', name) for name in names]
+
+
+def compute_all(apps=None, using=DEFAULT_DB_ALIAS):
+    """Tính lại mọi bộ đếm bằng các query GROUP BY trên dữ liệu gốc"""
+    Message, Order, Payment, ReadCursor = _models(apps, 'Message', 'Order', 'Payment', 'ReadCursor')
+
+    expected = {key: 0 for key in ARTIST_KEYS}
+
+    orders = Order.objects.using(using).aggregate(
+        pending=Count('id', filter=Q(status='pending')),
+        in_progress=Count('id', filter=Q(status='in_progress')),
+    )
+    expected[ORDERS_PENDING] = orders['pending']
+    expected[ORDERS_IN_PROGRESS] = orders['in_progress']
+    expected[PAYMENTS_PENDING] = Payment.objects.using(using).filter(status='pending').count()
+    expected[UNREAD_FROM_CUSTOMERS] = _unread(Message, ReadCursor, 'customer').using(using).count()
+
+    per_customer = Order.objects.using(using).values('customer_id').annotate(
+        total=Count('id'),
+        completed=Count('id', filter=Q(status='completed')),
+    )
+    for row in per_customer:
+        expected[customer_key(row['customer_id'], 'orders_total')] = row['total']
+        expected[customer_key(row['customer_id'], 'orders_completed')] = row['completed']
+
+    unread = _unread(Message, ReadCursor, 'artist').using(using).values(
+        'order__customer_id'
+    ).annotate(total=Count('id'))
+    for row in unread:
+        expected[customer_key(row['order__customer_id'], 'unread_from_artist')] = row['total']
+
+    return expected
+
+
+def _unread(Message, ReadCursor, sender_type):
+    """Tin nhắn của `sender_type` mà bên kia chưa đọc (id > cursor)"""
+    last_read = ReadCursor.objects.filter(
+        order_id=OuterRef('order_id'), participant='artist' if sender_type == 'customer' else 'customer'
+    ).values('last_read_id')[:1]
+    return Message.objects.filter(sender_type=sender_type).annotate(
+        last_read=Coalesce(Subquery(last_read), Value(0))
+    ).filter(id__gt=F('last_read'))
+
+
+def verify():
+    """Trả về {key: (giá trị đang lưu, giá trị đúng)} cho các bộ đếm bị lệch"""
+    from .models import DashboardCounter
+
+    expected = compute_all()
+    stored = dict(DashboardCounter.objects.values_list('key', 'value'))
+    mismatches = {}
+    for key in set(expected) | set(stored):
+        if stored.get(key, 0) != expected.get(key, 0):
+            mismatches[key] = (stored.get(key, 0), expected.get(key, 0))
+    return mismatches
+
+
+def rebuild(apps=None, using=DEFAULT_DB_ALIAS):
+    """Ghi đè toàn bộ bảng bộ đếm bằng giá trị tính lại"""
+    DashboardCounter, = _models(apps, 'DashboardCounter')
+    counters = DashboardCounter.objects.using(using)
+
+    with transaction.atomic(using=using):
+        expected = compute_all(apps, using)
+        counters.exclude(key__in=expected).delete()
+        existing = {counter.key: counter for counter in counters.all()}
+        to_update = []
+        for key, value in expected.items():
+            counter = existing.get(key)
+            if counter is None:
+                continue
+            if counter.value != value:
+                counter.value = value
+                to_update.append(counter)
+        counters.bulk_update(to_update, ['value'])
+        counters.bulk_create([
+            DashboardCounter(key=key, value=value)
+            for key, value in expected.items() if key not in existing
+        ])
+    return expected
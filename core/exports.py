@@ -0,0 +1,266 @@
+"""
+Xuất đơn hàng / thanh toán / khách hàng ra CSV hoặc XLSX, stream từng phần
+
+Dữ liệu được đọc bằng values_list theo từng lô khoá chính (WHERE id < id cuối
+của lô trước LIMIT n) và ghi ra ngay khi đọc, nên xuất 1 năm hay 1 tuần đều
+dùng cùng một lượng bộ nhớ. Không dùng .iterator() vì với MySQL (mysqlclient)
+nó vẫn nạp cả kết quả vào client.
+
+XLSX được ghi thẳng thành file zip bằng zipfile (sheet dùng inline string,
+không cần bảng sharedStrings), không cần openpyxl và không giữ file trong bộ nhớ.
+"""
+
+import csv
+import io
+import re
+import zipfile
+from datetime import datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape, quoteattr
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .models import Order, Payment
+
+EXPORT_BATCH_SIZE = 2000
+
+# Số dòng gom lại trước mỗi lần gửi đi
+FLUSH_ROWS = 500
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def _local_datetime(value):
+    # get_default_timezone() được cache, rẻ hơn localtime() khi gọi cho từng ô
+    return value.astimezone(timezone.get_default_timezone()).strftime('%Y-%m-%d %H:%M') if value else ''
+
+
+def _choices(choices):
+    labels = dict(choices)
+    return lambda value: labels.get(value, value or '')
+
+
+# Tên -> (tên sheet, [(tiêu đề cột, field trong values_list, hàm chuyển đổi)])
+# Queryset truyền vào phải có sẵn các field / annotation này
+DATASETS = {
+    'orders': ('Đơn hàng', [
+        ('Mã đơn', 'order_id', None),
+        ('Khách hàng', 'customer__username', None),
+        ('Email', 'customer__email', None),
+        ('Dịch vụ', 'service_type__name', None),
+        ('Trạng thái', 'status', _choices(Order.STATUS_CHOICES)),
+        ('Giá', 'price', None),
+        ('Thanh toán', 'payment__status', _choices(Payment.STATUS_CHOICES)),
+        ('Số tiền đã chuyển', 'payment__amount', None),
+        ('Ngày tạo', 'created_at', _local_datetime),
+        ('Ngày duyệt', 'approved_at', _local_datetime),
+        ('Ngày hoàn thành', 'completed_at', _local_datetime),
+        ('Mô tả', 'description', None),
+    ]),
+    'payments': ('Thanh toán', [
+        ('Mã đơn', 'order__order_id', None),
+        ('Khách hàng', 'order__customer__username', None),
+        ('Giá đơn', 'order__price', None),
+        ('Số tiền đã chuyển', 'amount', None),
+        ('Mã giao dịch', 'transaction_id', None),
+        ('Trạng thái', 'status', _choices(Payment.STATUS_CHOICES)),
+        ('Ngày upload', 'created_at', _local_datetime),
+        ('Ngày xác thực', 'verified_at', _local_datetime),
+        ('Người xác thực', 'verified_by__username', None),
+        ('Ghi chú', 'admin_note', None),
+    ]),
+    'customers': ('Khách hàng', [
+        ('Username', 'username', None),
+        ('Email', 'email', None),
+        ('Số điện thoại', 'phone', None),
+        ('Ngày đăng ký', 'date_joined', _local_datetime),
+        ('Tổng đơn', 'total_orders', None),
+        ('Đơn hoàn thành', 'completed_orders', None),
+        ('Tổng chi', 'total_spent', None),
+    ]),
+}
+
+
+def iterate_rows(queryset, fields, descending=True, batch_size=EXPORT_BATCH_SIZE):
+    """values_list(*fields) theo thứ tự khoá chính, mỗi lần 1 lô `batch_size` dòng"""
+    queryset = queryset.order_by('-pk' if descending else 'pk')
+    last = None
+    while True:
+        batch = queryset
+        if last is not None:
+            batch = batch.filter(pk__lt=last) if descending else batch.filter(pk__gt=last)
+        rows = list(batch.values_list('pk', *fields)[:batch_size])
+        for row in rows:
+            yield row[1:]
+        if len(rows) < batch_size:
+            return
+        last = rows[-1][0]
+
+
+def _convert(row, converters):
+    values = []
+    for value, convert in zip(row, converters):
+        if convert is not None:
+            value = convert(value)
+        elif isinstance(value, Decimal):
+            value = int(value) if value == value.to_integral_value() else float(value)
+        elif isinstance(value, datetime):
+            value = _local_datetime(value)
+        elif value is None:
+            value = ''
+        values.append(value)
+    return values
+
+
+# ============= CSV =============
+
+# Ô bắt đầu bằng các ký tự này bị Excel hiểu là công thức (CSV injection)
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _csv_safe(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_stream(headers, rows):
+    # BOM để Excel mở đúng tiếng Việt
+    buffer = io.StringIO()
+    buffer.write('\ufeff')
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+    for i, row in enumerate(rows, 1):
+        writer.writerow([_csv_safe(value) for value in row])
+        if i % FLUSH_ROWS == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+# ============= XLSX =============
+
+# Ký tự điều khiển không hợp lệ trong XML 1.0
+ILLEGAL_XML_RE = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+SPREADSHEET_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+RELATIONSHIP_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PACKAGE_RELATIONSHIP_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+
+def _xlsx_parts(sheet_name):
+    """Các file cố định của 1 workbook 1 sheet"""
+    # Tên sheet tối đa 31 ký tự, không chứa []:*?/\
+    sheet_name = re.sub(r'[\[\]:*?/\\]', ' ', sheet_name)[:31]
+    return {
+        '[Content_Types].xml': (
+            f'{XML_HEADER}<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/worksheets/sheet1.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            '</Types>'
+        ),
+        '_rels/.rels': (
+            f'{XML_HEADER}<Relationships xmlns="{PACKAGE_RELATIONSHIP_NS}">'
+            f'<Relationship Id="rId1" Type="{RELATIONSHIP_NS}/officeDocument" Target="xl/workbook.xml"/>'
+            '</Relationships>'
+        ),
+        'xl/workbook.xml': (
+            f'{XML_HEADER}<workbook xmlns="{SPREADSHEET_NS}" xmlns:r="{RELATIONSHIP_NS}">'
+            f'<sheets><sheet name={quoteattr(sheet_name)} sheetId="1" r:id="rId1"/></sheets>'
+            '</workbook>'
+        ),
+        'xl/_rels/workbook.xml.rels': (
+            f'{XML_HEADER}<Relationships xmlns="{PACKAGE_RELATIONSHIP_NS}">'
+            f'<Relationship Id="rId1" Type="{RELATIONSHIP_NS}/worksheet" Target="worksheets/sheet1.xml"/>'
+            '</Relationships>'
+        ),
+    }
+
+
+def _xlsx_cell(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c><v>{value}</v></c>'
+    text = escape(ILLEGAL_XML_RE.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(values):
+    return '<row>' + ''.join(_xlsx_cell(value) for value in values) + '</row>'
+
+
+class _ZipStream:
+    """File chỉ ghi (không seek được) để zipfile ghi vào; generator lấy dần dữ liệu ra"""
+
+    def __init__(self):
+        self.chunks = []
+        self.offset = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.offset
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def xlsx_stream(headers, rows, sheet_name='Sheet1'):
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _xlsx_parts(sheet_name).items():
+            archive.writestr(name, content)
+        # force_zip64: chưa biết trước kích thước sheet
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(f'{XML_HEADER}<worksheet xmlns="{SPREADSHEET_NS}"><sheetData>'.encode())
+            pending = [_xlsx_row(headers)]
+            for row in rows:
+                pending.append(_xlsx_row(row))
+                if len(pending) >= FLUSH_ROWS:
+                    sheet.write(''.join(pending).encode('utf-8'))
+                    pending = []
+                    yield stream.take()
+            pending.append('</sheetData></worksheet>')
+            sheet.write(''.join(pending).encode('utf-8'))
+    yield stream.take()
+
+
+# ============= RESPONSE =============
+
+def streaming_response(dataset, queryset, file_format, descending=True):
+    """StreamingHttpResponse tải file `dataset` (khoá trong DATASETS) từ queryset đã lọc"""
+    # Dữ liệu được đọc sau khi view đã trả về, lúc trạng thái @read_replica của
+    # request đã bị gỡ: chốt database ngay bây giờ, nếu không router sẽ chọn 'default'
+    queryset = queryset.using(queryset.db)
+    sheet_name, columns = DATASETS[dataset]
+    headers = [header for header, _, _ in columns]
+    fields = [field for _, field, _ in columns]
+    converters = [convert for _, _, convert in columns]
+    rows = (_convert(row, converters) for row in iterate_rows(queryset, fields, descending))
+
+    if file_format == 'xlsx':
+        content = xlsx_stream(headers, rows, sheet_name)
+    else:
+        content = csv_stream(headers, rows)
+    response = StreamingHttpResponse(content, content_type=CONTENT_TYPES[file_format])
+    filename = f"{dataset}-{timezone.localtime():%Y%m%d-%H%M}.{file_format}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Cache-Control'] = 'private, no-store'
+    return response
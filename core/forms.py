@@ -1,6 +1,8 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
+from django.core.validators import FileExtensionValidator
 from .models import *
+from .uploads import completed_upload
 
 class CustomerRegistrationForm(UserCreationForm):
     """Form đăng ký khách hàng"""
@@ -22,8 +24,41 @@ class CustomerRegistrationForm(UserCreationForm):
             self.fields[field].widget.attrs.update({'class': 'form-control'})
 
 
-class OrderForm(forms.ModelForm):
+class ChunkedUploadFormMixin:
+    """
+    File có thể đến từ upload chia nhỏ (core/uploads.py): JS điền `upload_id`
+    thay vì gửi file trong form. cleaned_data['upload'] là Upload đã nhận đủ.
+    """
+    upload_purpose = None
+    upload_field = None
+
+    def __init__(self, *args, owner=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.owner = owner
+        self.fields['upload_id'] = forms.UUIDField(required=False, widget=forms.HiddenInput)
+        self.required_upload = self.fields[self.upload_field].required
+        self.fields[self.upload_field].required = False
+        self.fields[self.upload_field].widget.attrs['data-chunked-upload'] = self.upload_purpose
+
+    def clean(self):
+        cleaned_data = super().clean()
+        upload_id = cleaned_data.get('upload_id')
+        cleaned_data['upload'] = None
+        if upload_id and self.owner is not None:
+            try:
+                cleaned_data['upload'] = completed_upload(upload_id, self.owner, self.upload_purpose)
+            except forms.ValidationError as error:
+                self.add_error(self.upload_field, error)
+        elif self.required_upload and not cleaned_data.get(self.upload_field):
+            self.add_error(self.upload_field, forms.Field.default_error_messages['required'])
+        return cleaned_data
+
+
+class OrderForm(ChunkedUploadFormMixin, forms.ModelForm):
     """Form tạo đơn hàng"""
+    upload_purpose = 'brief'
+    upload_field = 'brief_file'
+
     class Meta:
         model = Order
         fields = ('service_type', 'description', 'brief_file')
@@ -184,8 +219,11 @@ class OrderStatusForm(forms.Form):
     )
 
 
-class OrderProgressForm(forms.ModelForm):
+class OrderProgressForm(ChunkedUploadFormMixin, forms.ModelForm):
     """Form thêm tiến độ"""
+    upload_purpose = 'progress'
+    upload_field = 'image'
+
     class Meta:
         model = OrderProgress
         fields = ('image', 'note', 'is_final')
@@ -209,4 +247,96 @@ class PaymentVerificationForm(forms.Form):
         required=False,
         label="Ghi chú",
         widget=forms.Textarea(attrs={'class': 'form-control', 'rows': 3})
-    )
\ No newline at end of file
+    )
+
+
+class StatementImportForm(forms.Form):
+    """Upload sao kê ngân hàng để đối soát thanh toán"""
+    statement = forms.FileField(
+        label="File sao kê",
+        help_text="CSV hoặc Excel xuất từ internet banking",
+        validators=[FileExtensionValidator(['csv', 'txt', 'xlsx', 'xlsm', 'xls'])],
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,.txt,.xlsx,.xlsm,.xls'})
+    )
+    dry_run = forms.BooleanField(
+        required=False,
+        label="Chỉ xem trước, chưa xác thực",
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
+    )
+
+
+# ============= BỘ LỌC DANH SÁCH (ARTIST) =============
+
+class DateRangeFilterForm(forms.Form):
+    """Lọc theo khoảng ngày tạo (theo giờ địa phương) và tên khách hàng"""
+    date_from = forms.DateField(
+        required=False,
+        label="Từ ngày",
+        widget=forms.DateInput(attrs={'class': 'form-control form-control-sm', 'type': 'date'})
+    )
+    date_to = forms.DateField(
+        required=False,
+        label="Đến ngày",
+        widget=forms.DateInput(attrs={'class': 'form-control form-control-sm', 'type': 'date'})
+    )
+    customer = forms.CharField(
+        required=False,
+        max_length=150,
+        label="Khách hàng",
+        widget=forms.TextInput(attrs={'class': 'form-control form-control-sm', 'placeholder': 'Tên đăng nhập'})
+    )
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        date_from, date_to = cleaned_data.get('date_from'), cleaned_data.get('date_to')
+        if date_from and date_to and date_from > date_to:
+            raise forms.ValidationError("Ngày bắt đầu phải trước ngày kết thúc.")
+        return cleaned_data
+
+
+class OrderFilterForm(DateRangeFilterForm):
+    """Bộ lọc danh sách đơn hàng"""
+    SORT_CHOICES = (
+        ('newest', 'Mới nhất'),
+        ('oldest', 'Cũ nhất'),
+    )
+    status = forms.ChoiceField(
+        required=False,
+        choices=(('', 'Tất cả trạng thái'),) + Order.STATUS_CHOICES,
+        label="Trạng thái",
+        widget=forms.Select(attrs={'class': 'form-select form-select-sm'})
+    )
+    service = forms.ModelChoiceField(
+        required=False,
+        queryset=ServiceType.objects.all(),
+        empty_label="Tất cả dịch vụ",
+        label="Dịch vụ",
+        widget=forms.Select(attrs={'class': 'form-select form-select-sm'})
+    )
+    sort = forms.ChoiceField(
+        required=False,
+        choices=SORT_CHOICES,
+        label="Sắp xếp",
+        widget=forms.Select(attrs={'class': 'form-select form-select-sm'})
+    )
+
+
+class PaymentFilterForm(DateRangeFilterForm):
+    """Bộ lọc danh sách thanh toán"""
+    status = forms.ChoiceField(
+        required=False,
+        choices=(('', 'Tất cả trạng thái'),) + Payment.STATUS_CHOICES,
+        label="Trạng thái",
+        widget=forms.Select(attrs={'class': 'form-select form-select-sm'})
+    )
+
+
+class SampleFilterForm(forms.Form):
+    """Bộ lọc danh sách samples"""
+    service = forms.ModelChoiceField(
+        required=False,
+        queryset=ServiceType.objects.all(),
+        empty_label="Tất cả dịch vụ",
+        label="Dịch vụ",
+        widget=forms.Select(attrs={'class': 'form-select form-select-sm'})
+    )
@@ -0,0 +1,123 @@
+"""
+Tạo ảnh phái sinh (derivative) nhiều kích thước cho gallery
+Ảnh gốc giữ nguyên, bản WebP/AVIF được lưu theo id sample:
+    sample #12, cas/ab/cd/abcd...png -> samples/derivatives/12/abcd...-640w.webp
+Nhiều sample có thể dùng chung một blob ảnh gốc (core/media.py) nên tên bản
+phái sinh phải có id sample, không thì sample này ghi đè / xoá bản của sample kia.
+"""
+
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, features
+
+try:
+    # Pillow cũ cần plugin riêng để ghi AVIF
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+# Các độ rộng sẽ tạo (px), không bao giờ phóng to quá ảnh gốc
+DERIVATIVE_WIDTHS = (320, 640, 960, 1280)
+
+# Thứ tự ưu tiên khi trình duyệt chọn <source>: AVIF trước, WebP sau
+DERIVATIVE_FORMATS = (
+    ('avif', 'image/avif', {'quality': 55}),
+    ('webp', 'image/webp', {'quality': 80, 'method': 6}),
+)
+
+
+def available_formats():
+    """Các định dạng mà bản Pillow hiện tại ghi được"""
+    return [fmt for fmt in DERIVATIVE_FORMATS if features.check(fmt[0])]
+
+
+DERIVATIVE_DIR = 'samples/derivatives/'
+
+
+def derivative_base(sample):
+    """Phần đầu tên các bản phái sinh của `sample`, theo id sample và tên ảnh gốc"""
+    stem = os.path.splitext(os.path.basename(sample.image.name))[0]
+    return f"{DERIVATIVE_DIR}{sample.pk}/{stem}"
+
+
+def derivatives_base(field_file, derivatives):
+    """
+    Phần đầu tên đã lưu trong Sample.derivatives; bản tạo trước khi có id sample
+    trong tên thì nằm trong thư mục derivatives/ cạnh ảnh gốc
+    """
+    if derivatives.get('base'):
+        return derivatives['base']
+    folder, filename = os.path.split(field_file.name)
+    return os.path.join(folder, 'derivatives', os.path.splitext(filename)[0])
+
+
+def derivative_name(base, width, ext):
+    """Đường dẫn của một bản phái sinh"""
+    return f"{base}-{width}w.{ext}"
+
+
+def generate_derivatives(field_file, base, widths=DERIVATIVE_WIDTHS, storage=None):
+    """
+    Tạo các bản phái sinh cho một ImageField file, tên bắt đầu bằng `base`.
+    Trả về dict dạng {'base': ..., 'width': 2400, 'height': 1600, 'webp': [320, 640], 'avif': [...]}
+    để lưu vào Sample.derivatives.
+    """
+    # Bản phái sinh có tên cố định theo sample nên nằm ở storage thường, không
+    # qua ContentAddressedStorage
+    storage = storage or default_storage
+
+    field_file.open('rb')
+    try:
+        with Image.open(field_file) as source:
+            source = ImageOps.exif_transpose(source)
+            if source.mode not in ('RGB', 'RGBA'):
+                source = source.convert('RGBA' if 'A' in source.getbands() else 'RGB')
+            original_width, original_height = source.size
+
+            # Luôn có ít nhất một bản, kể cả khi ảnh gốc nhỏ hơn mọi mốc
+            targets = sorted({w for w in widths if w < original_width} or {original_width})
+
+            result = {'base': base, 'width': original_width, 'height': original_height}
+            for ext, _mime, options in available_formats():
+                result[ext] = []
+                for width in targets:
+                    height = max(1, round(original_height * width / original_width))
+                    resized = source if width == original_width else source.resize(
+                        (width, height), Image.Resampling.LANCZOS
+                    )
+                    buffer = BytesIO()
+                    resized.save(buffer, format=ext.upper(), **options)
+
+                    name = derivative_name(base, width, ext)
+                    if storage.exists(name):
+                        storage.delete(name)
+                    storage.save(name, ContentFile(buffer.getvalue()))
+                    result[ext].append(width)
+    finally:
+        field_file.close()
+
+    return result
+
+
+def delete_derivatives(field_file, derivatives, storage=None):
+    """Xóa các bản phái sinh đã tạo (khi xóa hoặc thay ảnh gốc)"""
+    storage = storage or default_storage
+    base = derivatives_base(field_file, derivatives)
+    for ext, _mime, _options in DERIVATIVE_FORMATS:
+        for width in derivatives.get(ext, []):
+            name = derivative_name(base, width, ext)
+            if storage.exists(name):
+                storage.delete(name)
+
+
+def build_srcset(field_file, derivatives, ext):
+    """Chuỗi srcset cho một định dạng: 'url-320w.webp 320w, url-640w.webp 640w'"""
+    storage = default_storage
+    base = derivatives_base(field_file, derivatives)
+    return ', '.join(
+        f"{storage.url(derivative_name(base, width, ext))} {width}w"
+        for width in derivatives.get(ext, [])
+    )
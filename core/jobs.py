@@ -0,0 +1,191 @@
+"""
+Hàng đợi công việc nền lưu trong database (không cần Redis/RabbitMQ)
+
+    from core.jobs import enqueue
+    enqueue('image.normalize', model='core.Payment', pk=payment.pk, field='proof_image')
+
+Worker: python manage.py run_jobs --workers 2
+"""
+
+import logging
+import os
+import socket
+import traceback
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Tên task -> hàm, được điền bởi decorator @task trong core/tasks.py
+TASKS = {}
+
+DEFAULT_VISIBILITY_TIMEOUT = 300  # giây
+# Worker gia hạn locked_until của job đang chạy sau mỗi phần này của visibility timeout
+HEARTBEAT_FRACTION = 3
+RETRY_BASE_DELAY = 30  # giây, nhân đôi sau mỗi lần thất bại
+
+
+class JobError(Exception):
+    """Lỗi khi enqueue hoặc chạy job"""
+
+
+def task(name):
+    """Đăng ký một hàm làm task nền"""
+    def decorator(func):
+        TASKS[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, owner=None, delay=0, max_attempts=3, **payload):
+    """
+    Thêm job vào hàng đợi, trả về Job.
+    Job chỉ được worker nhìn thấy sau khi transaction hiện tại commit.
+    """
+    from .models import Job
+
+    if name not in TASKS:
+        raise JobError(f"Task chưa được đăng ký: {name}")
+
+    return Job.objects.create(
+        name=name,
+        payload=payload,
+        owner=owner if owner is not None and owner.is_authenticated else None,
+        max_attempts=max_attempts,
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_jobs(worker, limit=10, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+    """
+    Nhận tối đa `limit` job đến hạn cho worker này.
+    Job đang 'running' nhưng đã quá locked_until (worker chết) cũng được nhận lại
+    nếu còn lượt; hết lượt thì chuyển sang 'failed'.
+    """
+    from .models import Job
+
+    now = timezone.now()
+    expired = Q(status='running', locked_until__lt=now)
+    available = (
+        Q(status='queued', run_after__lte=now)
+        | expired & Q(attempts__lt=F('max_attempts'))
+    )
+    locked_until = now + timedelta(seconds=visibility_timeout)
+
+    with transaction.atomic():
+        abandoned = Job.objects.filter(expired, attempts__gte=F('max_attempts')).update(
+            status='failed',
+            locked_until=None,
+            last_error="Worker dừng giữa chừng (quá visibility timeout) và job đã hết lượt chạy lại.",
+            updated_at=now,
+        )
+        if abandoned:
+            logger.warning("%s job quá visibility timeout và hết lượt, chuyển sang failed", abandoned)
+        ids = list(
+            Job.objects.filter(available)
+            .order_by('run_after', 'id')
+            .values_list('id', flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        # Điều kiện `available` lặp lại trong UPDATE để hai worker không nhận trùng job.
+        # attempts tăng ngay khi nhận, để job làm worker crash không bị chạy mãi.
+        Job.objects.filter(available, id__in=ids).update(
+            status='running',
+            locked_by=worker,
+            locked_until=locked_until,
+            attempts=F('attempts') + 1,
+            updated_at=now,
+        )
+
+    return list(Job.objects.filter(id__in=ids, locked_by=worker, locked_until=locked_until))
+
+
+def execute(job_id):
+    """Chạy một job theo id. Được gọi trong process con của worker."""
+    from .models import Job
+
+    job = Job.objects.get(pk=job_id)
+    func = TASKS.get(job.name)
+    if func is None:
+        raise JobError(f"Task chưa được đăng ký: {job.name}")
+    return func(**job.payload)
+
+
+def _owned(job):
+    """Queryset chỉ khớp khi job vẫn thuộc về worker đã nhận nó (chưa bị nhận lại do timeout)"""
+    from .models import Job
+
+    return Job.objects.filter(pk=job.pk, status='running', locked_by=job.locked_by, locked_until=job.locked_until)
+
+
+def heartbeat(running_jobs, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+    """
+    Gia hạn locked_until cho các job worker vẫn đang chạy, để job chạy lâu hơn
+    visibility timeout (export lớn...) không bị worker khác nhận lại và chạy lần hai.
+    Trả về các job đã mất (bị nhận lại trước khi kịp gia hạn).
+    """
+    lost = []
+    for job in running_jobs:
+        locked_until = timezone.now() + timedelta(seconds=visibility_timeout)
+        if _owned(job).update(locked_until=locked_until):
+            job.locked_until = locked_until
+        else:
+            lost.append(job)
+            logger.warning("Job #%s %s đã bị nhận lại trước khi gia hạn", job.pk, job.name)
+    return lost
+
+
+def mark_done(job, result=None):
+    _owned(job).update(
+        status='done',
+        result=result,
+        locked_until=None,
+        last_error='',
+        updated_at=timezone.now(),
+    )
+
+
+def mark_failed(job, error):
+    """Ghi lỗi, lên lịch chạy lại với backoff hoặc đánh dấu failed khi hết lượt"""
+    now = timezone.now()
+    if job.attempts < job.max_attempts:
+        status = 'queued'
+        run_after = now + timedelta(seconds=RETRY_BASE_DELAY * 2 ** (job.attempts - 1))
+    else:
+        status = 'failed'
+        run_after = job.run_after
+    _owned(job).update(
+        status=status,
+        run_after=run_after,
+        locked_until=None,
+        last_error=error,
+        updated_at=now,
+    )
+    logger.warning("Job #%s %s lỗi (lần %s/%s)", job.pk, job.name, job.attempts, job.max_attempts)
+
+
+def format_exception(exc):
+    return ''.join(traceback.format_exception(type(exc), exc, exc.__traceback__))[-4000:]
+
+
+def job_status(job):
+    """Dữ liệu trạng thái job để trả về dạng JSON"""
+    return {
+        'id': job.pk,
+        'name': job.name,
+        'status': job.status,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'result': job.result,
+        'error': job.last_error.strip().splitlines()[-1] if job.last_error else '',
+        'created_at': job.created_at.isoformat(),
+        'updated_at': job.updated_at.isoformat(),
+    }
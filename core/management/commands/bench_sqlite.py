@@ -0,0 +1,163 @@
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections, transaction
+
+# Cấu hình mặc định của Django: rollback journal, transaction DEFERRED, timeout 5s
+BASELINE_OPTIONS = {'timeout': 5, 'init_command': 'PRAGMA journal_mode=DELETE'}
+
+# Tỉ lệ các thao tác, mô phỏng khách đặt đơn / nhắn tin trong lúc artist xác thực thanh toán
+OPERATIONS = (
+    ('read', 60),
+    ('message', 20),
+    ('mark_read', 10),
+    ('payment', 10),
+)
+
+
+def _use_database(path, options):
+    connection = connections['default']
+    connection.close()
+    connection.settings_dict['NAME'] = str(path)
+    connection.settings_dict['OPTIONS'] = dict(options)
+
+
+def _is_lock_error(error):
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+
+def _seed(customers, orders_per_customer):
+    from core.models import Message, Order, Payment, ServiceType, User
+
+    artist = User.objects.create_user('bench_artist', user_type='artist')
+    service = ServiceType.objects.create(name='Bench', price=100000)
+    for i in range(customers):
+        customer = User.objects.create_user(f'bench_customer_{i}', user_type='customer')
+        for j in range(orders_per_customer):
+            order = Order.objects.create(
+                customer=customer, service_type=service, description='Benchmark', price=100000, status='approved'
+            )
+            Payment.objects.create(order=order, amount=100000, proof_image='payments/bench.png')
+            Message.objects.create(order=order, sender=customer, content='Xin chào')
+            Message.objects.create(order=order, sender=artist, content='Chào bạn')
+
+
+def _worker(path, options, seconds, seed):
+    """Chạy trong process con: lặp các thao tác ngẫu nhiên trong `seconds` giây"""
+    from core import counters
+    from core.models import Message, Order, Payment, ReadCursor
+
+    _use_database(path, options)
+    rng = random.Random(seed)
+    operations, weights = zip(*OPERATIONS)
+    order_rows = list(Order.objects.values_list('id', 'customer_id'))
+    payment_ids = list(Payment.objects.values_list('id', flat=True))
+
+    latencies, errors = [], 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        operation = rng.choices(operations, weights)[0]
+        order_id, customer_id = rng.choice(order_rows)
+        started = time.perf_counter()
+        try:
+            if operation == 'read':
+                list(Order.objects.filter(customer_id=customer_id).select_related('service_type')[:20])
+                counters.get_counters(counters.customer_keys(customer_id))
+            elif operation == 'message':
+                Message.objects.create(
+                    order_id=order_id, sender_id=customer_id, sender_type='customer', content='Benchmark'
+                )
+            elif operation == 'mark_read':
+                order = Order.objects.get(pk=order_id)
+                last_id = order.messages.order_by('-id').values_list('id', flat=True).first()
+                ReadCursor.mark_read(order, 'artist', last_id)
+            else:
+                # Đọc rồi ghi trong cùng transaction như khi artist xác thực thanh toán
+                with transaction.atomic():
+                    payment = Payment.objects.get(pk=rng.choice(payment_ids))
+                    payment.status = 'verified' if payment.status == 'pending' else 'pending'
+                    payment.save()
+        except OperationalError as error:
+            if not _is_lock_error(error):
+                raise
+            errors += 1
+        latencies.append(time.perf_counter() - started)
+
+    connections.close_all()
+    return latencies, errors
+
+
+class Command(BaseCommand):
+    help = (
+        "Đo tỉ lệ lỗi 'database is locked' và độ trễ khi nhiều process cùng đọc/ghi SQLite, "
+        "so sánh cấu hình mặc định của Django với cấu hình trong settings"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help="Số process chạy đồng thời")
+        parser.add_argument('--seconds', type=float, default=10, help="Thời gian chạy mỗi cấu hình")
+        parser.add_argument('--customers', type=int, default=20)
+        parser.add_argument('--orders-per-customer', type=int, default=5)
+        parser.add_argument('--profile', choices=('baseline', 'tuned', 'both'), default='both')
+
+    def handle(self, *args, **options):
+        database = settings.DATABASES['default']
+        if database['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError("Benchmark này chỉ dành cho SQLite")
+
+        profiles = []
+        if options['profile'] in ('baseline', 'both'):
+            profiles.append(('baseline', BASELINE_OPTIONS))
+        if options['profile'] in ('tuned', 'both'):
+            profiles.append(('tuned', dict(database.get('OPTIONS', {}))))
+
+        # Chạy trên database tạm, không đụng tới dữ liệu thật
+        workdir = Path(tempfile.mkdtemp(prefix='bench_sqlite_'))
+        try:
+            template = workdir / 'template.sqlite3'
+            self.stdout.write("Tạo database mẫu...")
+            _use_database(template, BASELINE_OPTIONS)
+            call_command('migrate', verbosity=0, interactive=False)
+            _seed(options['customers'], options['orders_per_customer'])
+            connections.close_all()
+
+            results = []
+            for name, profile_options in profiles:
+                path = workdir / f'{name}.sqlite3'
+                shutil.copy(template, path)
+                self.stdout.write(f"Chạy cấu hình '{name}' ({options['workers']} process, {options['seconds']}s)...")
+                results.append((name, self._run(path, profile_options, options)))
+        finally:
+            connections.close_all()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        self.stdout.write("")
+        self.stdout.write(f"{'cấu hình':<10}{'thao tác':>10}{'ops/s':>10}{'lỗi khoá':>10}{'tỉ lệ lỗi':>11}{'p50 ms':>9}{'p95 ms':>9}")
+        for name, (latencies, errors, elapsed) in results:
+            total = len(latencies)
+            quantiles = statistics.quantiles(latencies, n=20) if total >= 2 else [0] * 19
+            self.stdout.write(
+                f"{name:<10}{total:>10}{total / elapsed:>10.0f}{errors:>10}"
+                f"{errors / total if total else 0:>11.2%}"
+                f"{statistics.median(latencies) * 1000 if total else 0:>9.1f}{quantiles[18] * 1000:>9.1f}"
+            )
+
+    def _run(self, path, profile_options, options):
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            futures = [
+                pool.submit(_worker, path, profile_options, options['seconds'], seed)
+                for seed in range(options['workers'])
+            ]
+            outcomes = [future.result() for future in futures]
+        latencies = [latency for worker_latencies, _ in outcomes for latency in worker_latencies]
+        errors = sum(worker_errors for _, worker_errors in outcomes)
+        return latencies, errors, options['seconds']
@@ -0,0 +1,260 @@
+import json
+import platform
+import statistics
+import time
+from contextlib import ExitStack
+from pathlib import Path
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, get_resolver, reverse
+from django.utils import timezone
+
+# View không đo được bằng GET lặp lại
+SKIP = {
+    'logout': "đăng xuất phiên đang đo",
+    'order_events': "luồng SSE không kết thúc",
+    'mark_messages_read': "chỉ nhận POST",
+    'upload_create': "chỉ nhận POST",
+}
+
+# Vai trò đăng nhập của view không nằm dưới artist/ hoặc customer/ (mặc định: khách vãng lai)
+ROLES = {
+    'job_detail': 'artist',
+    'order_messages': 'customer',
+    'protected_media': 'customer',
+    'upload_detail': 'customer',
+}
+
+# Query string cho view cần tham số; {customer} là username khách hàng dùng để đo
+QUERIES = {
+    'check_username': {'username': '{customer}'},
+    'artist_search': {'q': 'sketch'},
+}
+
+# View có nhiều biến thể cần đo riêng: tên hiển thị -> kwargs cố định
+VARIANTS = {
+    'export_data': {
+        'export_data[orders.csv]': {'dataset': 'orders', 'file_format': 'csv'},
+        'export_data[orders.xlsx]': {'dataset': 'orders', 'file_format': 'xlsx'},
+        'export_data[payments.csv]': {'dataset': 'payments', 'file_format': 'csv'},
+        'export_data[customers.csv]': {'dataset': 'customers', 'file_format': 'csv'},
+    },
+}
+
+# p95 chậm hơn baseline dưới ngưỡng này (ms) coi là nhiễu dù vượt tỉ lệ cho phép
+MIN_REGRESSION_MS = 5
+
+
+def named_patterns(urlconf='core.urls'):
+    """(tên, route, URLPattern) của mọi URL có tên trong core/urls.py (được include ở gốc '')"""
+    for pattern in get_resolver(urlconf).url_patterns:
+        if isinstance(pattern, URLPattern) and pattern.name:
+            yield pattern.name, str(pattern.pattern), pattern
+
+
+def view_role(name, route):
+    if name in ROLES:
+        return ROLES[name]
+    for role in ('artist', 'customer'):
+        if route.startswith(f'{role}/'):
+            return role
+    return 'anonymous'
+
+
+def summarize(timings, queries, sizes, status):
+    """Số liệu của 1 view; thời gian tính bằng ms"""
+    timings = [seconds * 1000 for seconds in timings]
+    return {
+        'status': status,
+        'p50_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(statistics.quantiles(timings, n=20)[18] if len(timings) >= 2 else timings[0], 2),
+        'mean_ms': round(statistics.fmean(timings), 2),
+        # Lấy lần nhiều nhất: cache trúng / trượt không được che mất query thừa
+        'queries': max(queries),
+        'bytes': max(sizes),
+    }
+
+
+def regressions(old, new, tolerance):
+    """[(view, lý do)] của các view tệ đi so với baseline cũ"""
+    found = []
+    for label, result in new['views'].items():
+        before = old['views'].get(label)
+        if before is None:
+            continue
+        if result['status'] != before['status']:
+            found.append((label, f"status {before['status']} -> {result['status']}"))
+        if result['queries'] > before['queries']:
+            found.append((label, f"query {before['queries']} -> {result['queries']}"))
+        slower = result['p95_ms'] - before['p95_ms']
+        if slower > MIN_REGRESSION_MS and result['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            found.append((label, f"p95 {before['p95_ms']:.1f}ms -> {result['p95_ms']:.1f}ms"))
+    return found
+
+
+class Command(BaseCommand):
+    help = (
+        "Đo từng view trong core/urls.py (p50/p95, số query, số byte trả về) trên dữ liệu của "
+        "seed_bench và ghi baseline JSON; --compare báo lỗi khi view chậm đi hoặc tốn thêm query"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help="Số lần đo mỗi view")
+        parser.add_argument('--warmup', type=int, default=2, help="Số lần gọi trước khi đo (nạp cache, template)")
+        parser.add_argument('--artist', default='bench_artist', help="Username artist dùng để đo")
+        parser.add_argument('--customer', default='bench_customer_0', help="Username khách hàng dùng để đo")
+        parser.add_argument('--only', default='', help="Chỉ đo các view này (tên URL, cách nhau bởi dấu phẩy)")
+        parser.add_argument('--output', default='bench_baseline.json', help="File JSON ghi kết quả")
+        parser.add_argument('--compare', metavar='BASELINE', help="So sánh với file baseline cũ")
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help="Tỉ lệ p95 được phép chậm hơn baseline (0.25 = 25%%)")
+
+    def handle(self, *args, **options):
+        from core.models import User
+
+        if options['iterations'] < 1:
+            raise CommandError("--iterations phải lớn hơn 0")
+        old = None
+        if options['compare']:
+            try:
+                old = json.loads(Path(options['compare']).read_text(encoding='utf-8'))
+            except (OSError, ValueError) as error:
+                raise CommandError(f"Không đọc được baseline {options['compare']}: {error}")
+
+        users = User.objects.in_bulk([options['artist'], options['customer']], field_name='username')
+        artist, customer = users.get(options['artist']), users.get(options['customer'])
+        if artist is None or customer is None:
+            raise CommandError("Không tìm thấy tài khoản benchmark; chạy `manage.py seed_bench` trước")
+        clients = {'anonymous': Client(raise_request_exception=False)}
+        for role, user in (('artist', artist), ('customer', customer)):
+            clients[role] = Client(raise_request_exception=False)
+            clients[role].force_login(user)
+
+        values = self.path_values(customer)
+        only = {name.strip() for name in options['only'].split(',') if name.strip()}
+        results, skipped = {}, {}
+        self.stdout.write(f"{'view':<32}{'status':>7}{'p50 ms':>9}{'p95 ms':>9}{'query':>7}{'bytes':>11}")
+        for name, route, pattern in named_patterns():
+            if only and name not in only:
+                continue
+            if name in SKIP:
+                skipped[name] = SKIP[name]
+                continue
+            role = view_role(name, route)
+            for label, fixed in VARIANTS.get(name, {name: {}}).items():
+                missing = [key for key in pattern.pattern.converters if key not in fixed and key not in values]
+                if missing:
+                    skipped[label] = f"không có dữ liệu cho {', '.join(missing)}"
+                    continue
+                kwargs = {key: fixed.get(key, values.get(key)) for key in pattern.pattern.converters}
+                path = reverse(name, kwargs=kwargs)
+                query = {key: value.format(customer=customer.username) for key, value in QUERIES.get(name, {}).items()}
+                result = self.measure(clients[role], path, query, options)
+                results[label] = {'path': path, 'role': role, **result}
+                self.stdout.write(
+                    f"{label:<32}{result['status']:>7}{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}"
+                    f"{result['queries']:>7}{result['bytes']:>11}"
+                )
+
+        baseline = {
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connections['default'].vendor,
+            'iterations': options['iterations'],
+            'warmup': options['warmup'],
+            'data': self.data_volume(),
+            'views': results,
+            'skipped': skipped,
+        }
+        Path(options['output']).write_text(
+            json.dumps(baseline, indent=2, ensure_ascii=False) + '\n', encoding='utf-8'
+        )
+        self.stdout.write(self.style.SUCCESS(f"Đã ghi {len(results)} view vào {options['output']}"))
+        for label, reason in skipped.items():
+            self.stdout.write(f"  bỏ qua {label}: {reason}")
+
+        if old is not None:
+            self.compare(old, baseline, options['tolerance'])
+
+    def path_values(self, customer):
+        """Giá trị tham số URL: đơn của khách có nhiều tin nhắn nhất, thanh toán chờ xác thực..."""
+        from core.models import Job, Order, Payment, ServiceType, Upload
+
+        orders = (
+            Order.objects.filter(customer=customer).select_related('payment')
+            .annotate(message_count=Count('messages')).order_by('-message_count', '-id')
+        )
+        order = orders.filter(payment__isnull=False).first() or orders.first()
+        values = {
+            'order_id': order.id if order else None,
+            'payment_id': Payment.objects.filter(status='pending').order_by('-id').values_list('id', flat=True).first(),
+            'service_id': ServiceType.objects.order_by('id').values_list('id', flat=True).first(),
+            'job_id': Job.objects.order_by('-id').values_list('id', flat=True).first(),
+            'upload_id': Upload.objects.filter(owner=customer).order_by('-created_at').values_list('id', flat=True).first(),
+            'name': order.payment.proof_image.name if order and hasattr(order, 'payment') else None,
+        }
+        return {key: value for key, value in values.items() if value is not None}
+
+    def measure(self, client, path, query, options):
+        timings, queries, sizes, status = [], [], [], None
+        for i in range(options['warmup'] + options['iterations']):
+            with ExitStack() as stack:
+                # Đếm query trên mọi database (view @read_replica đọc từ replica)
+                captures = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+                started = time.perf_counter()
+                response = client.get(path, query)
+                if response.streaming:
+                    size = sum(len(chunk) for chunk in response.streaming_content)
+                else:
+                    size = len(response.content)
+                elapsed = time.perf_counter() - started
+            response.close()
+            if i < options['warmup']:
+                continue
+            timings.append(elapsed)
+            queries.append(sum(len(capture) for capture in captures))
+            sizes.append(size)
+            status = response.status_code
+        return summarize(timings, queries, sizes, status)
+
+    def data_volume(self):
+        from core.models import Message, Order, Payment, Sample, User
+
+        return {
+            'customers': User.objects.filter(user_type='customer').count(),
+            'orders': Order.objects.count(),
+            'payments': Payment.objects.count(),
+            'messages': Message.objects.count(),
+            'samples': Sample.objects.count(),
+        }
+
+    def compare(self, old, new, tolerance):
+        if old.get('data') != new['data']:
+            self.stdout.write(self.style.WARNING(
+                f"Dữ liệu khác baseline ({old.get('data')} / {new['data']}), kết quả khó so sánh"
+            ))
+        self.stdout.write("")
+        self.stdout.write(f"{'view':<32}{'p95 cũ':>9}{'p95 mới':>9}{'thay đổi':>10}{'query':>10}")
+        for label, result in new['views'].items():
+            before = old['views'].get(label)
+            if before is None:
+                self.stdout.write(f"{label:<32}{'(mới)':>9}{result['p95_ms']:>9.1f}")
+                continue
+            change = result['p95_ms'] / before['p95_ms'] - 1 if before['p95_ms'] else 0
+            self.stdout.write(
+                f"{label:<32}{before['p95_ms']:>9.1f}{result['p95_ms']:>9.1f}{change:>+10.0%}"
+                f"{before['queries']:>5} -> {result['queries']}"
+            )
+
+        found = regressions(old, new, tolerance)
+        if found:
+            raise CommandError("View tệ đi so với baseline:\n" + "\n".join(
+                f"  {label}: {reason}" for label, reason in found
+            ))
+        self.stdout.write(self.style.SUCCESS("Không có view nào tệ đi so với baseline"))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from core.models import Sample
+
+
+class Command(BaseCommand):
+    help = "Tạo ảnh WebP/AVIF nhiều kích thước cho các Sample"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Tạo lại cả những sample đã có bản phái sinh")
+
+    def handle(self, *args, **options):
+        samples = Sample.objects.all()
+        if not options['all']:
+            samples = samples.filter(derivatives={})
+
+        count = 0
+        for sample in samples.iterator():
+            try:
+                sample.build_derivatives()
+            except (OSError, ValueError) as exc:
+                self.stderr.write(f"Sample #{sample.pk}: {exc}")
+                continue
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Đã xử lý {count} sample"))
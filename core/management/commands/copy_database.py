@@ -0,0 +1,188 @@
+import time
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+from django.db.models import DateField, Max
+
+# Bảng dẫn xuất: không copy mà dựng lại trên database đích sau khi copy xong
+DERIVED_MODELS = ('core.DashboardCounter', 'core.SearchDocument', 'core.MonthlyStat')
+
+# Bảng `migrate` tự điền ở database đích (post_migrate) với id có thể khác nguồn.
+# Bản của đích bị thay bằng bản của nguồn (giữ id) để FK trỏ tới chúng vẫn đúng
+MIGRATE_FILLED_MODELS = ('contenttypes.ContentType', 'auth.Permission')
+
+
+def copied_models(target):
+    """
+    Mọi model có bảng thật ở database đích: core, auth, sessions, contenttypes,
+    admin... và bảng trung gian của ManyToManyField (User.groups, Group.permissions...)
+    """
+    return [
+        model for model in apps.get_models(include_auto_created=True)
+        if model._meta.managed and not model._meta.proxy
+        and model._meta.label not in DERIVED_MODELS
+        and router.allow_migrate_model(target, model)
+    ]
+
+
+def copy_order(models):
+    """Sắp xếp model sao cho bảng được tham chiếu (FK) luôn được copy trước"""
+    models = set(models)
+    ordered, seen = [], set()
+
+    def visit(model):
+        if model in seen:
+            return
+        seen.add(model)
+        for field in model._meta.concrete_fields:
+            related = field.related_model if field.is_relation else None
+            if related in models and related is not model:
+                visit(related)
+        ordered.append(model)
+
+    for model in sorted(models, key=lambda model: model._meta.label):
+        visit(model)
+    return ordered
+
+
+@contextmanager
+def keep_timestamps(model):
+    """bulk_create gọi pre_save nên auto_now/auto_now_add sẽ ghi đè thời gian gốc; tạm tắt"""
+    fields = [
+        field for field in model._meta.concrete_fields
+        if isinstance(field, DateField) and (field.auto_now or field.auto_now_add)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy toàn bộ dữ liệu (core, tài khoản, phân quyền, session, admin log, bảng M2M) từ "
+        "database này sang database khác (VD SQLite -> MySQL) theo từng lô khoá chính, giữ nguyên id. "
+        "Chạy lại để tiếp tục nếu bị ngắt giữa chừng."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default='sqlite', help="Alias database nguồn (mặc định: sqlite)")
+        parser.add_argument('--target', default=DEFAULT_DB_ALIAS, help="Alias database đích (đã migrate)")
+        parser.add_argument('--batch-size', type=int, default=2000, help="Số dòng mỗi lô")
+        parser.add_argument('--skip-rebuild', action='store_true',
+                            help="Không dựng lại bộ đếm và chỉ mục tìm kiếm sau khi copy")
+
+    def handle(self, *args, **options):
+        source, target = options['source'], options['target']
+        for alias in (source, target):
+            if alias not in connections.settings:
+                raise CommandError(f"Không có database '{alias}' trong settings.DATABASES")
+        if source == target:
+            raise CommandError("Database nguồn và đích phải khác nhau")
+
+        models = copied_models(target)
+        existing = set(connections[target].introspection.table_names())
+        missing = [model._meta.db_table for model in models if model._meta.db_table not in existing]
+        if missing:
+            raise CommandError(
+                f"Database '{target}' chưa có bảng {', '.join(missing)}; "
+                f"chạy `manage.py migrate --database {target}` trước"
+            )
+
+        self.replace_migrate_filled(models, source, target)
+
+        total_rows, started = 0, time.monotonic()
+        for model in copy_order(models):
+            total_rows += self.copy_model(model, source, target, options['batch_size'], options['verbosity'])
+
+        # Id được giữ nguyên nên phải đặt lại sequence (PostgreSQL...); MySQL/SQLite tự cập nhật
+        statements = connections[target].ops.sequence_reset_sql(no_style(), models)
+        if statements:
+            with connections[target].cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã copy {total_rows} dòng trong {elapsed:.1f}s ({total_rows / elapsed if elapsed else 0:.0f} dòng/s)"
+        ))
+
+        if options['skip_rebuild']:
+            return
+        if target == DEFAULT_DB_ALIAS:
+            call_command('rebuild_counters', stdout=self.stdout)
+            call_command('rebuild_search_index', stdout=self.stdout)
+            call_command('refresh_reports', full=True, stdout=self.stdout)
+        else:
+            self.stdout.write(self.style.WARNING(
+                "Database đích không phải 'default': chạy rebuild_counters, rebuild_search_index và "
+                "refresh_reports --full sau khi chuyển sang database mới"
+            ))
+
+    def replace_migrate_filled(self, models, source, target):
+        """
+        Content type và permission do `migrate` tạo ở đích thường có id khác nguồn.
+        Đích chưa có dữ liệu nào khác thì xoá chúng để copy nguyên id từ nguồn;
+        đã có (đang chạy tiếp) mà vẫn khác nguồn thì dừng thay vì copy lệch FK.
+        """
+        filled = [model for model in models if model._meta.label in MIGRATE_FILLED_MODELS]
+        differs = []
+        for model in filled:
+            fields = [field.attname for field in model._meta.concrete_fields]
+            rows = model._base_manager.order_by('pk').values_list(*fields)
+            if list(rows.using(source)) != list(rows.using(target)):
+                differs.append(model)
+        if not differs:
+            return
+
+        others = [model for model in models if model._meta.label not in MIGRATE_FILLED_MODELS]
+        if any(model._base_manager.using(target).exists() for model in others):
+            raise CommandError(
+                f"{', '.join(model._meta.label for model in differs)} ở database '{target}' khác nguồn "
+                f"nhưng đích đã có dữ liệu; copy vào một database vừa migrate, chưa có dữ liệu"
+            )
+        # Permission tham chiếu ContentType nên xoá trước
+        for model in sorted(filled, key=lambda model: model._meta.label != 'auth.Permission'):
+            model._base_manager.using(target).all().delete()
+        ContentType = apps.get_model('contenttypes', 'ContentType')
+        ContentType.objects.clear_cache()
+        self.stdout.write(f"Đã xoá {', '.join(model._meta.label for model in filled)} do migrate tạo ở '{target}'")
+
+    def copy_model(self, model, source, target, batch_size, verbosity=1):
+        """Copy các dòng có pk lớn hơn pk lớn nhất đã có ở đích; trả về số dòng đã copy"""
+        manager = model._base_manager
+        last_pk = manager.using(target).aggregate(last=Max('pk'))['last']
+        rows = manager.using(source).order_by('pk')
+
+        label = model._meta.label
+        if last_pk is not None:
+            self.stdout.write(f"{label}: tiếp tục sau pk={last_pk}")
+
+        copied, started = 0, time.monotonic()
+        with keep_timestamps(model):
+            while True:
+                # Keyset theo pk: mỗi lô là 1 query dùng index, bộ nhớ không tăng theo số dòng
+                remaining = rows.filter(pk__gt=last_pk) if last_pk is not None else rows
+                batch = list(remaining[:batch_size])
+                if not batch:
+                    break
+                with transaction.atomic(using=target):
+                    manager.using(target).bulk_create(batch, batch_size=batch_size)
+                last_pk = batch[-1].pk
+                copied += len(batch)
+                if verbosity >= 2:
+                    self.stdout.write(f"  {label}: {copied} dòng (pk <= {last_pk})")
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f"{label}: {copied} dòng, {elapsed:.1f}s, {copied / elapsed if elapsed else 0:.0f} dòng/s"
+        )
+        return copied
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import media
+
+
+class Command(BaseCommand):
+    help = (
+        "Đếm lại tham chiếu của các file lưu theo nội dung (core.Blob) và xoá file không còn "
+        "bản ghi nào dùng sau BLOB_GC_GRACE_HOURS giờ (nên chạy bằng cron)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Chỉ báo cáo, không sửa / xoá gì")
+        parser.add_argument('--grace-hours', type=float, default=settings.BLOB_GC_GRACE_HOURS,
+                            help="Chỉ động tới blob không thay đổi trong bấy nhiêu giờ")
+
+    def handle(self, *args, **options):
+        stats = media.collect_garbage(options['grace_hours'], dry_run=options['dry_run'])
+        prefix = "[dry-run] " if options['dry_run'] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}Sửa refcount {stats['fixed']} blob, tạo lại {stats['recreated']}, "
+            f"xoá {stats['deleted']} blob ({stats['freed_bytes'] / (1024 * 1024):.1f}MB) "
+            f"và {stats['temp_files']} file tạm"
+        ))
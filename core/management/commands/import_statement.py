@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import reconcile
+from core.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Đọc sao kê ngân hàng (CSV/Excel), ghép nội dung chuyển khoản với thanh toán đang chờ "
+        "theo mã đơn + số tiền và xác thực các thanh toán khớp duy nhất"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File sao kê .csv / .xlsx")
+        parser.add_argument('--user', required=True, help="Tên đăng nhập artist ghi vào verified_by")
+        parser.add_argument('--dry-run', action='store_true', help="Chỉ ghép và báo cáo, không xác thực")
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['user'], user_type='artist').first()
+        if user is None:
+            raise CommandError(f"Không có artist '{options['user']}'")
+
+        started = time.monotonic()
+        try:
+            with open(options['path'], 'rb') as f:
+                lines, summary = reconcile.import_statement(f, options['path'], user, dry_run=options['dry_run'])
+        except (OSError, reconcile.StatementError) as error:
+            raise CommandError(str(error))
+
+        if options['verbosity'] >= 2:
+            for entry in lines:
+                if entry['result'] not in ('matched', 'unmatched'):
+                    self.stdout.write(f"Dòng {entry['line']}: {entry['result']} - {entry['amount']:,} - {entry['description']}")
+
+        prefix = "[dry-run] " if options['dry_run'] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}{summary['total']} dòng tiền vào trong {time.monotonic() - started:.1f}s: "
+            f"xác thực {summary['verified']}, khớp {summary['matched']}, "
+            f"nhiều đơn trùng mã {summary['ambiguous']}, sai số tiền {summary['amount_mismatch']}, "
+            f"trùng lặp {summary['duplicate']}, không khớp {summary['unmatched']}"
+        ))
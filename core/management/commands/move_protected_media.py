@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from core import media
+
+
+class Command(BaseCommand):
+    help = (
+        "Chuyển chứng từ, brief, ảnh tiến độ / chat đã lưu trong MEDIA_ROOT sang PROTECTED_MEDIA_ROOT "
+        "(chạy một lần sau khi nâng cấp, chạy lại được)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Chỉ báo cáo, không chuyển file nào")
+
+    def handle(self, *args, **options):
+        stats = media.move_protected_files(dry_run=options['dry_run'])
+        prefix = "[dry-run] " if options['dry_run'] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}Chuyển {stats['moved']} file, copy {stats['copied']} blob còn dùng công khai, "
+            f"{stats['present']} file đã ở đúng chỗ, {stats['missing']} file không tìm thấy"
+        ))
+        if stats['moved'] or stats['copied']:
+            self.stdout.write("Chạy `manage.py gc_blobs` để hạ refcount của các blob công khai vừa chuyển đi")
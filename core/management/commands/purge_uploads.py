@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core import uploads
+
+
+class Command(BaseCommand):
+    help = "Xoá các upload chia nhỏ bỏ dở hoặc đã gắn vào đơn quá UPLOAD_EXPIRY_HOURS (nên chạy bằng cron)"
+
+    def handle(self, *args, **options):
+        count = uploads.purge_expired()
+        self.stdout.write(self.style.SUCCESS(f"Đã xoá {count} upload"))
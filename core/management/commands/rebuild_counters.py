@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import counters
+
+
+class Command(BaseCommand):
+    help = "Kiểm tra và dựng lại bộ đếm dashboard (core.DashboardCounter) từ dữ liệu gốc"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help="Chỉ kiểm tra, báo lỗi nếu có bộ đếm bị lệch")
+
+    def handle(self, *args, **options):
+        mismatches = counters.verify()
+        for key, (stored, expected) in sorted(mismatches.items()):
+            self.stdout.write(f"{key}: đang lưu {stored}, đúng là {expected}")
+
+        if options['check']:
+            if mismatches:
+                raise CommandError(f"{len(mismatches)} bộ đếm bị lệch")
+            self.stdout.write(self.style.SUCCESS("Tất cả bộ đếm đều đúng"))
+            return
+
+        expected = counters.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã dựng lại {len(expected)} bộ đếm ({len(mismatches)} bị lệch trước đó)"
+        ))
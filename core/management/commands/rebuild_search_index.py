@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from core import search
+
+
+class Command(BaseCommand):
+    help = "Dựng lại chỉ mục tìm kiếm (core.SearchDocument + FTS5/FULLTEXT) từ dữ liệu gốc"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Số tài liệu mỗi lần bulk insert")
+
+    def handle(self, *args, **options):
+        total = search.rebuild(batch_size=options['batch_size'])
+        search.optimize()
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã lập chỉ mục {total} tài liệu (backend: {search.backend()})"
+        ))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import analytics
+
+
+class Command(BaseCommand):
+    help = (
+        "Tính lại số liệu báo cáo theo tháng (core.MonthlyStat): mặc định chỉ tháng hiện tại "
+        "và tháng chưa được chốt (nên chạy bằng cron), --full dựng lại toàn bộ lịch sử"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Dựng lại toàn bộ lịch sử")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        periods = analytics.rebuild() if options['full'] else analytics.refresh()
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã tính lại {len(periods)} tháng"
+            f"{f' ({periods[0]:%m/%Y} - {periods[-1]:%m/%Y})' if periods else ''} "
+            f"trong {time.monotonic() - started:.1f}s"
+        ))
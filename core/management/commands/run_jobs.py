@@ -0,0 +1,86 @@
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core import jobs
+
+
+def _init_worker():
+    # Process con không được dùng chung kết nối DB với process cha
+    connections.close_all()
+
+
+def _run(job_id):
+    try:
+        return jobs.execute(job_id)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Chạy worker xử lý hàng đợi công việc nền (core.Job)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help="Số process xử lý song song")
+        parser.add_argument('--visibility-timeout', type=int, default=jobs.DEFAULT_VISIBILITY_TIMEOUT,
+                            help="Số giây không gia hạn trước khi job đang chạy được coi là mất và nhận lại "
+                                 "(worker tự gia hạn cho job còn chạy)")
+        parser.add_argument('--poll-interval', type=float, default=2.0, help="Số giây chờ khi hàng đợi trống")
+        parser.add_argument('--once', action='store_true', help="Xử lý hết job đến hạn rồi thoát")
+
+    def handle(self, *args, **options):
+        worker = jobs.worker_id()
+        workers = max(1, options['workers'])
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        self.stdout.write(f"Worker {worker} chạy với {workers} process")
+        connections.close_all()
+        running = {}
+        heartbeat_interval = options['visibility_timeout'] / jobs.HEARTBEAT_FRACTION
+        last_heartbeat = time.monotonic()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            while not self.stopping:
+                free = workers - len(running)
+                claimed = jobs.claim_jobs(worker, free, options['visibility_timeout']) if free else []
+                for job in claimed:
+                    running[pool.submit(_run, job.pk)] = job
+
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                done, _pending = wait(running, timeout=min(options['poll_interval'], heartbeat_interval),
+                                      return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._finish(running.pop(future), future)
+
+                if running and time.monotonic() - last_heartbeat >= heartbeat_interval:
+                    jobs.heartbeat(running.values(), options['visibility_timeout'])
+                    last_heartbeat = time.monotonic()
+
+            while running:
+                done, _pending = wait(running, timeout=heartbeat_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._finish(running.pop(future), future)
+                if running:
+                    jobs.heartbeat(running.values(), options['visibility_timeout'])
+
+    def _finish(self, job, future):
+        exc = future.exception()
+        if exc is None:
+            jobs.mark_done(job, future.result())
+            self.stdout.write(f"✅ Job #{job.pk} {job.name}")
+        else:
+            jobs.mark_failed(job, jobs.format_exception(exc))
+            self.stderr.write(f"❌ Job #{job.pk} {job.name}: {exc}")
+
+    def _stop(self, signum, frame):
+        self.stdout.write("Đang dừng, chờ các job đang chạy hoàn tất...")
+        self.stopping = True
@@ -0,0 +1,296 @@
+import io
+import random
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+from django.utils import timezone
+
+from core import analytics, counters, search
+from core.management.commands.copy_database import keep_timestamps
+
+# Tỉ lệ trạng thái đơn, gần với dữ liệu thật: phần lớn đơn đã hoàn thành
+STATUS_WEIGHTS = {
+    'pending': 10,
+    'approved': 10,
+    'paid': 10,
+    'in_progress': 15,
+    'completed': 45,
+    'cancelled': 10,
+}
+
+SERVICE_PRICES = (90000, 150000, 250000, 400000, 650000)
+
+DESCRIPTIONS = (
+    "Vẽ nhân vật OC tóc bạch kim, mắt xanh, cầm kiếm, nền đơn giản",
+    "Sketch bust up cặp đôi, phong cách chibi, có file tham khảo",
+    "Full color half body, ánh sáng hoàng hôn, trang phục cổ trang",
+    "Icon avatar cho kênh stream, nền trong suốt, giao trước cuối tháng",
+    "Tranh fanart nhóm 3 nhân vật, màu pastel, khổ ngang",
+)
+
+MESSAGES = (
+    "Chào bạn, mình gửi thêm ảnh tham khảo nhé",
+    "Mình đã nhận brief, sẽ gửi sketch trong tuần này",
+    "Bạn chỉnh giúp mình màu tóc sáng hơn một chút được không?",
+    "Đã cập nhật tiến độ, bạn xem giúp mình",
+    "Cảm ơn bạn nhiều, tranh đẹp quá!",
+)
+
+BATCH_SIZE = 2000
+
+
+def _png(color):
+    """Ảnh PNG nhỏ dùng chung cho mọi chứng từ / mẫu tranh"""
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), color).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class Command(BaseCommand):
+    help = (
+        "Tạo dữ liệu benchmark bằng bulk_create: khách hàng, đơn hàng ở mọi trạng thái, "
+        "thanh toán, tin nhắn, mẫu tranh; dùng cùng bench_views. Không dùng trên database thật"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=500)
+        parser.add_argument('--orders-per-customer', type=int, default=8)
+        parser.add_argument('--messages-per-order', type=int, default=4, help="Số tin nhắn trung bình mỗi đơn")
+        parser.add_argument('--services', type=int, default=5)
+        parser.add_argument('--samples', type=int, default=40)
+        parser.add_argument('--days', type=int, default=365, help="Đơn được rải đều trong ngần này ngày gần nhất")
+        parser.add_argument('--seed', type=int, default=0, help="Seed của bộ sinh ngẫu nhiên, để lặp lại được")
+        parser.add_argument('--prefix', default='bench', help="Tiền tố username / tên dịch vụ")
+        parser.add_argument('--password', default='bench123', help="Mật khẩu chung của mọi tài khoản")
+        parser.add_argument('--flush', action='store_true', help="Xoá dữ liệu benchmark cũ (cùng tiền tố) trước")
+        parser.add_argument('--skip-rebuild', action='store_true',
+                            help="Không dựng lại bộ đếm, chỉ mục tìm kiếm và báo cáo sau khi tạo")
+
+    def handle(self, *args, **options):
+        from core.models import User
+
+        self.rng = random.Random(options['seed'])
+        self.now = timezone.now()
+        self.prefix = options['prefix']
+        existing = User.objects.filter(username__startswith=f"{self.prefix}_")
+        if options['flush']:
+            self.flush()
+        elif existing.exists():
+            raise CommandError(f"Đã có dữ liệu '{self.prefix}_*'; dùng --flush hoặc --prefix khác")
+
+        started = time.monotonic()
+        with transaction.atomic():
+            artist, customers = self.create_users(options['customers'], options['password'])
+            services = self.create_services(options['services'])
+            orders = self.create_orders(customers, services, options['orders_per_customer'], options['days'])
+            payments = self.create_payments(orders, artist)
+            messages = self.create_messages(orders, artist, options['messages_per_order'])
+            samples = self.create_samples(services, options['samples'])
+            self.create_background(artist, customers)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã tạo {len(customers)} khách hàng, {len(orders)} đơn, {payments} thanh toán, "
+            f"{messages} tin nhắn, {samples} mẫu tranh trong {time.monotonic() - started:.1f}s"
+        ))
+        statuses = Counter(order.status for order in orders)
+        self.stdout.write("  " + ", ".join(f"{status}: {statuses[status]}" for status in STATUS_WEIGHTS))
+        self.stdout.write(
+            f"  Đăng nhập: {artist.username} (artist), {self.prefix}_customer_0 (khách), "
+            f"mật khẩu '{options['password']}'"
+        )
+
+        # bulk_create không gọi signal nên dữ liệu dẫn xuất phải dựng lại
+        if not options['skip_rebuild']:
+            started = time.monotonic()
+            counters.rebuild()
+            documents = search.rebuild()
+            search.optimize()
+            periods = analytics.rebuild()
+            self.stdout.write(
+                f"Đã dựng lại bộ đếm, {documents} tài liệu tìm kiếm, {len(periods)} tháng báo cáo "
+                f"trong {time.monotonic() - started:.1f}s"
+            )
+
+    def flush(self):
+        from core.models import Order, ServiceType, User
+
+        users = User.objects.filter(username__startswith=f"{self.prefix}_")
+        services = ServiceType.objects.filter(name__startswith=f"{self.prefix.title()} ")
+        with transaction.atomic():
+            # Order.service_type là PROTECT nên xoá đơn trước
+            deleted, _ = Order.objects.filter(customer__in=users).delete()
+            deleted += services.delete()[0] + users.delete()[0]
+        self.stdout.write(f"Đã xoá {deleted} dòng dữ liệu benchmark cũ")
+
+    def create_users(self, count, password):
+        from core.models import User
+
+        # Băm mật khẩu 1 lần cho mọi tài khoản (PBKDF2 mất hàng trăm ms mỗi lần)
+        password = make_password(password)
+        artist = User.objects.create(
+            username=f'{self.prefix}_artist', email=f'{self.prefix}_artist@example.com',
+            user_type='artist', is_staff=True, password=password,
+        )
+        customers = [
+            User(
+                username=f'{self.prefix}_customer_{i}', email=f'{self.prefix}_customer_{i}@example.com',
+                phone=f'09{self.rng.randrange(10 ** 8):08d}', user_type='customer', password=password,
+                date_joined=self.now - timedelta(days=self.rng.uniform(0, 730)),
+            )
+            for i in range(count)
+        ]
+        return artist, User.objects.bulk_create(customers, batch_size=BATCH_SIZE)
+
+    def create_services(self, count):
+        from core.models import ServiceType
+
+        return ServiceType.objects.bulk_create([
+            ServiceType(
+                name=f'{self.prefix.title()} {i + 1}', description=DESCRIPTIONS[i % len(DESCRIPTIONS)],
+                price=SERVICE_PRICES[i % len(SERVICE_PRICES)],
+            )
+            for i in range(count)
+        ])
+
+    def create_orders(self, customers, services, per_customer, days):
+        from core.models import Order, OrderSequence
+
+        statuses, weights = zip(*STATUS_WEIGHTS.items())
+        drafts = []
+        for customer in customers:
+            for _ in range(per_customer):
+                created = self.now - timedelta(days=self.rng.uniform(0, days))
+                drafts.append((created, customer, self.rng.choice(services), self.rng.choices(statuses, weights)[0]))
+        drafts.sort(key=lambda draft: draft[0])
+
+        # Mã đơn đúng định dạng DH-YYYYMMDD-XXXXX, nối tiếp số thứ tự đã cấp của từng ngày
+        local_days = [timezone.localtime(created).date() for created, _, _, _ in drafts]
+        sequences = dict(OrderSequence.objects.filter(day__in=set(local_days)).values_list('day', 'last_value'))
+
+        orders = []
+        for (created, customer, service, status), day in zip(drafts, local_days):
+            sequences[day] = sequences.get(day, 0) + 1
+            approved = completed = None
+            updated = created
+            if status != 'pending' and not (status == 'cancelled' and self.rng.random() < 0.5):
+                approved = min(created + timedelta(hours=self.rng.uniform(1, 48)), self.now)
+                updated = approved
+            if status == 'completed':
+                # Sau khi thanh toán được xác thực (tối đa 36 giờ sau khi duyệt)
+                completed = min(approved + timedelta(hours=36 + self.rng.expovariate(1 / 120)), self.now)
+                updated = completed
+            orders.append(Order(
+                order_id=f"DH-{day:%Y%m%d}-{sequences[day]:05d}", customer=customer, service_type=service,
+                description=self.rng.choice(DESCRIPTIONS), status=status, price=service.price,
+                created_at=created, updated_at=updated, approved_at=approved, completed_at=completed,
+            ))
+
+        with keep_timestamps(Order):
+            orders = Order.objects.bulk_create(orders, batch_size=BATCH_SIZE)
+        existing = set(OrderSequence.objects.filter(day__in=sequences).values_list('day', flat=True))
+        OrderSequence.objects.bulk_create(
+            [OrderSequence(day=day, last_value=value) for day, value in sequences.items() if day not in existing],
+            batch_size=BATCH_SIZE,
+        )
+        OrderSequence.objects.bulk_update(
+            [OrderSequence(id=pk, day=day, last_value=sequences[day])
+             for pk, day in OrderSequence.objects.filter(day__in=existing).values_list('id', 'day')],
+            ['last_value'], batch_size=BATCH_SIZE,
+        )
+        return orders
+
+    def create_payments(self, orders, artist):
+        from core.models import Blob, Payment
+
+        storage = Payment._meta.get_field('proof_image').storage
+        proof = storage.save('payments/bench.png', ContentFile(_png('#4a90d9')))
+        payments = []
+        for order in orders:
+            if order.status == 'approved':
+                # Khách đã chuyển khoản nhưng artist chưa xác thực
+                if self.rng.random() < 0.5:
+                    created = order.approved_at + timedelta(hours=self.rng.uniform(1, 24))
+                    payments.append(Payment(order=order, amount=order.price, proof_image=proof,
+                                            status='pending', created_at=min(created, self.now)))
+            elif order.status in ('paid', 'in_progress', 'completed'):
+                created = order.approved_at + timedelta(hours=self.rng.uniform(1, 24))
+                verified = created + timedelta(hours=self.rng.uniform(0.5, 12))
+                payments.append(Payment(
+                    order=order, amount=order.price, proof_image=proof, status='verified',
+                    transaction_id=f'FT{self.rng.randrange(10 ** 10):010d}', created_at=min(created, self.now),
+                    verified_at=min(verified, self.now), verified_by=artist,
+                ))
+            elif order.status == 'cancelled' and order.approved_at and self.rng.random() < 0.3:
+                payments.append(Payment(
+                    order=order, amount=order.price, proof_image=proof, status='rejected',
+                    created_at=order.approved_at, admin_note='Không tìm thấy giao dịch',
+                ))
+        with keep_timestamps(Payment):
+            Payment.objects.bulk_create(payments, batch_size=BATCH_SIZE)
+        # storage.save() đã tính 1 tham chiếu; mọi thanh toán dùng chung file này
+        Blob.objects.filter(protected=True, name=proof).update(refcount=F('refcount') + len(payments) - 1)
+        return len(payments)
+
+    def create_messages(self, orders, artist, per_order):
+        from core.models import Message
+
+        messages = []
+        for order in orders:
+            moment = order.created_at
+            for i in range(self.rng.randint(0, 2 * per_order)):
+                moment += timedelta(hours=self.rng.expovariate(1 / 12))
+                if moment > self.now:
+                    break
+                sender, sender_type = (order.customer, 'customer') if i % 2 == 0 else (artist, 'artist')
+                # bulk_create không gọi save() nên phải tự điền sender_type
+                messages.append(Message(order=order, sender=sender, sender_type=sender_type,
+                                        content=self.rng.choice(MESSAGES), created_at=moment))
+        # Thứ tự id theo thời gian như khi tin nhắn được gửi thật
+        messages.sort(key=lambda message: message.created_at)
+        with keep_timestamps(Message):
+            Message.objects.bulk_create(messages, batch_size=BATCH_SIZE)
+        self.update_last_customer_message(orders)
+        return len(messages)
+
+    def update_last_customer_message(self, orders):
+        """bulk_create không phát signal: tự điền Order.last_customer_message_id (hộp thư artist)"""
+        from core.models import Message, Order
+
+        latest = Message.objects.filter(order=OuterRef('pk'), sender_type='customer').order_by('-id').values('id')[:1]
+        ids = [order.pk for order in orders]
+        for start in range(0, len(ids), BATCH_SIZE):
+            Order.objects.filter(pk__in=ids[start:start + BATCH_SIZE]).update(
+                last_customer_message_id=Subquery(latest)
+            )
+
+    def create_background(self, artist, customers):
+        """1 job đã xong và 1 upload đang dở, để bench_views đo được job_detail / upload_detail"""
+        from core import uploads
+        from core.models import Job
+
+        Job.objects.create(name='analytics.refresh', status='done', owner=artist, attempts=1, result={})
+        if customers:
+            uploads.create_upload(customers[0], 'brief', 'brief.png', 1024 * 1024)
+
+    def create_samples(self, services, count):
+        from core.models import Blob, Sample
+
+        if not count:
+            return 0
+        storage = Sample._meta.get_field('image').storage
+        image = storage.save('samples/bench.png', ContentFile(_png('#e94e77')))
+        Sample.objects.bulk_create([
+            Sample(service_type=services[i % len(services)], title=f'Mẫu {i + 1}', image=image,
+                   description=DESCRIPTIONS[i % len(DESCRIPTIONS)], display_order=i)
+            for i in range(count)
+        ], batch_size=BATCH_SIZE)
+        Blob.objects.filter(protected=False, name=image).update(refcount=F('refcount') + count - 1)
+        return count
@@ -0,0 +1,459 @@
+"""
+Lưu trữ media theo nội dung (content-addressed) và kiểm soát truy cập
+
+ContentAddressedStorage băm SHA-256 trong lúc ghi và lưu mỗi nội dung đúng một
+lần ở `cas/<2 ký tự>/<2 ký tự>/<sha256><đuôi file>`; cùng một ảnh tham khảo
+upload lại ở đơn khác / tin nhắn khác chỉ thêm một tham chiếu (Blob.refcount).
+Xoá bản ghi / thay file chỉ giảm refcount; file không còn ai dùng được xoá bởi
+`manage.py gc_blobs` sau một khoảng chờ, nên không bao giờ mất file đang dùng.
+File cũ (trước khi có cas/) giữ nguyên đường dẫn và không bị xoá.
+
+Chứng từ thanh toán, brief, ảnh tiến độ, ảnh trong chat dùng ProtectedMediaStorage:
+file nằm ở PROTECTED_MEDIA_ROOT, ngoài MEDIA_ROOT nên /media/ không bao giờ phục
+vụ được chúng, kể cả khi biết SHA-256. Blob của hai storage tách riêng
+(Blob.protected): cùng một ảnh vừa là sample vừa là chứng từ thì có hai bản.
+URL trỏ tới PROTECTED_MEDIA_URL, đi qua view `protected_media` để kiểm tra quyền
+theo các đơn hàng tham chiếu tới file. Sau đó việc gửi byte được giao cho web
+server (settings.MEDIA_DELIVERY):
+  - 'nginx':  X-Accel-Redirect tới location internal, VD
+        location /internal-media/ { internal; alias /srv/duyhoang/protected_media/; }
+  - 'apache': X-Sendfile (mod_xsendfile, lighttpd) với đường dẫn tuyệt đối
+  - 'django': FileResponse (server WSGI dùng sendfile nếu có), hỗ trợ Range
+File bảo vệ upload trước khi có PROTECTED_MEDIA_ROOT được chuyển sang bằng
+`manage.py move_protected_media`.
+"""
+
+import hashlib
+import mimetypes
+import os
+import shutil
+import tempfile
+from collections import Counter
+from datetime import timedelta
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import Count, F
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.deconstruct import deconstructible
+from django.utils.functional import cached_property
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.static import serve
+
+# Thư mục upload -> (model, field); upload_to của các field bảo vệ
+PROTECTED_FIELDS = {
+    'payments/': ('Payment', 'proof_image'),
+    'briefs/': ('Order', 'brief_file'),
+    'progress/': ('OrderProgress', 'image'),
+    'messages/': ('Message', 'image'),
+}
+
+
+BLOB_PREFIX = 'cas/'
+BLOB_TEMP_DIR = 'cas/tmp'
+READ_BLOCK_SIZE = 64 * 1024
+MAX_EXTENSION_LENGTH = 10
+
+
+class MovableFile(File):
+    """File đã nằm trên đĩa; FileSystemStorage sẽ rename thay vì copy"""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def blob_name(digest, extension):
+    return f"{BLOB_PREFIX}{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+
+def is_blob_name(name):
+    return name.startswith(BLOB_PREFIX) and not name.startswith(BLOB_TEMP_DIR + '/')
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Mỗi nội dung lưu một lần theo SHA-256, có đếm tham chiếu (xem đầu file)"""
+
+    # Blob.protected của các blob trong storage này
+    protected = False
+
+    def get_available_name(self, name, max_length=None):
+        # Tên thật do nội dung quyết định trong _save()
+        return name
+
+    def _save(self, name, content):
+        from .models import Blob
+
+        extension = os.path.splitext(name)[1].lower()
+        extension = extension if len(extension) <= MAX_EXTENSION_LENGTH else ''
+        if hasattr(content, 'temporary_file_path'):
+            # File đã ở trên đĩa (upload lớn, upload chia nhỏ): chỉ đọc để băm
+            source, temp_path = content.temporary_file_path(), None
+            digest, size = file_digest(source), os.path.getsize(source)
+        else:
+            source = temp_path = self._spool(content)
+            digest, size = file_digest(source), os.path.getsize(source)
+
+        name = blob_name(digest, extension)
+        try:
+            with transaction.atomic():
+                blob, _ = Blob.objects.select_for_update().get_or_create(
+                    protected=self.protected, name=name, defaults={'size': size}
+                )
+                if not self.exists(name):
+                    with open(source, 'rb') as f:
+                        super()._save(name, MovableFile(f))
+                Blob.objects.filter(pk=blob.pk).update(refcount=F('refcount') + 1, updated_at=timezone.now())
+        finally:
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+        return name
+
+    def _spool(self, content):
+        """Ghi nội dung ra file tạm cạnh cas/ (cùng ổ đĩa để rename được), theo từng khối"""
+        directory = self.path(BLOB_TEMP_DIR)
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=directory, delete=False) as temp:
+            for chunk in content.chunks():
+                temp.write(chunk.encode() if isinstance(chunk, str) else chunk)
+        return temp.name
+
+    def reference(self, name):
+        """Thêm một tham chiếu cho blob đã lưu (field được gán thẳng tên file đã có)"""
+        from .models import Blob
+
+        if is_blob_name(name):
+            Blob.objects.filter(protected=self.protected, name=name).update(
+                refcount=F('refcount') + 1, updated_at=timezone.now()
+            )
+
+    def delete(self, name):
+        """Bỏ một tham chiếu; file chỉ bị xoá bởi gc_blobs khi không còn ai dùng"""
+        from .models import Blob
+
+        if is_blob_name(name):
+            Blob.objects.filter(protected=self.protected, name=name, refcount__gt=0).update(
+                refcount=F('refcount') - 1, updated_at=timezone.now()
+            )
+
+
+@deconstructible
+class ProtectedMediaStorage(ContentAddressedStorage):
+    """Lưu ở PROTECTED_MEDIA_ROOT (ngoài MEDIA_ROOT), url() trỏ tới view có kiểm tra quyền"""
+
+    protected = True
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('base_url', settings.PROTECTED_MEDIA_URL)
+        super().__init__(**kwargs)
+
+    @cached_property
+    def base_location(self):
+        # Đọc lúc dùng (không phải lúc import models) để override_settings có tác dụng
+        return self._value_or_setting(self._location, settings.PROTECTED_MEDIA_ROOT)
+
+    def _clear_cached_properties(self, setting, **kwargs):
+        super()._clear_cached_properties(setting, **kwargs)
+        if setting == 'PROTECTED_MEDIA_ROOT':
+            self.__dict__.pop('base_location', None)
+            self.__dict__.pop('location', None)
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while block := f.read(READ_BLOCK_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def content_addressed_fields(protected=None):
+    """
+    (model, tên field) của mọi FileField dùng ContentAddressedStorage;
+    `protected` True / False để chỉ lấy field của ProtectedMediaStorage / storage công khai
+    """
+    from django.apps import apps
+
+    return [
+        (model, field.name)
+        for model in apps.get_app_config('core').get_models()
+        for field in model._meta.concrete_fields
+        if isinstance(getattr(field, 'storage', None), ContentAddressedStorage)
+        and protected in (None, field.storage.protected)
+    ]
+
+
+def is_protected(name):
+    return name.startswith(tuple(PROTECTED_FIELDS))
+
+
+def owning_order_ids(name):
+    """Id các đơn hàng có bản ghi dùng file `name` (blob có thể được nhiều đơn dùng chung)"""
+    from django.apps import apps
+
+    order_ids = set()
+    for prefix, (model_name, field) in PROTECTED_FIELDS.items():
+        if not (name.startswith(prefix) or is_blob_name(name)):
+            continue
+        model = apps.get_model('core', model_name)
+        order_field = 'pk' if model_name == 'Order' else 'order_id'
+        order_ids.update(model.objects.filter(**{field: name}).values_list(order_field, flat=True))
+    return order_ids
+
+
+def is_public_blob(name):
+    """Blob có được field công khai nào (VD Sample.image) dùng không"""
+    return any(
+        model.objects.filter(**{field: name}).exists()
+        for model, field in content_addressed_fields(protected=False)
+    )
+
+
+def serve_public_media(request, path, document_root=None, show_indexes=False):
+    """django.views.static.serve cho DEBUG; file bảo vệ chưa chuyển khỏi MEDIA_ROOT vẫn bị chặn"""
+    if is_protected(path):
+        raise Http404
+    return serve(request, path, document_root, show_indexes)
+
+
+# ============= GỬI FILE =============
+
+def send_file(request, name):
+    storage = ProtectedMediaStorage()
+    try:
+        path = storage.path(name)
+    except SuspiciousFileOperation:
+        # Tên trỏ ra ngoài PROTECTED_MEDIA_ROOT
+        raise Http404
+    if not os.path.isfile(path):
+        raise Http404
+
+    content_type, encoding = mimetypes.guess_type(path)
+    # File nén (.gz...) gửi nguyên dạng, không để trình duyệt tự giải nén
+    content_type = (content_type if not encoding else None) or 'application/octet-stream'
+    delivery = getattr(settings, 'MEDIA_DELIVERY', 'django')
+
+    if delivery == 'nginx':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + quote(name)
+    elif delivery == 'apache':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = path
+    else:
+        response = file_response(request, path, content_type)
+
+    # Nội dung riêng tư: không để proxy/CDN dùng chung
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def file_response(request, path, content_type):
+    """FileResponse có ETag/Last-Modified và một khoảng Range (bytes=a-b)"""
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = f'"{int(stat.st_mtime):x}-{size:x}"'
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is not None:
+        return response
+
+    byte_range = None
+    if 'Range' in request.headers and range_still_valid(request, etag, stat.st_mtime):
+        byte_range = parse_range(request.headers['Range'], size)
+        if byte_range == 'unsatisfiable':
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    f = open(path, 'rb')
+    if byte_range is None:
+        response = FileResponse(f, content_type=content_type)
+    else:
+        start, end = byte_range
+        f.seek(start)
+        # Đoạn tới hết file: giữ file thật để server WSGI dùng sendfile từ vị trí hiện tại
+        body = f if end == size - 1 else FileRange(f, end - start + 1)
+        response = FileResponse(body, content_type=content_type, status=206)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    return response
+
+
+def range_still_valid(request, etag, mtime):
+    """If-Range: chỉ trả một đoạn khi file chưa đổi so với bản trình duyệt đang có"""
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == int(mtime)
+
+
+def parse_range(header, size):
+    """
+    (start, end) cho header 'bytes=a-b' / 'bytes=a-' / 'bytes=-n'.
+    None nếu không hợp lệ hoặc nhiều đoạn (gửi cả file), 'unsatisfiable' nếu nằm ngoài file.
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip() != 'bytes' or ',' in spec:
+        return None
+    first, _, last = spec.strip().partition('-')
+    try:
+        if not first:
+            length = int(last)
+            if length <= 0:
+                return 'unsatisfiable'
+            return max(size - length, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        return 'unsatisfiable'
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+class FileRange:
+    """Đọc tối đa `length` byte từ vị trí hiện tại của file"""
+
+    def __init__(self, f, length):
+        self.file = f
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size) if size else b''
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+# ============= DỌN BLOB =============
+
+def collect_garbage(grace_hours=None, dry_run=False):
+    """
+    Đếm lại tham chiếu từ dữ liệu gốc rồi xoá blob không còn ai dùng, ở cả
+    MEDIA_ROOT lẫn PROTECTED_MEDIA_ROOT.
+    Blob vừa được ghi / bỏ tham chiếu trong `grace_hours` giờ thì chưa hạ refcount
+    và chưa xoá (request đang lưu dở, trang vừa nhận URL cũ...).
+    Trả về dict thống kê.
+    """
+    if grace_hours is None:
+        grace_hours = settings.BLOB_GC_GRACE_HOURS
+    cutoff = timezone.now() - timedelta(hours=grace_hours)
+    stats = Counter()
+    for storage in (ContentAddressedStorage(), ProtectedMediaStorage()):
+        _collect_storage(storage, cutoff, dry_run, stats)
+    return stats
+
+
+def _collect_storage(storage, cutoff, dry_run, stats):
+    from .models import Blob
+
+    references = Counter()
+    for model, field in content_addressed_fields(protected=storage.protected):
+        rows = model.objects.filter(**{f'{field}__startswith': BLOB_PREFIX}).values(field).annotate(
+            total=Count('pk')
+        ).values_list(field, 'total').order_by()
+        for name, total in rows:
+            references[name] += total
+
+    stored = Blob.objects.filter(protected=storage.protected)
+    blobs = {blob.name: blob for blob in stored}
+    for name, expected in references.items():
+        if name not in blobs and storage.exists(name):
+            stats['recreated'] += 1
+            if not dry_run:
+                Blob.objects.get_or_create(
+                    protected=storage.protected, name=name,
+                    defaults={'size': storage.size(name), 'refcount': expected},
+                )
+    for name, blob in blobs.items():
+        expected = references.get(name, 0)
+        # Tăng luôn an toàn; chỉ hạ khi blob đã yên đủ lâu
+        if expected > blob.refcount or (expected < blob.refcount and blob.updated_at < cutoff):
+            stats['fixed'] += 1
+            if not dry_run:
+                Blob.objects.filter(pk=blob.pk).update(refcount=expected)
+
+    for blob in stored.filter(refcount=0, updated_at__lt=cutoff).iterator():
+        stats['deleted'] += 1
+        stats['freed_bytes'] += blob.size
+        if dry_run:
+            continue
+        with transaction.atomic():
+            # Khoá lại để không xoá đúng lúc có upload trùng nội dung
+            locked = Blob.objects.select_for_update().filter(pk=blob.pk, refcount=0).first()
+            if locked is not None:
+                path = storage.path(locked.name)
+                if os.path.exists(path):
+                    os.remove(path)
+                locked.delete()
+
+    # File tạm còn sót (process chết giữa chừng)
+    temp_dir = storage.path(BLOB_TEMP_DIR)
+    if os.path.isdir(temp_dir):
+        for entry in os.scandir(temp_dir):
+            if entry.is_file() and entry.stat().st_mtime < cutoff.timestamp():
+                stats['temp_files'] += 1
+                if not dry_run:
+                    os.remove(entry.path)
+
+
+def move_protected_files(dry_run=False):
+    """
+    Chuyển file của các field bảo vệ từ MEDIA_ROOT (nơi lưu trước khi có
+    PROTECTED_MEDIA_ROOT) sang PROTECTED_MEDIA_ROOT, giữ nguyên tên.
+    Blob còn được field công khai dùng thì copy, còn lại thì chuyển hẳn; tạo
+    Blob.protected cho blob vừa chuyển, phần refcount thừa ở blob công khai do
+    gc_blobs hạ sau BLOB_GC_GRACE_HOURS. Chạy lại được. Trả về dict thống kê.
+    """
+    from django.apps import apps
+    from .models import Blob
+
+    public, protected = ContentAddressedStorage(), ProtectedMediaStorage()
+    references = Counter()
+    for prefix, (model_name, field) in PROTECTED_FIELDS.items():
+        model = apps.get_model('core', model_name)
+        rows = model.objects.exclude(**{field: ''}).values(field).annotate(
+            total=Count('pk')
+        ).values_list(field, 'total').order_by()
+        for name, total in rows:
+            references[name] += total
+
+    stats = Counter()
+    for name, total in sorted(references.items()):
+        source, target = public.path(name), protected.path(name)
+        if os.path.exists(target):
+            stats['present'] += 1
+        elif not os.path.exists(source):
+            stats['missing'] += 1
+            continue
+        elif is_blob_name(name) and is_public_blob(name):
+            stats['copied'] += 1
+            if not dry_run:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copy2(source, target)
+        else:
+            stats['moved'] += 1
+            if not dry_run:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.move(source, target)
+        if is_blob_name(name) and not dry_run:
+            Blob.objects.get_or_create(
+                protected=True, name=name, defaults={'size': os.path.getsize(target), 'refcount': total},
+            )
+    return stats
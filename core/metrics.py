@@ -0,0 +1,318 @@
+"""
+Đo thời gian xử lý request theo tên URL: Server-Timing + histogram cho Prometheus
+
+Mỗi request (MetricsMiddleware) đo:
+  - db:    tổng thời gian / số query trên mọi database (execute_wrapper)
+  - tpl:   thời gian render template (backend TimedDjangoTemplates trong settings)
+  - cache: số lần cache.get() trúng / trượt (backend InstrumentedFileBasedCache)
+  - total: từ khi vào middleware đến khi view trả response
+Kết quả cộng dồn vào histogram theo tên URL, đọc ở /metrics (định dạng text của
+Prometheus). Header Server-Timing (DevTools > Network > Timing) chỉ gửi khi DEBUG,
+cho user staff, hoặc cho mọi người nếu METRICS_SERVER_TIMING = True: số query và
+thời gian DB giúp người ngoài dò ra request nặng.
+
+Không có khoá trên đường nóng: mỗi thread ghi vào bộ số liệu riêng của nó
+(threading.local), /metrics cộng các bộ lại khi được đọc. Số liệu của thread đã
+kết thúc được gộp vào một bộ chung ở lần đọc tiếp theo. Mỗi process (worker
+gunicorn) có số liệu riêng, nên Prometheus cần scrape từng worker hoặc cộng theo
+instance. Response dạng stream (export, SSE) chỉ được tính đến lúc view trả về.
+
+/metrics chỉ mở khi DEBUG hoặc có header Authorization: Bearer <METRICS_TOKEN>.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.filebased import FileBasedCache
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+from django.utils.crypto import constant_time_compare
+
+PREFIX = 'duyhoangsite_'
+
+# Cận trên các bucket (giây), giống mặc định của client Prometheus
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Tên -> (loại, mô tả)
+METRICS = {
+    'request_duration_seconds': ('histogram', "Thời gian xử lý request theo tên URL"),
+    'request_db_seconds': ('histogram', "Tổng thời gian query database trong request"),
+    'request_template_seconds': ('histogram', "Tổng thời gian render template trong request"),
+    'requests_total': ('counter', "Số request theo tên URL và nhóm mã trạng thái"),
+    'db_queries_total': ('counter', "Số query database"),
+    'cache_hits_total': ('counter', "Số lần cache.get() trúng"),
+    'cache_misses_total': ('counter', "Số lần cache.get() trượt"),
+}
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Request đang xử lý; None khi ngoài request (job nền, lệnh manage.py)
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    __slots__ = ('db_time', 'db_queries', 'template_time', 'template_depth', 'cache_hits', 'cache_misses')
+
+    def __init__(self):
+        self.db_time = self.template_time = 0.0
+        self.db_queries = self.template_depth = self.cache_hits = self.cache_misses = 0
+
+
+# ============= LƯU TRỮ =============
+
+class _Shard:
+    """Số liệu của 1 thread; chỉ thread đó ghi"""
+    __slots__ = ('thread', 'histograms', 'counters')
+
+    def __init__(self, thread):
+        self.thread = thread
+        # (tên, nhãn) -> [số lần rơi vào từng bucket..., +Inf, tổng]
+        self.histograms = {}
+        # (tên, nhãn) -> giá trị
+        self.counters = {}
+
+
+_local = threading.local()
+_shards = []
+# Bộ chung chứa số liệu của các thread đã kết thúc; chỉ collect() đụng tới (có khoá)
+_retired = _Shard(None)
+_collect_lock = threading.Lock()
+
+
+def _shard():
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = _local.shard = _Shard(threading.current_thread())
+        _shards.append(shard)
+    return shard
+
+
+def observe(name, labels, value):
+    """Thêm 1 giá trị vào histogram `name`; labels là tuple (tên nhãn, giá trị)"""
+    histograms = _shard().histograms
+    entry = histograms.get((name, labels))
+    if entry is None:
+        entry = histograms[(name, labels)] = [0] * (len(BUCKETS) + 1) + [0.0]
+    entry[bisect_left(BUCKETS, value)] += 1
+    entry[-1] += value
+
+
+def increment(name, labels, amount=1):
+    counters = _shard().counters
+    counters[(name, labels)] = counters.get((name, labels), 0) + amount
+
+
+def _merge(target, shard):
+    # dict.copy() / list() là một thao tác nguyên tử với GIL nên đọc được khi thread khác đang ghi
+    for key, entry in shard.histograms.copy().items():
+        entry = list(entry)
+        current = target.histograms.get(key)
+        target.histograms[key] = [a + b for a, b in zip(current, entry)] if current else entry
+    for key, value in shard.counters.copy().items():
+        target.counters[key] = target.counters.get(key, 0) + value
+
+
+def collect():
+    """Cộng số liệu của mọi thread: _Shard với histograms và counters"""
+    with _collect_lock:
+        for shard in list(_shards):
+            if not shard.thread.is_alive():
+                _merge(_retired, shard)
+                _shards.remove(shard)
+        total = _Shard(None)
+        _merge(total, _retired)
+        for shard in list(_shards):
+            _merge(total, shard)
+    return total
+
+
+def reset():
+    """Xoá toàn bộ số liệu (dùng trong test)"""
+    with _collect_lock:
+        for shard in list(_shards) + [_retired]:
+            shard.histograms.clear()
+            shard.counters.clear()
+
+
+# ============= ĐỊNH DẠNG PROMETHEUS =============
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """Toàn bộ số liệu ở định dạng text của Prometheus"""
+    data = collect()
+    lines = []
+    for name, (kind, description) in METRICS.items():
+        full_name = PREFIX + name
+        lines.append(f'# HELP {full_name} {description}')
+        lines.append(f'# TYPE {full_name} {kind}')
+        if kind == 'histogram':
+            for (metric, labels), entry in sorted(data.histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ('+Inf',), entry[:-1]):
+                    cumulative += count
+                    lines.append(f'{full_name}_bucket{_labels(labels, [("le", bound)])} {cumulative}')
+                lines.append(f'{full_name}_sum{_labels(labels)} {_number(entry[-1])}')
+                lines.append(f'{full_name}_count{_labels(labels)} {cumulative}')
+        else:
+            for (metric, labels), value in sorted(data.counters.items()):
+                if metric == name:
+                    lines.append(f'{full_name}{_labels(labels)} {_number(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def can_see_timing(request):
+    """Header Server-Timing có được gửi cho request này không"""
+    if settings.DEBUG or getattr(settings, 'METRICS_SERVER_TIMING', False):
+        return True
+    user = getattr(request, 'user', None)
+    return user is not None and user.is_staff
+
+
+def can_scrape(request):
+    if settings.DEBUG:
+        return True
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    header = request.headers.get('Authorization', '')
+    return bool(token) and constant_time_compare(header, f'Bearer {token}')
+
+
+# ============= ĐO TỪNG PHẦN =============
+
+def time_query(execute, sql, params, many, context):
+    state = _current.get()
+    if state is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        state.db_time += time.perf_counter() - started
+        state.db_queries += 1
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        state = _current.get()
+        if state is None:
+            return super().render(context, request)
+        # render_to_string lồng nhau (trong template tag) chỉ tính ở lớp ngoài cùng
+        state.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            state.template_depth -= 1
+            if not state.template_depth:
+                state.template_time += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Backend template của Django, có đo thời gian render"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+_MISSING = object()
+
+
+class CacheMetricsMixin:
+    """Đếm cache.get() trúng / trượt của request hiện tại"""
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version=version)
+        state = _current.get()
+        if state is not None:
+            if value is _MISSING:
+                state.cache_misses += 1
+            else:
+                state.cache_hits += 1
+        return default if value is _MISSING else value
+
+    def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT, version=None):
+        # Như BaseCache.get_or_set nhưng lần đọc lại sau add() không bị đếm thêm
+        value = self.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            if callable(default):
+                default = default()
+            self.add(key, default, timeout=timeout, version=version)
+            value = super().get(key, default, version=version)
+        return value
+
+
+class InstrumentedFileBasedCache(CacheMetricsMixin, FileBasedCache):
+    pass
+
+
+# ============= MIDDLEWARE =============
+
+def server_timing(state, total):
+    return ', '.join((
+        f'db;dur={state.db_time * 1000:.1f};desc="{state.db_queries} query"',
+        f'tpl;dur={state.template_time * 1000:.1f}',
+        f'cache;desc="hit {state.cache_hits}, miss {state.cache_misses}"',
+        f'total;dur={total * 1000:.1f}',
+    ))
+
+
+class MetricsMiddleware:
+    """Đo từng request, gửi Server-Timing và cộng vào histogram theo tên URL"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = RequestMetrics()
+        token = _current.set(state)
+        started = time.perf_counter()
+        try:
+            # execute_wrapper() gỡ wrapper bằng pop() nên phải lồng đúng thứ tự với
+            # middleware khác (querybudget), không gắn thẳng vào connection
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(time_query))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - started
+
+        match = request.resolver_match
+        labels = (('view', match.view_name if match else 'unmatched'),)
+        observe('request_duration_seconds', labels, total)
+        observe('request_db_seconds', labels, state.db_time)
+        observe('request_template_seconds', labels, state.template_time)
+        increment('requests_total', labels + (('status', f'{response.status_code // 100}xx'),))
+        if state.db_queries:
+            increment('db_queries_total', labels, state.db_queries)
+        if state.cache_hits:
+            increment('cache_hits_total', labels, state.cache_hits)
+        if state.cache_misses:
+            increment('cache_misses_total', labels, state.cache_misses)
+
+        if can_see_timing(request):
+            response['Server-Timing'] = server_timing(state, total)
+        return response
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 17:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_artistprofile_bank_qr_code_orderprogress_is_final'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sample',
+            name='derivatives',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Các bản WebP/AVIF đã tạo'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.6 on 2026-10-17 17:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_job'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sample',
+            index=models.Index(fields=['display_order', '-id'], name='sample_gallery_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sample',
+            index=models.Index(fields=['service_type', 'display_order', '-id'], name='sample_service_gallery_idx'),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.6 on 2026-10-17 17:37
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def build_counters(apps, schema_editor):
+    """
+    Bản sao cố định của core.counters.rebuild() tại thời điểm này (tin chưa đọc
+    theo Message.is_read); migration không import code đang chạy vì nó sẽ đổi
+    """
+    DashboardCounter = apps.get_model('core', 'DashboardCounter')
+    Message = apps.get_model('core', 'Message')
+    Order = apps.get_model('core', 'Order')
+    Payment = apps.get_model('core', 'Payment')
+    db = schema_editor.connection.alias
+
+    orders = Order.objects.using(db).aggregate(
+        pending=Count('id', filter=Q(status='pending')),
+        in_progress=Count('id', filter=Q(status='in_progress')),
+    )
+    values = {
+        'global:orders_pending': orders['pending'],
+        'global:orders_in_progress': orders['in_progress'],
+        'global:payments_pending': Payment.objects.using(db).filter(status='pending').count(),
+        'global:unread_from_customers': Message.objects.using(db).filter(
+            sender__user_type='customer', is_read=False
+        ).count(),
+    }
+    per_customer = Order.objects.using(db).values('customer_id').annotate(
+        total=Count('id'),
+        completed=Count('id', filter=Q(status='completed')),
+    )
+    for row in per_customer:
+        values[f"customer:{row['customer_id']}:orders_total"] = row['total']
+        values[f"customer:{row['customer_id']}:orders_completed"] = row['completed']
+    unread = Message.objects.using(db).filter(sender__user_type='artist', is_read=False).values(
+        'order__customer_id'
+    ).annotate(total=Count('id'))
+    for row in unread:
+        values[f"customer:{row['order__customer_id']}:unread_from_artist"] = row['total']
+
+    DashboardCounter.objects.using(db).all().delete()
+    DashboardCounter.objects.using(db).bulk_create(
+        [DashboardCounter(key=key, value=value) for key, value in values.items()], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_order_sequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, unique=True)),
+                ('value', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(build_counters, migrations.RunPython.noop),
+    ]
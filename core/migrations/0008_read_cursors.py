@@ -0,0 +1,127 @@
+# Generated by Django 5.2.6 on 2026-10-17 17:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Max, Min, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def copy_sender_type(apps, schema_editor):
+    Message = apps.get_model('core', 'Message')
+    User = apps.get_model('core', 'User')
+    db = schema_editor.connection.alias
+    Message.objects.using(db).update(
+        sender_type=Subquery(User.objects.filter(pk=OuterRef('sender_id')).values('user_type')[:1])
+    )
+
+
+def cursors_from_is_read(apps, schema_editor):
+    """
+    Mỗi (đơn hàng, bên đọc) nhận cursor = id tin chưa đọc đầu tiên - 1,
+    hoặc id tin cuối cùng nếu đã đọc hết. Nếu tin đã đọc và chưa đọc xen kẽ,
+    mọi tin từ tin chưa đọc đầu tiên trở đi vẫn được giữ là chưa đọc.
+    """
+    Message = apps.get_model('core', 'Message')
+    ReadCursor = apps.get_model('core', 'ReadCursor')
+    db = schema_editor.connection.alias
+
+    rows = Message.objects.using(db).values('order_id', 'sender_type').annotate(
+        last_id=Max('id'),
+        first_unread_id=Min('id', filter=models.Q(is_read=False)),
+    )
+    cursors = []
+    for row in rows.iterator():
+        reader = 'customer' if row['sender_type'] == 'artist' else 'artist'
+        if row['first_unread_id'] is None:
+            last_read_id = row['last_id']
+        else:
+            last_read_id = row['first_unread_id'] - 1
+        if last_read_id > 0:
+            cursors.append(ReadCursor(order_id=row['order_id'], participant=reader, last_read_id=last_read_id))
+    ReadCursor.objects.using(db).bulk_create(cursors, batch_size=500)
+
+
+def rebuild_counters(apps, schema_editor):
+    """
+    Dựng lại bộ đếm theo ReadCursor. Bản sao cố định của core.counters.rebuild()
+    tại thời điểm này; migration không import code đang chạy vì nó sẽ đổi.
+    """
+    DashboardCounter = apps.get_model('core', 'DashboardCounter')
+    Message = apps.get_model('core', 'Message')
+    Order = apps.get_model('core', 'Order')
+    Payment = apps.get_model('core', 'Payment')
+    ReadCursor = apps.get_model('core', 'ReadCursor')
+    db = schema_editor.connection.alias
+
+    def unread(sender_type):
+        last_read = ReadCursor.objects.using(db).filter(
+            order_id=OuterRef('order_id'), participant='artist' if sender_type == 'customer' else 'customer'
+        ).values('last_read_id')[:1]
+        return Message.objects.using(db).filter(sender_type=sender_type).annotate(
+            last_read=Coalesce(Subquery(last_read), Value(0))
+        ).filter(id__gt=F('last_read'))
+
+    orders = Order.objects.using(db).aggregate(
+        pending=Count('id', filter=Q(status='pending')),
+        in_progress=Count('id', filter=Q(status='in_progress')),
+    )
+    values = {
+        'global:orders_pending': orders['pending'],
+        'global:orders_in_progress': orders['in_progress'],
+        'global:payments_pending': Payment.objects.using(db).filter(status='pending').count(),
+        'global:unread_from_customers': unread('customer').count(),
+    }
+    per_customer = Order.objects.using(db).values('customer_id').annotate(
+        total=Count('id'),
+        completed=Count('id', filter=Q(status='completed')),
+    )
+    for row in per_customer:
+        values[f"customer:{row['customer_id']}:orders_total"] = row['total']
+        values[f"customer:{row['customer_id']}:orders_completed"] = row['completed']
+    for row in unread('artist').values('order__customer_id').annotate(total=Count('id')):
+        values[f"customer:{row['order__customer_id']}:unread_from_artist"] = row['total']
+
+    DashboardCounter.objects.using(db).all().delete()
+    DashboardCounter.objects.using(db).bulk_create(
+        [DashboardCounter(key=key, value=value) for key, value in values.items()], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_dashboard_counter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReadCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('participant', models.CharField(choices=[('artist', 'Artist'), ('customer', 'Customer')], max_length=10)),
+                ('last_read_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_cursors', to='core.order')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('order', 'participant'), name='unique_read_cursor')],
+            },
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='sender_type',
+            field=models.CharField(choices=[('artist', 'Artist'), ('customer', 'Customer')], default='customer', editable=False, max_length=10),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_sender_type, migrations.RunPython.noop),
+        migrations.RunPython(cursors_from_is_read, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='message',
+            name='is_read',
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['order', 'sender_type', 'id'], name='message_unread_idx'),
+        ),
+        migrations.RunPython(rebuild_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,129 @@
+# Generated by Django 5.2.6 on 2026-10-17 17:48
+
+import django.db.models.deletion
+from django.db import OperationalError, migrations, models
+from django.utils import timezone
+
+FTS_TABLE = 'core_searchdocument_fts'
+
+SQLITE_FORWARD = [
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        title, body,
+        content='core_searchdocument', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER core_searchdocument_ai AFTER INSERT ON core_searchdocument BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+    f"""CREATE TRIGGER core_searchdocument_ad AFTER DELETE ON core_searchdocument BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+    END""",
+    f"""CREATE TRIGGER core_searchdocument_au AFTER UPDATE ON core_searchdocument BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO {FTS_TABLE}(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS core_searchdocument_au",
+    "DROP TRIGGER IF EXISTS core_searchdocument_ad",
+    "DROP TRIGGER IF EXISTS core_searchdocument_ai",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def create_fulltext_index(apps, schema_editor):
+    """FTS5 + trigger trên SQLite, FULLTEXT index trên MySQL; database khác dùng icontains"""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        try:
+            schema_editor.execute(SQLITE_FORWARD[0])
+        except OperationalError:
+            # SQLite build không có FTS5 -> core.search tự dùng icontains
+            return
+        for statement in SQLITE_FORWARD[1:]:
+            schema_editor.execute(statement)
+    elif vendor == 'mysql':
+        schema_editor.execute(
+            "CREATE FULLTEXT INDEX core_searchdocument_ft ON core_searchdocument (title, body)"
+        )
+
+
+def drop_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for statement in SQLITE_BACKWARD:
+            schema_editor.execute(statement)
+    elif vendor == 'mysql':
+        schema_editor.execute("DROP INDEX core_searchdocument_ft ON core_searchdocument")
+
+
+def build_documents(apps, schema_editor):
+    """
+    Tạo SearchDocument cho dữ liệu đã có. Bản sao cố định của core.search.rebuild()
+    tại thời điểm này; migration không import code đang chạy vì nó sẽ đổi.
+    """
+    Message = apps.get_model('core', 'Message')
+    Order = apps.get_model('core', 'Order')
+    SearchDocument = apps.get_model('core', 'SearchDocument')
+    User = apps.get_model('core', 'User')
+    db = schema_editor.connection.alias
+    now = timezone.now()
+
+    def documents():
+        for order in Order.objects.using(db).only('order_id', 'description', 'admin_note').iterator(chunk_size=1000):
+            yield SearchDocument(
+                kind='order', object_id=order.pk, order_id=order.pk, title=order.order_id,
+                body='\n'.join(filter(None, [order.description, order.admin_note])), updated_at=now,
+            )
+        for message in Message.objects.using(db).only('order_id', 'content').iterator(chunk_size=1000):
+            yield SearchDocument(
+                kind='message', object_id=message.pk, order_id=message.order_id, title='',
+                body=message.content, updated_at=now,
+            )
+        customers = User.objects.using(db).filter(user_type='customer').only(
+            'username', 'email', 'phone', 'first_name', 'last_name',
+        )
+        for user in customers.iterator(chunk_size=1000):
+            yield SearchDocument(
+                kind='customer', object_id=user.pk, order_id=None, title=user.username,
+                body=' '.join(filter(None, [
+                    f"{user.first_name} {user.last_name}".strip(), user.email, user.phone,
+                ])),
+                updated_at=now,
+            )
+
+    batch = []
+    for document in documents():
+        batch.append(document)
+        if len(batch) >= 1000:
+            SearchDocument.objects.using(db).bulk_create(batch)
+            batch = []
+    SearchDocument.objects.using(db).bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('order', 'Đơn hàng'), ('message', 'Tin nhắn'), ('customer', 'Khách hàng')], max_length=10)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('title', models.CharField(max_length=255)),
+                ('body', models.TextField(blank=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.order')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'), name='unique_search_document')],
+            },
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+        migrations.RunPython(build_documents, migrations.RunPython.noop),
+    ]
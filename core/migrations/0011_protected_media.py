@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-17 17:58
+
+import core.media
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_search_document'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='message',
+            name='image',
+            field=models.ImageField(blank=True, db_index=True, storage=core.media.ProtectedMediaStorage(), upload_to='messages/'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='brief_file',
+            field=models.FileField(blank=True, db_index=True, help_text='File brief/reference', storage=core.media.ProtectedMediaStorage(), upload_to='briefs/'),
+        ),
+        migrations.AlterField(
+            model_name='orderprogress',
+            name='image',
+            field=models.ImageField(db_index=True, help_text='Ảnh tiến độ', storage=core.media.ProtectedMediaStorage(), upload_to='progress/'),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='proof_image',
+            field=models.ImageField(db_index=True, help_text='Ảnh chứng từ', storage=core.media.ProtectedMediaStorage(), upload_to='payments/'),
+        ),
+    ]
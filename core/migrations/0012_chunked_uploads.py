@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:00
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_protected_media'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Upload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('purpose', models.CharField(choices=[('brief', 'File brief'), ('progress', 'Ảnh tiến độ')], max_length=10)),
+                ('filename', models.CharField(max_length=255)),
+                ('size', models.PositiveBigIntegerField(help_text='Tổng số byte khách báo trước')),
+                ('offset', models.PositiveBigIntegerField(default=0, help_text='Số byte đã nhận')),
+                ('chunk_checksums', models.JSONField(blank=True, default=list)),
+                ('sha256', models.CharField(blank=True, help_text='Checksum cả file, tính khi nhận đủ', max_length=64)),
+                ('status', models.CharField(choices=[('uploading', 'Đang upload'), ('complete', 'Đã nhận đủ'), ('attached', 'Đã gắn vào đơn')], default='uploading', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='uploads', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'updated_at'], name='upload_status_updated_idx')],
+            },
+        ),
+    ]
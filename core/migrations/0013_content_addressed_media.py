@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:04
+
+import core.media
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_chunked_uploads'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sample',
+            name='image',
+            field=models.ImageField(storage=core.media.ContentAddressedStorage(), upload_to='samples/'),
+        ),
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='cas/ab/cd/<sha256>.<đuôi>', max_length=100, unique=True)),
+                ('size', models.PositiveBigIntegerField()),
+                ('refcount', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now, help_text='Lần cuối refcount thay đổi')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['refcount', 'updated_at'], name='blob_refcount_updated_idx')],
+            },
+        ),
+    ]
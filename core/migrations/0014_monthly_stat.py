@@ -0,0 +1,48 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:12
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_content_addressed_media'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.DateField(help_text='Ngày đầu tháng')),
+                ('orders_created', models.PositiveIntegerField(default=0)),
+                ('orders_approved', models.PositiveIntegerField(default=0)),
+                ('orders_completed', models.PositiveIntegerField(default=0)),
+                ('payments_verified', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=0, default=0, help_text='Tổng thanh toán đã xác thực trong tháng', max_digits=14)),
+                ('turnaround_count', models.PositiveIntegerField(default=0)),
+                ('turnaround_avg_hours', models.FloatField(blank=True, null=True)),
+                ('turnaround_p50_hours', models.FloatField(blank=True, null=True)),
+                ('turnaround_p90_hours', models.FloatField(blank=True, null=True)),
+                ('refreshed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['period'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['updated_at'], name='order_updated_idx'),
+        ),
+        migrations.AddField(
+            model_name='monthlystat',
+            name='service_type',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.servicetype'),
+        ),
+        migrations.AddIndex(
+            model_name='monthlystat',
+            index=models.Index(fields=['period', 'service_type'], name='monthly_stat_period_idx'),
+        ),
+    ]
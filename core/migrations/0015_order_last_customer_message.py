@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:46
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+
+
+def fill_last_customer_message(apps, schema_editor):
+    Message = apps.get_model('core', 'Message')
+    Order = apps.get_model('core', 'Order')
+    db = schema_editor.connection.alias
+    latest = Message.objects.using(db).filter(order=OuterRef('pk'), sender_type='customer').order_by().values(
+        'order'
+    ).annotate(last_id=Max('id')).values('last_id')
+    Order.objects.using(db).update(last_customer_message_id=Subquery(latest))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_monthly_stat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='last_customer_message_id',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(fill_last_customer_message, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['last_customer_message_id'], name='order_last_customer_msg_idx'),
+        ),
+    ]
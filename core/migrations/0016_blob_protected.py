@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_order_last_customer_message'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blob',
+            name='protected',
+            field=models.BooleanField(default=False, help_text='Nằm ở PROTECTED_MEDIA_ROOT'),
+        ),
+        migrations.AlterField(
+            model_name='blob',
+            name='name',
+            field=models.CharField(help_text='cas/ab/cd/<sha256>.<đuôi>', max_length=100),
+        ),
+        migrations.AddConstraint(
+            model_name='blob',
+            constraint=models.UniqueConstraint(fields=('protected', 'name'), name='blob_storage_name_uniq'),
+        ),
+    ]
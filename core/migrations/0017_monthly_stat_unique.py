@@ -0,0 +1,41 @@
+# Generated by Django 5.2.6 on 2026-10-17 19:07
+
+from django.db import migrations, models
+
+
+def delete_duplicate_stats(apps, schema_editor):
+    """Hai lần làm mới chạy song song có thể đã ghi trùng: giữ dòng mới nhất của mỗi (tháng, dịch vụ)"""
+    MonthlyStat = apps.get_model('core', 'MonthlyStat')
+    db = schema_editor.connection.alias
+    seen = set()
+    duplicates = []
+    for pk, period, service_type_id in MonthlyStat.objects.using(db).order_by('-refreshed_at', '-pk').values_list(
+        'pk', 'period', 'service_type_id'
+    ):
+        if (period, service_type_id) in seen:
+            duplicates.append(pk)
+        seen.add((period, service_type_id))
+    MonthlyStat.objects.using(db).filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_blob_protected'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_stats, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='monthlystat',
+            name='monthly_stat_period_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='monthlystat',
+            constraint=models.UniqueConstraint(fields=('period', 'service_type'), name='monthly_stat_period_service_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='monthlystat',
+            constraint=models.UniqueConstraint(condition=models.Q(('service_type', None)), fields=('period',), name='monthly_stat_period_total_uniq'),
+        ),
+    ]
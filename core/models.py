@@ -1,8 +1,11 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Q
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 import uuid
 
+from .media import ContentAddressedStorage, ProtectedMediaStorage
+
 class User(AbstractUser):
     """Mở rộng User model để phân quyền"""
     USER_TYPE_CHOICES = (
@@ -47,13 +50,44 @@ class Sample(models.Model):
     """Mẫu tranh của artist"""
     service_type = models.ForeignKey(ServiceType, on_delete=models.CASCADE, related_name='samples')
     title = models.CharField(max_length=200)
-    image = models.ImageField(upload_to='samples/')
+    image = models.ImageField(upload_to='samples/', storage=ContentAddressedStorage())
     description = models.TextField(blank=True)
     display_order = models.IntegerField(default=0, help_text="Thứ tự hiển thị")
+    derivatives = models.JSONField(default=dict, blank=True, editable=False, help_text="Các bản WebP/AVIF đã tạo")
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['display_order', '-created_at']
+        indexes = [
+            # Phục vụ keyset pagination ở trang chủ: ORDER BY display_order, -id
+            models.Index(fields=['display_order', '-id'], name='sample_gallery_idx'),
+            models.Index(fields=['service_type', 'display_order', '-id'], name='sample_service_gallery_idx'),
+        ]
+    
+    def build_derivatives(self):
+        """Tạo lại các bản ảnh nhỏ (srcset) từ ảnh gốc"""
+        from .images import derivative_base, generate_derivatives
+        
+        self.delete_derivatives()
+        self.derivatives = generate_derivatives(self.image, derivative_base(self))
+        Sample.objects.filter(pk=self.pk).update(derivatives=self.derivatives)
+        
+        # update() không phát signal post_save nên phải tự làm mới cache trang chủ
+        from .cache import bump_generation_on_commit
+        bump_generation_on_commit()
+    
+    def delete_derivatives(self):
+        """
+        Xoá các bản ảnh nhỏ của sample này. Bản cũ (tên chưa có id sample) dùng
+        chung với các sample cùng ảnh gốc nên chỉ xoá khi không còn sample nào khác dùng
+        """
+        from .images import delete_derivatives
+        
+        if not self.derivatives:
+            return
+        if 'base' not in self.derivatives and Sample.objects.filter(image=self.image.name).exclude(pk=self.pk).exists():
+            return
+        delete_derivatives(self.image, self.derivatives)
     
     def __str__(self):
         return f"{self.title} ({self.service_type.name})"
@@ -77,6 +111,43 @@ class TermsOfService(models.Model):
         return f"TOS {self.version}"
 
 
+ORDER_ID_MAX_RETRIES = 5
+
+
+class OrderSequence(models.Model):
+    """Bộ đếm số thứ tự đơn hàng theo ngày, dùng để cấp OrderID"""
+    day = models.DateField(unique=True)
+    last_value = models.PositiveIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.day:%Y%m%d}: {self.last_value}"
+    
+    @classmethod
+    def next_value(cls, day=None):
+        """
+        Tăng và trả về số thứ tự tiếp theo của ngày `day`.
+        Phải gọi trong transaction: UPDATE giữ khóa dòng đến khi commit,
+        nên hai request đồng thời không bao giờ nhận cùng một số.
+        """
+        day = day or timezone.localdate()
+        sequence = cls.objects.filter(day=day)
+        if not sequence.update(last_value=F('last_value') + 1):
+            try:
+                with transaction.atomic():
+                    # Ngày đầu tiên dùng bảng này có thể đã có đơn tạo theo cách cũ
+                    existing = Order.objects.filter(order_id__startswith=f"DH-{day:%Y%m%d}-").count()
+                    cls.objects.create(day=day, last_value=existing + 1)
+            except IntegrityError:
+                # Request khác vừa tạo dòng cho ngày này
+                sequence.update(last_value=F('last_value') + 1)
+        return sequence.values_list('last_value', flat=True).get()
+    
+    @classmethod
+    def next_order_id(cls):
+        day = timezone.localdate()
+        return f"DH-{day:%Y%m%d}-{cls.next_value(day):05d}"
+
+
 class Order(models.Model):
     """Đơn hàng commission"""
     STATUS_CHOICES = (
@@ -94,7 +165,7 @@ class Order(models.Model):
     
     # Thông tin yêu cầu
     description = models.TextField(help_text="Mô tả chi tiết yêu cầu")
-    brief_file = models.FileField(upload_to='briefs/', blank=True, help_text="File brief/reference")
+    brief_file = models.FileField(upload_to='briefs/', storage=ProtectedMediaStorage(), db_index=True, blank=True, help_text="File brief/reference")
     
     # Trạng thái và giá
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
@@ -109,18 +180,40 @@ class Order(models.Model):
     # Ghi chú của admin
     admin_note = models.TextField(blank=True)
     
+    # Id tin nhắn mới nhất của khách (signal cập nhật): hộp thư của artist lọc
+    # last_customer_message_id > cursor đã đọc thay vì đếm tin của mọi đơn
+    last_customer_message_id = models.BigIntegerField(null=True, blank=True, editable=False)
+    
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Hộp thư artist: đơn có tin khách mới nhất lên đầu
+            models.Index(fields=['last_customer_message_id'], name='order_last_customer_msg_idx'),
+            # Danh sách đơn của artist: lọc theo trạng thái / khách, sắp xếp theo ngày tạo
+            models.Index(fields=['status', 'created_at'], name='order_status_created_idx'),
+            models.Index(fields=['customer', 'created_at'], name='order_customer_created_idx'),
+            # Báo cáo (core/analytics.py): đơn có thay đổi trong kỳ đang làm mới
+            models.Index(fields=['updated_at'], name='order_updated_idx'),
+        ]
     
     def save(self, *args, **kwargs):
-        if not self.order_id:
-            # Tạo OrderID: DH-YYYYMMDD-XXXXX
-            today = timezone.now().strftime('%Y%m%d')
-            count = Order.objects.filter(
-                created_at__date=timezone.now().date()
-            ).count() + 1
-            self.order_id = f"DH-{today}-{count:05d}"
-        super().save(*args, **kwargs)
+        if self.order_id:
+            return super().save(*args, **kwargs)
+        
+        # Tạo OrderID: DH-YYYYMMDD-XXXXX, số thứ tự lấy từ OrderSequence
+        # trong cùng transaction với lệnh INSERT
+        with transaction.atomic():
+            for attempt in range(ORDER_ID_MAX_RETRIES):
+                self.order_id = OrderSequence.next_order_id()
+                try:
+                    with transaction.atomic():
+                        return super().save(*args, **kwargs)
+                except IntegrityError:
+                    # Trùng với mã đã tồn tại (VD tạo thủ công) -> lấy số tiếp theo
+                    conflict = Order.objects.filter(order_id=self.order_id).exists()
+                    self.order_id = ''
+                    if not conflict or attempt == ORDER_ID_MAX_RETRIES - 1:
+                        raise
     
     def get_short_order_id(self):
         """Trả về mã ngắn để chuyển khoản: DH00023"""
@@ -136,7 +229,7 @@ class Order(models.Model):
 class OrderProgress(models.Model):
     """Cập nhật tiến độ đơn hàng"""
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='progress_updates')
-    image = models.ImageField(upload_to='progress/', help_text="Ảnh tiến độ")
+    image = models.ImageField(upload_to='progress/', storage=ProtectedMediaStorage(), db_index=True, help_text="Ảnh tiến độ")
     note = models.TextField(blank=True, help_text="Ghi chú về tiến độ")
     is_final = models.BooleanField(default=False, help_text="Đánh dấu là bản hoàn thiện cuối cùng")
     created_at = models.DateTimeField(auto_now_add=True)
@@ -160,7 +253,7 @@ class Payment(models.Model):
     order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name='payment')
     amount = models.DecimalField(max_digits=10, decimal_places=0, help_text="Số tiền đã chuyển")
     transaction_id = models.CharField(max_length=100, blank=True, help_text="Mã giao dịch")
-    proof_image = models.ImageField(upload_to='payments/', help_text="Ảnh chứng từ")
+    proof_image = models.ImageField(upload_to='payments/', storage=ProtectedMediaStorage(), db_index=True, help_text="Ảnh chứng từ")
     
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     
@@ -169,6 +262,11 @@ class Payment(models.Model):
     verified_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     admin_note = models.TextField(blank=True, help_text="Ghi chú của admin")
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='payment_status_created_idx'),
+        ]
+    
     def __str__(self):
         return f"Payment {self.order.order_id} - {self.amount:,.0f}đ"
 
@@ -178,12 +276,265 @@ class Message(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='messages')
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     content = models.TextField()
-    image = models.ImageField(upload_to='messages/', blank=True)
-    is_read = models.BooleanField(default=False)
+    image = models.ImageField(upload_to='messages/', storage=ProtectedMediaStorage(), db_index=True, blank=True)
+    # Sao chép từ sender.user_type để đếm tin chưa đọc không cần JOIN bảng User
+    sender_type = models.CharField(max_length=10, choices=User.USER_TYPE_CHOICES, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # Đếm tin chưa đọc: WHERE order_id = ? AND sender_type = ? AND id > cursor
+            models.Index(fields=['order', 'sender_type', 'id'], name='message_unread_idx'),
+            # order.messages theo thứ tự mặc định (created_at)
+            models.Index(fields=['order', 'created_at'], name='message_order_created_idx'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        if not self.sender_type:
+            self.sender_type = self.sender.user_type
+        super().save(*args, **kwargs)
+    
+    def __str__(self):
+        return f"{self.sender.username} - {self.created_at.strftime('%d/%m/%Y %H:%M')}"
+
+
+class ReadCursor(models.Model):
+    """
+    Vị trí đã đọc của một bên (khách hàng / artist) trong cuộc trò chuyện của đơn hàng.
+    Tin nhắn của bên kia có id > last_read_id được coi là chưa đọc.
+    """
+    PARTICIPANT_CHOICES = User.USER_TYPE_CHOICES
+    
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='read_cursors')
+    participant = models.CharField(max_length=10, choices=PARTICIPANT_CHOICES)
+    last_read_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'participant'], name='unique_read_cursor'),
+        ]
+    
+    def __str__(self):
+        return f"{self.order_id} {self.participant} -> {self.last_read_id}"
+    
+    @staticmethod
+    def other_side(participant):
+        return 'customer' if participant == 'artist' else 'artist'
+    
+    @classmethod
+    def mark_read(cls, order, participant, last_message_id):
+        """
+        Đánh dấu đã đọc đến tin `last_message_id`; cursor không bao giờ lùi lại.
+        Dòng cursor bị khoá (SELECT ... FOR UPDATE; SQLite đã khoá ghi từ đầu
+        transaction) nên hai tab mở cùng lúc không trừ bộ đếm hai lần.
+        Trả về số tin vừa được đọc.
+        """
+        from . import counters
+        
+        with transaction.atomic():
+            cursor = cls.objects.select_for_update().filter(order=order, participant=participant)
+            previous = cursor.values_list('last_read_id', flat=True).first()
+            created = False
+            if previous is None:
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(order=order, participant=participant, last_read_id=last_message_id)
+                    previous, created = 0, True
+                except IntegrityError:
+                    # Request khác vừa tạo cursor: chờ khoá dòng đó rồi đọc lại
+                    previous = cursor.values_list('last_read_id', flat=True).get()
+            if not created:
+                if last_message_id <= previous:
+                    return 0
+                # Điều kiện last_read_id = previous: chỉ trừ bộ đếm theo dòng thực sự đổi
+                if not cursor.filter(last_read_id=previous).update(
+                    last_read_id=last_message_id, updated_at=timezone.now()
+                ):
+                    return 0
+            
+            sender_type = cls.other_side(participant)
+            read_count = order.messages.filter(
+                sender_type=sender_type, id__gt=previous, id__lte=last_message_id
+            ).count()
+            counters.messages_marked_read(read_count, sender_type, order.customer_id)
+        return read_count
+
+
+class Job(models.Model):
+    """Công việc nền (xử lý ảnh, thông báo...) chạy bởi `manage.py run_jobs`"""
+    STATUS_CHOICES = (
+        ('queued', 'Đang chờ'),
+        ('running', 'Đang chạy'),
+        ('done', 'Hoàn thành'),
+        ('failed', 'Thất bại'),
+    )
+    
+    name = models.CharField(max_length=100, help_text="Tên task đã đăng ký trong core/tasks.py")
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    owner = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now, help_text="Không chạy trước thời điểm này")
+    locked_until = models.DateTimeField(null=True, blank=True, help_text="Hết hạn visibility timeout")
+    locked_by = models.CharField(max_length=100, blank=True)
+    
+    result = models.JSONField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Job #{self.pk} {self.name} ({self.status})"
+
+
+class DashboardCounter(models.Model):
+    """
+    Bộ đếm dựng sẵn cho dashboard, được cập nhật bởi signal (core/counters.py)
+    key: 'global:orders_pending', 'customer:12:orders_completed', ...
+    """
+    key = models.CharField(max_length=100, unique=True)
+    value = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.key} = {self.value}"
+
+
+class SearchDocument(models.Model):
+    """
+    Văn bản dùng cho tìm kiếm toàn văn (core/search.py), mỗi đơn hàng / tin nhắn /
+    khách hàng một dòng. Được đồng bộ bởi signal; chỉ mục FTS5 (SQLite) hoặc
+    FULLTEXT (MySQL) tạo trong migration và bám theo bảng này.
+    """
+    KIND_CHOICES = (
+        ('order', 'Đơn hàng'),
+        ('message', 'Tin nhắn'),
+        ('customer', 'Khách hàng'),
+    )
+    
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    # Đơn hàng liên quan (để mở trang chi tiết); None với khách hàng
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    title = models.CharField(max_length=255)
+    body = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_search_document'),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind}:{self.object_id} {self.title}"
+
+
+class Upload(models.Model):
+    """
+    Một lần upload chia nhỏ, có thể tiếp tục (core/uploads.py).
+    Các chunk được ghi nối vào file tạm trong UPLOAD_TEMP_DIR; đủ `size` byte
+    thì file được chuyển vào storage của field đích khi form được lưu.
+    """
+    PURPOSE_CHOICES = (
+        ('brief', 'File brief'),
+        ('progress', 'Ảnh tiến độ'),
+    )
+    STATUS_CHOICES = (
+        ('uploading', 'Đang upload'),
+        ('complete', 'Đã nhận đủ'),
+        ('attached', 'Đã gắn vào đơn'),
+    )
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='uploads')
+    purpose = models.CharField(max_length=10, choices=PURPOSE_CHOICES)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField(help_text="Tổng số byte khách báo trước")
+    offset = models.PositiveBigIntegerField(default=0, help_text="Số byte đã nhận")
+    # SHA-256 (hex) của từng chunk theo thứ tự, để đối chiếu khi client gửi lại
+    chunk_checksums = models.JSONField(default=list, blank=True)
+    sha256 = models.CharField(max_length=64, blank=True, help_text="Checksum cả file, tính khi nhận đủ")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='uploading')
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'updated_at'], name='upload_status_updated_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size})"
+
+
+class Blob(models.Model):
+    """
+    Một nội dung file duy nhất trong cas/ (core/media.py), dùng chung bởi mọi
+    FileField trỏ tới `name`. refcount = số bản ghi đang tham chiếu.
+    Blob của ProtectedMediaStorage (protected) nằm ở PROTECTED_MEDIA_ROOT và
+    tách riêng với blob công khai cùng tên.
+    """
+    protected = models.BooleanField(default=False, help_text="Nằm ở PROTECTED_MEDIA_ROOT")
+    name = models.CharField(max_length=100, help_text="cas/ab/cd/<sha256>.<đuôi>")
+    size = models.PositiveBigIntegerField()
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(default=timezone.now, help_text="Lần cuối refcount thay đổi")
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['protected', 'name'], name='blob_storage_name_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['refcount', 'updated_at'], name='blob_refcount_updated_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} x{self.refcount}"
+
+
+class MonthlyStat(models.Model):
+    """
+    Số liệu báo cáo theo tháng (core/analytics.py), mỗi tháng một dòng cho từng
+    loại dịch vụ và một dòng tổng (service_type rỗng). Dựng lại từ Order/Payment,
+    chỉ tháng hiện tại được làm mới định kỳ.
+    """
+    period = models.DateField(help_text="Ngày đầu tháng")
+    service_type = models.ForeignKey(ServiceType, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    
+    orders_created = models.PositiveIntegerField(default=0)
+    orders_approved = models.PositiveIntegerField(default=0)
+    orders_completed = models.PositiveIntegerField(default=0)
+    payments_verified = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=0, default=0, help_text="Tổng thanh toán đã xác thực trong tháng")
+    
+    # Thời gian từ lúc duyệt tới lúc hoàn thành của các đơn hoàn thành trong tháng (giờ)
+    turnaround_count = models.PositiveIntegerField(default=0)
+    turnaround_avg_hours = models.FloatField(null=True, blank=True)
+    turnaround_p50_hours = models.FloatField(null=True, blank=True)
+    turnaround_p90_hours = models.FloatField(null=True, blank=True)
+    
+    refreshed_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        ordering = ['period']
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'service_type'], name='monthly_stat_period_service_uniq'),
+            # NULL không trùng nhau trong UNIQUE nên dòng tổng cần ràng buộc riêng
+            models.UniqueConstraint(fields=['period'], condition=Q(service_type=None), name='monthly_stat_period_total_uniq'),
+        ]
     
     def __str__(self):
-        return f"{self.sender.username} - {self.created_at.strftime('%d/%m/%Y %H:%M')}"
\ No newline at end of file
+        return f"{self.period:%m/%Y} {self.service_type or 'Tổng'}"
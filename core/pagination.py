@@ -0,0 +1,174 @@
+"""
+Phân trang keyset (cursor) thay cho OFFSET
+
+Thay vì `LIMIT 12 OFFSET 1200`, mỗi trang bắt đầu ngay sau bản ghi cuối của
+trang trước: `WHERE (display_order, id) > (...)`. Chi phí mỗi trang là như nhau
+dù ở trang 1 hay trang 1000, và không cần COUNT(*).
+"""
+
+import base64
+import binascii
+import datetime
+import json
+from decimal import Decimal
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from django.db.models.constants import LOOKUP_SEP
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values, direction):
+    raw = json.dumps({'v': values, 'd': direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Trả về (values, direction), ném InvalidCursor nếu cursor bị sửa/hỏng"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        data = json.loads(raw)
+        values, direction = data['v'], data['d']
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise InvalidCursor(cursor)
+    if direction not in ('next', 'prev') or not isinstance(values, list):
+        raise InvalidCursor(cursor)
+    return values, direction
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    Phân trang theo các cột `ordering` (phải duy nhất khi ghép lại, VD có id ở cuối).
+    Giá trị các cột là số, chuỗi, datetime/date hoặc Decimal (hai loại sau được
+    lưu dạng chuỗi trong cursor, to_python() của field chuyển lại khi đọc).
+    Cột không được NULL. Cursor bị sửa (sai kiểu, NULL...) được coi như trang đầu.
+
+        paginator = KeysetPaginator(Sample.objects.all(), 12, ('display_order', '-id'))
+        page = paginator.page(request.GET.get('cursor'))
+    """
+
+    def __init__(self, queryset, per_page, ordering):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = [
+            (field.lstrip('-'), field.startswith('-')) for field in ordering
+        ]
+
+    def _model_field(self, path):
+        model, field = self.queryset.model, None
+        for name in path.split(LOOKUP_SEP):
+            field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+            model = field.related_model or model
+        return field
+
+    def _clean(self, values):
+        """
+        Chuyển giá trị trong cursor về đúng kiểu của từng cột; trả về None nếu
+        cursor bị sửa (sai kiểu, NULL, vượt phạm vi) để view không lỗi 500
+        """
+        if len(values) != len(self.ordering):
+            return None
+        cleaned = []
+        for (path, _), value in zip(self.ordering, values):
+            if value is None or isinstance(value, (list, dict)):
+                return None
+            try:
+                field = self._model_field(path)
+                value = field.to_python(value)
+                if value is None:
+                    return None
+                field.run_validators(value)
+            except (FieldDoesNotExist, ValidationError, TypeError, ValueError, OverflowError):
+                return None
+            cleaned.append(value)
+        return cleaned
+
+    def _order_by(self, reverse):
+        return [
+            f"{'-' if descending != reverse else ''}{field}"
+            for field, descending in self.ordering
+        ]
+
+    def _after(self, values, reverse):
+        """Điều kiện lấy các bản ghi nằm sau `values` theo thứ tự (hoặc trước nếu reverse)"""
+        condition = Q()
+        for i, (field, descending) in enumerate(self.ordering):
+            lookup = 'lt' if descending != reverse else 'gt'
+            clause = Q(**{f"{field}__{lookup}": values[i]})
+            for j, (prev_field, _) in enumerate(self.ordering[:i]):
+                clause &= Q(**{prev_field: values[j]})
+            condition |= clause
+        return condition
+
+    def _values(self, obj):
+        values = []
+        for field, _ in self.ordering:
+            value = getattr(obj, field)
+            if isinstance(value, (datetime.date, Decimal)):
+                value = value.isoformat() if isinstance(value, datetime.date) else str(value)
+            values.append(value)
+        return values
+
+    def page(self, cursor=None):
+        """Trả về KeysetPage; cursor không hợp lệ được coi như trang đầu"""
+        values, direction = None, 'next'
+        if cursor:
+            try:
+                values, direction = decode_cursor(cursor)
+            except InvalidCursor:
+                values = None
+            if values is not None:
+                values = self._clean(values)
+            if values is None:
+                direction = 'next'
+
+        reverse = direction == 'prev'
+        queryset = self.queryset.order_by(*self._order_by(reverse))
+        if values is not None:
+            queryset = queryset.filter(self._after(values, reverse))
+
+        # Lấy dư 1 bản ghi để biết còn trang tiếp theo hay không
+        items = list(queryset[:self.per_page + 1])
+        has_more = len(items) > self.per_page
+        items = items[:self.per_page]
+        if reverse:
+            items.reverse()
+
+        if not items:
+            return KeysetPage([], None, None)
+
+        if reverse:
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+
+        return KeysetPage(
+            items,
+            encode_cursor(self._values(items[-1]), 'next') if has_next else None,
+            encode_cursor(self._values(items[0]), 'prev') if has_previous else None,
+        )
@@ -0,0 +1,223 @@
+"""
+Ngân sách query cho từng view và phát hiện N+1
+
+QueryRecorder gắn execute_wrapper vào mọi database (kể cả 'replica') và ghi lại
+từng câu SQL của request: thời gian chạy, "dạng" câu lệnh (bỏ giá trị cụ thể,
+gộp danh sách IN) và dòng code trong project đã gọi nó. Một dạng lặp lại từ
+QUERY_REPEAT_THRESHOLD lần trở lên trong cùng request gần như chắc chắn là N+1
+(query trong vòng lặp, template gọi .count / FK trong {% for %}, __str__ đi theo FK).
+
+Ngân sách khai báo theo tên URL trong settings.QUERY_BUDGETS; URL không khai
+báo dùng QUERY_BUDGET_DEFAULT (None = không giới hạn).
+
+- QueryBudgetMiddleware (bật khi QUERY_BUDGET_ENABLED, mặc định theo DEBUG):
+  ghi log cảnh báo 'core.querybudget', hoặc raise QueryBudgetExceeded nếu
+  QUERY_BUDGET_STRICT. Response dạng stream được đếm đến khi gửi xong.
+- Trong test:
+
+      with query_budget('artist_orders'):
+          self.client.get(reverse('artist_orders'))
+
+  raise QueryBudgetExceeded (là AssertionError) kèm danh sách query lặp lại.
+"""
+
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REPEAT_THRESHOLD = 5
+
+# Số dạng query lặp lại / số query liệt kê trong báo cáo
+REPORT_LIMIT = 10
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?|\d+)\s*,?)+\)', re.IGNORECASE)
+_SPACE_RE = re.compile(r'\s+')
+
+_PROJECT_DIR = str(Path(__file__).resolve().parent.parent)
+_THIS_FILE = str(Path(__file__).resolve())
+# Chỉ code trong các package của project (không tính manage.py)
+_PROJECT_PACKAGES = tuple(
+    str(path) + os.sep for path in Path(_PROJECT_DIR).iterdir() if (path / '__init__.py').exists()
+)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """View vượt ngân sách query hoặc có query lặp lại (N+1)"""
+
+
+def query_shape(sql):
+    """Câu SQL bỏ giá trị cụ thể: hai query chỉ khác tham số có cùng dạng"""
+    sql = _STRING_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+def _origin():
+    """
+    file:dòng gần nhất gây ra query: code của project (bỏ qua __call__ của
+    middleware) hoặc thẻ template đang render
+    """
+    frame = sys._getframe(2)
+    while frame is not None:
+        code = frame.f_code
+        if code.co_name == 'render_annotated':
+            node = frame.f_locals.get('self')
+            origin, token = getattr(node, 'origin', None), getattr(node, 'token', None)
+            if origin is not None and token is not None:
+                return f"{origin.template_name}:{token.lineno}"
+        elif (code.co_filename.startswith(_PROJECT_PACKAGES) and code.co_filename != _THIS_FILE
+              and code.co_name != '__call__' and 'site-packages' not in code.co_filename):
+            return f"{Path(code.co_filename).relative_to(_PROJECT_DIR)}:{frame.f_lineno}"
+        frame = frame.f_back
+    return ''
+
+
+class QueryRecorder:
+    """Ghi mọi query chạy trên mọi database trong các khối `with recorder.recording()`"""
+
+    def __init__(self, track_origin=True):
+        self.queries = []
+        self.track_origin = track_origin
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'alias': context['connection'].alias,
+                'sql': sql,
+                'time': time.perf_counter() - started,
+                'origin': _origin() if self.track_origin else '',
+            })
+
+    @contextmanager
+    def recording(self):
+        # execute_wrapper gắn vào connection của thread hiện tại; có thể vào lại nhiều lần
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(self))
+            yield self
+
+    def __len__(self):
+        return len(self.queries)
+
+    @property
+    def total_time(self):
+        return sum(query['time'] for query in self.queries)
+
+    def repeated(self, threshold=None):
+        """[(dạng query, số lần, các dòng code gọi)] của dạng lặp lại >= threshold lần"""
+        threshold = threshold or repeat_threshold()
+        counts = Counter(query_shape(query['sql']) for query in self.queries)
+        origins = {}
+        for query in self.queries:
+            shape = query_shape(query['sql'])
+            if counts[shape] >= threshold and query['origin']:
+                origins.setdefault(shape, Counter())[query['origin']] += 1
+        return [
+            (shape, count, [origin for origin, _ in origins.get(shape, Counter()).most_common(3)])
+            for shape, count in counts.most_common() if count >= threshold
+        ]
+
+
+# ============= NGÂN SÁCH =============
+
+def budget_for(url_name):
+    budgets = getattr(settings, 'QUERY_BUDGETS', {})
+    if url_name in budgets:
+        return budgets[url_name]
+    return getattr(settings, 'QUERY_BUDGET_DEFAULT', None)
+
+
+def repeat_threshold():
+    return getattr(settings, 'QUERY_REPEAT_THRESHOLD', DEFAULT_REPEAT_THRESHOLD)
+
+
+def problems(recorder, budget=None, threshold=None):
+    """Các vi phạm của 1 request: vượt ngân sách và các dạng query lặp lại"""
+    found = []
+    if budget is not None and len(recorder) > budget:
+        found.append(f"{len(recorder)} query, ngân sách {budget}")
+    for shape, count, origins in recorder.repeated(threshold)[:REPORT_LIMIT]:
+        where = f" tại {', '.join(origins)}" if origins else ''
+        found.append(f"lặp {count} lần{where}: {shape[:300]}")
+    return found
+
+
+def report(label, recorder, found):
+    lines = [f"{label}: {len(recorder)} query ({recorder.total_time * 1000:.1f}ms)"]
+    lines += [f"  - {problem}" for problem in found]
+    return '\n'.join(lines)
+
+
+@contextmanager
+def query_budget(url_name=None, budget=None, threshold=None):
+    """
+    Dùng trong test: raise QueryBudgetExceeded nếu các query trong khối vượt
+    `budget` (mặc định: ngân sách của `url_name` trong QUERY_BUDGETS) hoặc có
+    dạng query lặp lại từ `threshold` lần.
+    """
+    if budget is None and url_name is not None:
+        budget = budget_for(url_name)
+    recorder = QueryRecorder()
+    with recorder.recording():
+        yield recorder
+    found = problems(recorder, budget, threshold)
+    if found:
+        raise QueryBudgetExceeded(report(url_name or 'query_budget', recorder, found))
+
+
+# ============= MIDDLEWARE =============
+
+class QueryBudgetMiddleware:
+    """Đếm query của từng request và báo khi vượt ngân sách theo tên URL hoặc có N+1"""
+
+    def __init__(self, get_response):
+        from django.core.exceptions import MiddlewareNotUsed
+
+        if not getattr(settings, 'QUERY_BUDGET_ENABLED', settings.DEBUG):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with recorder.recording():
+            response = self.get_response(request)
+        if response.streaming and not response.is_async:
+            response.streaming_content = self.stream(response.streaming_content, request, recorder)
+            return response
+        self.check(request, recorder)
+        return response
+
+    def stream(self, content, request, recorder):
+        # Export / file lớn chạy query trong lúc gửi: chỉ kiểm tra khi gửi xong
+        with recorder.recording():
+            yield from content
+        self.check(request, recorder)
+
+    def check(self, request, recorder):
+        match = request.resolver_match
+        url_name = match.url_name if match else None
+        if url_name is None:
+            return
+        found = problems(recorder, budget_for(url_name))
+        if not found:
+            return
+        message = report(f"{request.method} {request.path} ({url_name})", recorder, found)
+        if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
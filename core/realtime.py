@@ -0,0 +1,219 @@
+"""
+Đẩy sự kiện real-time (tin nhắn, tiến độ) tới trang chi tiết đơn hàng qua SSE
+
+Mỗi đơn hàng là một channel 'order:<id>'. View ghi dữ liệu gọi publish()
+sau khi transaction commit; view SSE (`order_events`) subscribe() và đẩy
+sự kiện xuống trình duyệt.
+
+Hub mặc định (InProcessHub) chỉ phân phối trong cùng một process, phù hợp
+khi chạy 1 process ASGI (uvicorn/daphne duyhoangsite.asgi:application).
+Chạy nhiều process thì thay bằng hub dùng broker (lớp con của BaseHub),
+khai báo trong settings:
+    REALTIME_HUB = 'myapp.hubs.RedisHub'
+"""
+
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HUB = 'core.realtime.InProcessHub'
+
+# Gửi comment giữ kết nối khi không có sự kiện (proxy hay cắt kết nối im lặng)
+HEARTBEAT_INTERVAL = 15
+
+# Số sự kiện tối đa chờ gửi cho một client chậm, vượt quá thì bỏ sự kiện cũ nhất
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class BaseHub:
+    """
+    Giao diện chung của hub: publish() gọi từ code sync, subscribe() dùng trong
+    async view. Hub dùng broker cài add()/remove() (bắt đầu / ngừng nhận sự kiện
+    của subscription.channel) và publish(); gửi sự kiện tới trình duyệt bằng
+    subscription.loop.call_soon_threadsafe(subscription.deliver, event).
+    """
+
+    def add(self, subscription):
+        raise NotImplementedError
+
+    def remove(self, subscription):
+        raise NotImplementedError
+
+    def publish(self, channel, event):
+        raise NotImplementedError
+
+    def subscribe(self, channel):
+        """Trả về Subscription, dùng với `with hub.subscribe(channel) as sub: await sub.get(timeout)`"""
+        return Subscription(self, channel)
+
+
+class Subscription:
+    def __init__(self, hub, channel):
+        self.hub = hub
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def __enter__(self):
+        self.hub.add(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.hub.remove(self)
+
+    def deliver(self, event):
+        """Chạy trên event loop của subscriber"""
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout):
+        """Sự kiện tiếp theo, hoặc None nếu hết `timeout` giây"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class InProcessHub(BaseHub):
+    """Fan-out trong bộ nhớ, an toàn khi publish từ thread khác với event loop"""
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def add(self, subscription):
+        with self._lock:
+            self._subscribers[subscription.channel].add(subscription)
+
+    def remove(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # Event loop của client đã đóng
+                self.remove(subscription)
+
+
+@lru_cache(maxsize=None)
+def get_hub():
+    return import_string(getattr(settings, 'REALTIME_HUB', DEFAULT_HUB))()
+
+
+def streaming_supported(request):
+    """
+    SSE chỉ chạy được dưới ASGI. Dưới WSGI (runserver, gunicorn) Django gom hết
+    iterator async trước khi gửi: request không bao giờ trả về và giữ một worker
+    suốt lúc tab còn mở, nên trang chi tiết đơn chuyển sang poll feed JSON.
+    """
+    return isinstance(request, ASGIRequest)
+
+
+def order_channel(order_id):
+    return f"order:{order_id}"
+
+
+def publish_order_event(order_id, event):
+    try:
+        get_hub().publish(order_channel(order_id), event)
+    except Exception:
+        # Không để lỗi real-time làm hỏng request ghi dữ liệu
+        logger.exception("Không gửi được sự kiện real-time cho đơn %s", order_id)
+
+
+# ============= DỮ LIỆU SỰ KIỆN =============
+
+def message_event(message):
+    return {
+        'type': 'message',
+        'id': message.id,
+        'sender_type': message.sender_type,
+        'sender': message.sender.username,
+        'content': message.content,
+        'image': message.image.url if message.image else '',
+        'created_at': timezone.localtime(message.created_at).strftime('%d/%m/%Y %H:%M'),
+    }
+
+
+def progress_event(progress):
+    return {
+        'type': 'progress',
+        'id': progress.id,
+        'note': progress.note,
+        'image': progress.image.url if progress.image else '',
+        'is_final': progress.is_final,
+        'created_at': timezone.localtime(progress.created_at).strftime('%d/%m/%Y %H:%M'),
+    }
+
+
+def status_event(order):
+    """Trạng thái đơn / thanh toán vừa đổi: trang đơn hàng đang mở cần tải lại"""
+    return {
+        'type': 'status',
+        'status': order.status,
+        'status_display': order.get_status_display(),
+    }
+
+
+# ============= LUỒNG SSE =============
+
+def format_sse(event):
+    """Một sự kiện SSE; tin nhắn mang id để trình duyệt gửi lại qua Last-Event-ID"""
+    lines = []
+    if event['type'] == 'message':
+        lines.append(f"id: {event['id']}")
+    lines.append(f"event: {event['type']}")
+    lines.append(f"data: {json.dumps(event, ensure_ascii=False)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+async def order_event_stream(order_id, last_message_id=None):
+    """
+    Sinh các sự kiện SSE của đơn hàng. Subscribe trước rồi mới đọc bù tin nhắn
+    id > last_message_id, nên không lỡ tin nào giữa hai bước; tin trùng bị bỏ qua.
+    """
+    from .models import Message
+
+    with get_hub().subscribe(order_channel(order_id)) as subscription:
+        # Báo trình duyệt thời gian chờ trước khi kết nối lại
+        yield 'retry: 3000\n\n'
+
+        sent_id = last_message_id or 0
+        if last_message_id is not None:
+            missed = Message.objects.filter(
+                order_id=order_id, id__gt=last_message_id
+            ).select_related('sender').order_by('id')
+            async for message in missed:
+                sent_id = message.id
+                yield format_sse(message_event(message))
+
+        while True:
+            event = await subscription.get(HEARTBEAT_INTERVAL)
+            if event is None:
+                yield ': ping\n\n'
+                continue
+            if event['type'] == 'message':
+                if event['id'] <= sent_id:
+                    continue
+                sent_id = event['id']
+            yield format_sse(event)
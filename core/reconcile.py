@@ -0,0 +1,389 @@
+"""
+Đối soát sao kê ngân hàng với các thanh toán đang chờ xác thực
+
+Sao kê (CSV/Excel, vài chục nghìn dòng) được đọc bằng pandas; mã đơn trong nội
+dung chuyển khoản (DH00023 hoặc DH-20260101-00023) và số tiền được tách theo cột
+(vectorized), không lặp regex trong Python. Các thanh toán đang chờ được nạp
+1 lần (dùng payment_status_created_idx) vào dict (mã, số tiền) -> thanh toán,
+nên mỗi dòng sao kê chỉ tốn 1 lần tra dict.
+
+Mã ngắn DH00023 lặp lại mỗi ngày, nên một dòng chỉ được xác thực khi khớp đúng
+1 thanh toán (đơn phải được tạo trước ngày chuyển khoản); còn lại được báo để
+artist xử lý tay. Các thanh toán khớp được xác thực trong 1 transaction bằng
+bulk_update - signal không chạy nên những gì xác thực tay (views.verify_payment)
+làm qua signal được làm trực tiếp: bộ đếm dashboard được cộng trong transaction;
+sau commit, chỉ mục tìm kiếm của các đơn được ghi lại và trang đơn hàng đang mở
+nhận sự kiện 'status' (realtime.status_event).
+
+Dòng lệnh: python manage.py import_statement <file> --user <artist> [--dry-run]
+"""
+
+import csv
+import os
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from functools import partial
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import counters, search
+from .realtime import publish_order_event, status_event
+
+# Số dòng đầu file được dò để tìm dòng tiêu đề (sao kê thường có phần thông tin tài khoản ở trên)
+HEADER_SCAN_ROWS = 30
+
+# Tên cột (đã bỏ dấu, chữ thường) theo thứ tự ưu tiên; cột "ghi có" đứng trước "số tiền"
+# để sao kê tách riêng nợ / có chỉ lấy tiền vào
+STATEMENT_COLUMNS = {
+    'description': ('noi dung', 'dien giai', 'mo ta', 'description', 'content', 'details', 'remark', 'narrative'),
+    'amount': ('so tien ghi co', 'ghi co', 'phat sinh co', 'credit', 'so tien', 'amount'),
+    'date': ('ngay giao dich', 'ngay hieu luc', 'ngay', 'transaction date', 'value date', 'date'),
+    'reference': ('so tham chieu', 'ma giao dich', 'so but toan', 'reference', 'ref'),
+}
+REQUIRED_COLUMNS = ('description', 'amount')
+
+# DH00023, DH-00023, "dh 00023", DH-20260101-00023, DH2026010100023
+ORDER_CODE_RE = r'(?i)(?<![a-z0-9])DH[\s._-]*(?:(?P<day>\d{8})[\s._-]*)?(?P<seq>\d{5})(?!\d)'
+
+# Kết quả ghép của 1 dòng sao kê, theo thứ tự hiển thị
+RESULTS = (
+    ('matched', 'Khớp'),
+    ('already_verified', 'Đã được xác thực trước đó'),
+    ('ambiguous', 'Nhiều thanh toán cùng mã và số tiền'),
+    ('amount_mismatch', 'Đúng mã nhưng sai số tiền'),
+    ('duplicate', 'Chuyển khoản lặp lại'),
+    ('unmatched', 'Không tìm thấy mã đơn'),
+)
+
+# Số dòng mỗi loại hiển thị trên trang kết quả
+REPORT_LIMIT = 200
+
+BULK_BATCH_SIZE = 1000
+
+
+class StatementError(Exception):
+    """File sao kê không đọc được / thiếu cột"""
+
+
+def _normalize(text):
+    """'Số tiền ghi Có' -> 'so tien ghi co'"""
+    text = unicodedata.normalize('NFKD', str(text)).replace('đ', 'd').replace('Đ', 'D')
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', text.lower()).split())
+
+
+def find_columns(header):
+    """Vị trí các cột cần dùng trong 1 dòng tiêu đề; None nếu thiếu cột bắt buộc"""
+    names = [_normalize(cell) for cell in header]
+    columns = {}
+    for key, aliases in STATEMENT_COLUMNS.items():
+        for alias in aliases:
+            position = next(
+                (i for i, name in enumerate(names) if name and alias in name and i not in columns.values()),
+                None,
+            )
+            if position is not None:
+                columns[key] = position
+                break
+    if not all(key in columns for key in REQUIRED_COLUMNS):
+        return None
+    return columns
+
+
+def _find_header(rows):
+    for index, row in enumerate(rows[:HEADER_SCAN_ROWS]):
+        columns = find_columns(row)
+        if columns:
+            return index, columns
+    raise StatementError("Không tìm thấy dòng tiêu đề có cột nội dung và số tiền.")
+
+
+def _decode_sample(data):
+    """Đoán encoding từ phần đầu file: BOM UTF-16, UTF-8, rồi Windows-1258"""
+    if data[:2] in (b'\xff\xfe', b'\xfe\xff'):
+        return 'utf-16', data.decode('utf-16', errors='ignore')
+    for encoding in ('utf-8-sig', 'cp1258'):
+        try:
+            # Cắt giữa 1 ký tự nhiều byte ở cuối mẫu không tính là lỗi
+            return encoding, data.decode(encoding)
+        except UnicodeDecodeError as error:
+            if error.start >= len(data) - 3:
+                return encoding, data[:error.start].decode(encoding)
+    return 'latin-1', data.decode('latin-1')
+
+
+def _read_csv(f):
+    import pandas as pd
+
+    sample = f.read(64 * 1024)
+    encoding, text = _decode_sample(sample)
+    lines = text.splitlines()[:HEADER_SCAN_ROWS]
+    # Thử từng dấu phân cách, dấu nào cho ra dòng tiêu đề hợp lệ thì dùng
+    for delimiter in (',', ';', '\t', '|'):
+        try:
+            header_index, columns = _find_header(list(csv.reader(lines, delimiter=delimiter)))
+            break
+        except StatementError:
+            continue
+    else:
+        raise StatementError("Không tìm thấy dòng tiêu đề có cột nội dung và số tiền.")
+
+    f.seek(0)
+    frame = pd.read_csv(
+        f,
+        sep=delimiter,
+        encoding=encoding,
+        skiprows=header_index + 1,
+        header=None,
+        usecols=sorted(columns.values()),
+        dtype=str,
+        keep_default_na=False,
+        on_bad_lines='skip',
+    )
+    return frame, columns, header_index + 1
+
+
+def _read_excel(f):
+    import pandas as pd
+
+    try:
+        raw = pd.read_excel(f, header=None, dtype=str)
+    except ImportError:
+        raise StatementError("Server chưa cài openpyxl/xlrd nên chưa đọc được file Excel, hãy xuất sao kê dạng CSV.")
+    except ValueError as error:
+        raise StatementError(f"File Excel không hợp lệ: {error}")
+    raw = raw.fillna('')
+    head = raw.head(HEADER_SCAN_ROWS).values.tolist()
+    header_index, columns = _find_header(head)
+    return raw.iloc[header_index + 1:], columns, header_index + 1
+
+
+def read_statement(f, name):
+    """
+    Đọc sao kê -> DataFrame các dòng tiền vào có cột line, description,
+    amount (int), date, reference, day, seq. `line` là số dòng trong file (từ 1).
+    """
+    import pandas as pd
+
+    extension = os.path.splitext(name)[1].lower()
+    try:
+        if extension in ('.xlsx', '.xlsm', '.xls'):
+            frame, columns, first_line = _read_excel(f)
+        else:
+            frame, columns, first_line = _read_csv(f)
+    except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeError) as error:
+        raise StatementError(f"Không đọc được file sao kê: {error}")
+
+    data = pd.DataFrame({key: frame[position] for key, position in columns.items()})
+    data['line'] = range(first_line + 1, first_line + 1 + len(data))
+    data['description'] = data['description'].astype(str)
+
+    # "1.500.000", "1,500,000", "1500000.00" -> 1500000; phần lẻ 1-2 chữ số là xu, bỏ đi
+    amount = data['amount'].astype(str).str.strip().str.replace(r'[.,]\d{1,2}$', '', regex=True)
+    amount = amount.str.replace(r'[^\d-]', '', regex=True)
+    data['amount'] = pd.to_numeric(amount, errors='coerce')
+    data = data[data['amount'] > 0].copy()
+    data['amount'] = data['amount'].astype('int64')
+
+    if 'date' in data:
+        data['date'] = pd.to_datetime(data['date'], dayfirst=True, format='mixed', errors='coerce').dt.date
+    else:
+        data['date'] = None
+    if 'reference' not in data:
+        data['reference'] = ''
+
+    codes = data['description'].str.extract(ORDER_CODE_RE)
+    data['day'] = codes['day'].fillna('')
+    data['seq'] = codes['seq'].fillna('')
+    return data.reset_index(drop=True)
+
+
+# ============= ĐỐI SOÁT =============
+
+def pending_index():
+    """
+    Nạp thanh toán đang chờ 1 lần: by_key[(seq, amount)] -> danh sách thanh toán,
+    by_order_id[order_id] -> thanh toán, seqs = các mã ngắn đang có thanh toán chờ
+    """
+    from .models import Payment
+
+    by_key = defaultdict(list)
+    by_order_id = {}
+    seqs = set()
+    rows = Payment.objects.filter(status='pending').values_list(
+        'id', 'amount', 'order_id', 'order__order_id', 'order__created_at',
+    )
+    for payment_id, amount, order_pk, order_id, created_at in rows.iterator(chunk_size=2000):
+        candidate = {
+            'id': payment_id,
+            'order_pk': order_pk,
+            'order_id': order_id,
+            'amount': int(amount),
+            'created_date': timezone.localdate(created_at),
+        }
+        seq = order_id.rsplit('-', 1)[-1]
+        by_key[(seq, candidate['amount'])].append(candidate)
+        by_order_id[order_id] = candidate
+        seqs.add(seq)
+    return by_key, by_order_id, seqs
+
+
+def _date_or_none(value):
+    # NaT / None khi sao kê không có ngày hoặc ngày không đọc được
+    return value if value is not None and value == value else None
+
+
+def match_lines(data, index):
+    """
+    Ghép từng dòng sao kê với thanh toán. Trả về danh sách dòng, mỗi dòng có
+    'result': matched / ambiguous / amount_mismatch / duplicate / unmatched.
+    """
+    by_key, by_order_id, seqs = index
+    claimed = set()
+    lines = []
+    for line, description, amount, date, reference, day, seq in zip(
+        data['line'], data['description'], data['amount'], data['date'],
+        data['reference'], data['day'], data['seq'],
+    ):
+        date = _date_or_none(date)
+        amount = int(amount)
+        entry = {
+            'line': int(line), 'description': description, 'amount': amount,
+            'date': date, 'reference': str(reference).strip(), 'payment': None, 'candidates': 0,
+        }
+        lines.append(entry)
+        if not seq:
+            entry['result'] = 'unmatched'
+            continue
+
+        if day:
+            payment = by_order_id.get(f"DH-{day}-{seq}")
+            candidates = [payment] if payment and payment['amount'] == amount else []
+            known = payment is not None
+        else:
+            candidates = by_key.get((seq, amount), [])
+            known = seq in seqs
+        if date is not None and len(candidates) > 1:
+            candidates = [c for c in candidates if c['created_date'] <= date]
+
+        entry['candidates'] = len(candidates)
+        if len(candidates) == 1:
+            payment = candidates[0]
+            entry['payment'] = payment
+            if payment['id'] in claimed:
+                entry['result'] = 'duplicate'
+            else:
+                claimed.add(payment['id'])
+                entry['result'] = 'matched'
+        elif candidates:
+            entry['result'] = 'ambiguous'
+        elif known:
+            entry['result'] = 'amount_mismatch'
+        else:
+            entry['result'] = 'unmatched'
+    return lines
+
+
+@transaction.atomic
+def verify_matches(lines, user, source_name=''):
+    """
+    Xác thực các thanh toán đã khớp trong 1 transaction. Khoá lại các dòng và
+    chỉ cập nhật thanh toán vẫn còn 'pending' (có thể vừa được xác thực tay).
+    Trả về số thanh toán đã xác thực.
+    """
+    from .models import Order, Payment
+
+    matched = {entry['payment']['id']: entry for entry in lines if entry['result'] == 'matched'}
+    if not matched:
+        return 0
+
+    now = timezone.now()
+    payments = []
+    for start in range(0, len(matched), BULK_BATCH_SIZE):
+        ids = list(matched)[start:start + BULK_BATCH_SIZE]
+        payments.extend(
+            Payment.objects.select_for_update()
+            .filter(pk__in=ids, status='pending')
+            .select_related('order')
+            .only('id', 'status', 'transaction_id', 'admin_note', 'order__id', 'order__status', 'order__customer')
+        )
+
+    delta = Counter()
+    orders = []
+    for payment in payments:
+        entry = matched[payment.pk]
+        note = f"Đối soát tự động từ sao kê {source_name}, dòng {entry['line']}"
+        delta.update(counters.diff(
+            counters.payment_contribution({'status': payment.status}),
+            counters.payment_contribution({'status': 'verified'}),
+        ))
+        payment.status = 'verified'
+        payment.verified_at = now
+        payment.verified_by = user
+        payment.admin_note = f"{payment.admin_note}\n{note}".strip()
+        if not payment.transaction_id and entry['reference']:
+            payment.transaction_id = entry['reference'][:100]
+
+        # Như xác thực tay: đơn chuyển sang "đã thanh toán", trừ đơn đã đi tiếp hoặc đã huỷ.
+        # updated_at luôn đổi để báo cáo (core/analytics.py) tính doanh thu vào tháng này
+        order = payment.order
+        if order.status in ('pending', 'approved'):
+            old_state = {'status': order.status, 'customer_id': order.customer_id}
+            order.status = 'paid'
+            delta.update(counters.diff(
+                counters.order_contribution(old_state),
+                counters.order_contribution({**old_state, 'status': 'paid'}),
+            ))
+        order.updated_at = now
+        orders.append(order)
+
+    Payment.objects.bulk_update(
+        payments, ['status', 'verified_at', 'verified_by', 'admin_note', 'transaction_id'],
+        batch_size=BULK_BATCH_SIZE,
+    )
+    Order.objects.bulk_update(orders, ['status', 'updated_at'], batch_size=BULK_BATCH_SIZE)
+    counters.apply_delta(delta)
+    transaction.on_commit(partial(after_verify, sorted({payment.order_id for payment in payments})))
+
+    verified = {payment.pk for payment in payments}
+    for entry in matched.values():
+        if entry['payment']['id'] not in verified:
+            entry['result'] = 'already_verified'
+    return len(payments)
+
+
+def after_verify(order_ids):
+    """Phần signal làm khi xác thực tay mà bulk_update bỏ qua, chạy sau commit"""
+    from .models import Order
+
+    for start in range(0, len(order_ids), BULK_BATCH_SIZE):
+        orders = list(Order.objects.filter(pk__in=order_ids[start:start + BULK_BATCH_SIZE]))
+        search.index_instances(orders)
+        for order in orders:
+            publish_order_event(order.pk, status_event(order))
+
+
+def import_statement(f, name, user, dry_run=False):
+    """Đọc, ghép và (nếu không dry_run) xác thực. Trả về (lines, summary)."""
+    data = read_statement(f, name)
+    lines = match_lines(data, pending_index())
+    verified = 0 if dry_run else verify_matches(lines, user, source_name=os.path.basename(name))
+    summary = Counter(entry['result'] for entry in lines)
+    summary['total'] = len(lines)
+    summary['verified'] = verified
+    return lines, summary
+
+
+def report(lines, summary, limit=REPORT_LIMIT):
+    """Nhóm dòng theo kết quả để hiển thị (theo thứ tự RESULTS), mỗi nhóm tối đa `limit` dòng"""
+    groups = defaultdict(list)
+    for entry in lines:
+        if len(groups[entry['result']]) < limit:
+            groups[entry['result']].append(entry)
+    return [
+        {'result': result, 'label': label, 'count': summary[result], 'lines': groups[result]}
+        for result, label in RESULTS
+        if groups[result]
+    ]
@@ -0,0 +1,95 @@
+"""
+Định tuyến đọc/ghi giữa database chính ('default') và bản sao chỉ đọc ('replica')
+
+- Mọi lệnh ghi và migrate đi tới 'default'.
+- Lệnh đọc chỉ đi tới 'replica' bên trong view được đánh dấu @read_replica
+  (trang chủ, TOS, dashboard, danh sách...). Các view khác đọc từ 'default'.
+- Read-your-writes: request nào ghi vào DB (hoặc là POST/PUT/...) thì
+  ReplicaPinMiddleware đặt cookie ghim người dùng vào 'default' trong
+  REPLICA_PIN_SECONDS giây, đủ để bản sao đuổi kịp.
+
+Không khai báo alias 'replica' trong settings.DATABASES thì router không làm gì.
+"""
+
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+REPLICA_DB_ALIAS = 'replica'
+PIN_COOKIE = 'db_pin'
+
+# Trạng thái của request hiện tại: {'pinned', 'replica', 'wrote'}; None khi ngoài request
+_request_state = ContextVar('db_request_state', default=None)
+
+
+def replica_configured():
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+def pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+
+
+def read_replica(view_func):
+    """Đánh dấu view chỉ đọc: các query đọc trong view được phép chạy trên bản sao"""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        state = _request_state.get()
+        if state is None:
+            return view_func(request, *args, **kwargs)
+        previous = state['replica']
+        state['replica'] = True
+        try:
+            return view_func(request, *args, **kwargs)
+        finally:
+            state['replica'] = previous
+    return wrapper
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _request_state.get()
+        if state is None or not state['replica'] or state['pinned'] or state['wrote']:
+            return DEFAULT_DB_ALIAS
+        if not replica_configured():
+            return DEFAULT_DB_ALIAS
+        return REPLICA_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state['wrote'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Hai alias là cùng một dữ liệu
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Bản sao nhận schema qua replication
+        return db != REPLICA_DB_ALIAS
+
+
+class ReplicaPinMiddleware:
+    """Theo dõi request có ghi không và ghim người dùng vào database chính sau khi ghi"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = {
+            'pinned': PIN_COOKIE in request.COOKIES,
+            'replica': False,
+            'wrote': request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE'),
+        }
+        token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+
+        if state['wrote'] and replica_configured():
+            response.set_cookie(PIN_COOKIE, '1', max_age=pin_seconds(), httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,283 @@
+"""
+Tìm kiếm toàn văn trên đơn hàng, tin nhắn và khách hàng
+
+Mỗi đối tượng có một SearchDocument (title + body), được signal cập nhật khi
+lưu / xoá. Chỉ mục thật nằm ở database:
+  - SQLite: bảng ảo FTS5 `core_searchdocument_fts` (external content) giữ đồng
+    bộ bằng trigger, xếp hạng bằng bm25()
+  - MySQL: FULLTEXT index trên (title, body), xếp hạng bằng MATCH ... AGAINST
+  - Database khác / SQLite không có FTS5: icontains (chậm, chỉ để không lỗi)
+
+Dựng lại toàn bộ: python manage.py rebuild_search_index
+"""
+
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+FTS_TABLE = 'core_searchdocument_fts'
+
+# Trọng số cột khi xếp hạng (title khớp quan trọng hơn body)
+TITLE_WEIGHT = 10.0
+BODY_WEIGHT = 1.0
+
+SEARCH_LIMIT = 50
+MAX_TERMS = 8
+SNIPPET_WORDS = 16
+
+TOKEN_RE = re.compile(r'\w+')
+
+# Field ảnh hưởng tới nội dung tài liệu; save(update_fields=...) không chạm
+# field nào trong này thì bỏ qua (VD cập nhật last_login khi đăng nhập)
+INDEXED_FIELDS = {
+    'Order': {'order_id', 'description', 'admin_note'},
+    'Message': {'content'},
+    'User': {'username', 'email', 'phone', 'first_name', 'last_name', 'user_type'},
+}
+
+
+# ============= TÀI LIỆU =============
+
+def order_document(order):
+    return {
+        'kind': 'order',
+        'object_id': order.pk,
+        'order_id': order.pk,
+        'title': order.order_id,
+        'body': '\n'.join(filter(None, [order.description, order.admin_note])),
+    }
+
+
+def message_document(message):
+    return {
+        'kind': 'message',
+        'object_id': message.pk,
+        'order_id': message.order_id,
+        'title': '',
+        'body': message.content,
+    }
+
+
+def customer_document(user):
+    if user.user_type != 'customer':
+        return None
+    return {
+        'kind': 'customer',
+        'object_id': user.pk,
+        'order_id': None,
+        'title': user.username,
+        'body': ' '.join(filter(None, [
+            f"{user.first_name} {user.last_name}".strip(), user.email, user.phone,
+        ])),
+    }
+
+
+DOCUMENT_BUILDERS = {
+    'Order': order_document,
+    'Message': message_document,
+    'User': customer_document,
+}
+
+KINDS = {'Order': 'order', 'Message': 'message', 'User': 'customer'}
+
+
+def should_reindex(instance, update_fields):
+    if update_fields is None:
+        return True
+    return bool(INDEXED_FIELDS[type(instance).__name__] & set(update_fields))
+
+
+def index_instance(instance):
+    """Ghi (upsert) tài liệu của instance bằng 1 câu lệnh"""
+    index_instances([instance])
+
+
+def index_instances(instances):
+    """Ghi (upsert) tài liệu của nhiều instance bằng 1 câu lệnh (VD sau bulk_update)"""
+    from .models import SearchDocument
+
+    now = timezone.now()
+    documents = []
+    for instance in instances:
+        document = DOCUMENT_BUILDERS[type(instance).__name__](instance)
+        if document is None:
+            # VD user không phải khách hàng
+            remove_instance(instance)
+        else:
+            documents.append(SearchDocument(updated_at=now, **document))
+    if not documents:
+        return
+    SearchDocument.objects.bulk_create(
+        documents,
+        update_conflicts=True,
+        unique_fields=['kind', 'object_id'],
+        update_fields=['order', 'title', 'body', 'updated_at'],
+    )
+
+
+def remove_instance(instance):
+    from .models import SearchDocument
+
+    SearchDocument.objects.filter(kind=KINDS[type(instance).__name__], object_id=instance.pk).delete()
+
+
+# ============= TRUY VẤN =============
+
+def terms(query):
+    """Tách từ khoá; bỏ mọi cú pháp đặc biệt của FTS5 / MySQL trong input"""
+    return TOKEN_RE.findall(query or '')[:MAX_TERMS]
+
+
+# Các alias đã thấy bảng FTS5
+_fts5_ready = set()
+
+
+def backend(using=DEFAULT_DB_ALIAS):
+    connection = connections[using]
+    if connection.vendor == 'mysql':
+        return 'mysql'
+    if connection.vendor == 'sqlite':
+        # Bảng FTS5 chỉ có khi SQLite hỗ trợ lúc chạy migration; đã thấy thì không kiểm tra lại
+        if using not in _fts5_ready and FTS_TABLE in connection.introspection.table_names():
+            _fts5_ready.add(using)
+        if using in _fts5_ready:
+            return 'fts5'
+    return 'basic'
+
+
+def search(query, kind=None, limit=SEARCH_LIMIT, using=None):
+    """
+    Trả về danh sách SearchDocument khớp mọi từ khoá (tiền tố), xếp theo độ liên quan.
+    Mỗi kết quả có thêm `.snippet` (HTML an toàn, từ khớp nằm trong <mark>).
+    `using` mặc định theo router (bản sao trong view @read_replica).
+    """
+    from .models import SearchDocument
+
+    words = terms(query)
+    if not words:
+        return []
+
+    using = using or router.db_for_read(SearchDocument)
+    engine = backend(using)
+    if engine == 'basic':
+        condition = Q()
+        for word in words:
+            condition &= Q(title__icontains=word) | Q(body__icontains=word)
+        documents = SearchDocument.objects.using(using).filter(condition)
+        if kind:
+            documents = documents.filter(kind=kind)
+        results = list(documents.select_related('order').order_by('-updated_at')[:limit])
+        for document in results:
+            document.snippet = highlight(document.body or document.title, words)
+        return results
+
+    if engine == 'fts5':
+        sql = (
+            f"SELECT d.id, bm25({FTS_TABLE}, %s, %s) AS score, "
+            f"snippet({FTS_TABLE}, -1, char(2), char(3), '…', %s) "
+            f"FROM {FTS_TABLE} JOIN core_searchdocument d ON d.id = {FTS_TABLE}.rowid "
+            f"WHERE {FTS_TABLE} MATCH %s {'AND d.kind = %s ' if kind else ''}"
+            f"ORDER BY score LIMIT %s"
+        )
+        match = ' '.join(f'"{word}"*' for word in words)
+        params = [TITLE_WEIGHT, BODY_WEIGHT, SNIPPET_WORDS, match]
+    else:
+        sql = (
+            "SELECT id, MATCH(title, body) AGAINST (%s IN BOOLEAN MODE) AS score, NULL "
+            "FROM core_searchdocument WHERE MATCH(title, body) AGAINST (%s IN BOOLEAN MODE) "
+            f"{'AND kind = %s ' if kind else ''}ORDER BY score DESC LIMIT %s"
+        )
+        match = ' '.join(f'+{word}*' for word in words)
+        params = [match, match]
+    if kind:
+        params.append(kind)
+    params.append(limit)
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    documents = SearchDocument.objects.using(using).select_related('order').in_bulk([row[0] for row in rows])
+    results = []
+    for document_id, score, snippet in rows:
+        document = documents.get(document_id)
+        if document is None:
+            continue
+        document.score = score
+        if snippet is not None:
+            document.snippet = mark_safe(
+                escape(snippet).replace('\x02', '<mark>').replace('\x03', '</mark>')
+            )
+        else:
+            document.snippet = highlight(document.body or document.title, words)
+        results.append(document)
+    return results
+
+
+def highlight(text, words, width=160):
+    """Đoạn trích quanh từ khoá đầu tiên tìm thấy, đánh dấu <mark> (dùng khi không có snippet() của FTS5)"""
+    pattern = re.compile('|'.join(re.escape(word) for word in words), re.IGNORECASE)
+    match = pattern.search(text)
+    start = max(0, match.start() - width // 3) if match else 0
+    excerpt = text[start:start + width]
+    excerpt = ('…' if start else '') + excerpt + ('…' if start + width < len(text) else '')
+    # Escape từng đoạn để <mark> không chen vào giữa entity HTML
+    html, position = [], 0
+    for found in pattern.finditer(excerpt):
+        html.append(escape(excerpt[position:found.start()]))
+        html.append(f'<mark>{escape(found.group(0))}</mark>')
+        position = found.end()
+    html.append(escape(excerpt[position:]))
+    return mark_safe(''.join(html))
+
+
+# ============= DỰNG LẠI =============
+
+def _documents(apps, using):
+    """Sinh tài liệu từ dữ liệu gốc, dùng được với model lịch sử trong migration"""
+    Order = apps.get_model('core', 'Order')
+    Message = apps.get_model('core', 'Message')
+    User = apps.get_model('core', 'User')
+
+    orders = Order.objects.using(using).only('order_id', 'description', 'admin_note')
+    for order in orders.iterator(chunk_size=1000):
+        yield order_document(order)
+    for message in Message.objects.using(using).only('order_id', 'content').iterator(chunk_size=1000):
+        yield message_document(message)
+    customers = User.objects.using(using).filter(user_type='customer').only(*INDEXED_FIELDS['User'])
+    for user in customers.iterator(chunk_size=1000):
+        yield customer_document(user)
+
+
+def rebuild(apps=None, batch_size=1000, using=DEFAULT_DB_ALIAS):
+    """Xoá và tạo lại mọi SearchDocument; trigger FTS5 tự cập nhật chỉ mục. Trả về số tài liệu."""
+    if apps is None:
+        from django.apps import apps
+    SearchDocument = apps.get_model('core', 'SearchDocument')
+    documents = SearchDocument.objects.using(using)
+
+    now = timezone.now()
+    total = 0
+    with transaction.atomic(using=using):
+        documents.all().delete()
+        batch = []
+        for document in _documents(apps, using):
+            batch.append(SearchDocument(updated_at=now, **document))
+            if len(batch) >= batch_size:
+                documents.bulk_create(batch)
+                total += len(batch)
+                batch = []
+        documents.bulk_create(batch)
+        total += len(batch)
+    return total
+
+
+def optimize(using=DEFAULT_DB_ALIAS):
+    """Gộp các segment của chỉ mục FTS5 sau khi ghi nhiều"""
+    if backend(using) == 'fts5':
+        with connections[using].cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
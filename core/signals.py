@@ -0,0 +1,239 @@
+from functools import lru_cache, partial
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import OuterRef, Q, Subquery
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import counters, search
+from .media import ContentAddressedStorage
+from .cache import bump_generation_on_commit
+from .models import Message, Order, OrderProgress, Payment, Sample, ServiceType, TermsOfService, User
+from .realtime import message_event, progress_event, publish_order_event
+
+
+@receiver(post_save, sender=Sample)
+@receiver(post_delete, sender=Sample)
+@receiver(post_save, sender=ServiceType)
+@receiver(post_delete, sender=ServiceType)
+@receiver(post_save, sender=TermsOfService)
+@receiver(post_delete, sender=TermsOfService)
+def invalidate_public_cache(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    """Dữ liệu trang chủ thay đổi -> đổi generation (sau commit) để cache cũ hết hiệu lực"""
+    bump_generation_on_commit(using)
+
+
+# ============= BỘ ĐẾM DASHBOARD =============
+
+@receiver(post_init, sender=Order)
+@receiver(post_init, sender=Payment)
+@receiver(post_init, sender=Message)
+def remember_counter_state(sender, instance, **kwargs):
+    # Bản ghi mới (chưa có pk) chưa đóng góp gì vào bộ đếm
+    instance._counter_state = counters.snapshot(instance) if instance.pk else {}
+
+
+@receiver(pre_save, sender=Order)
+@receiver(pre_save, sender=Payment)
+@receiver(pre_save, sender=Message)
+def load_counter_state(sender, instance, **kwargs):
+    if instance._counter_state is None:
+        instance._counter_state = counters.load_snapshot(instance)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_save, sender=Payment)
+@receiver(post_save, sender=Message)
+def update_counters_on_save(sender, instance, created, using=DEFAULT_DB_ALIAS, **kwargs):
+    # Bảng dẫn xuất chỉ duy trì trên database chính; database khác (VD nguồn của
+    # copy_database) được dựng lại bằng rebuild_counters / rebuild_search_index
+    if using != DEFAULT_DB_ALIAS:
+        return
+    new_state = counters.snapshot(instance)
+    if new_state is None:
+        # Instance có field bị defer: đọc lại trạng thái vừa lưu
+        new_state = counters.load_snapshot(instance)
+    counters.record_change(instance, {} if created else instance._counter_state, new_state)
+    instance._counter_state = new_state
+
+
+@receiver(pre_delete, sender=Order)
+@receiver(pre_delete, sender=Payment)
+@receiver(pre_delete, sender=Message)
+def remember_counter_contribution(sender, instance, using=DEFAULT_DB_ALIAS, **kwargs):
+    # Tính đóng góp trước khi xoá: xoá Order sẽ xoá ReadCursor (fast delete, không
+    # signal) và chính Order trước/sau post_delete của tin nhắn, khi đó tin đã đọc
+    # bị coi là chưa đọc và không còn biết khách hàng của đơn
+    if using != DEFAULT_DB_ALIAS:
+        return
+    old_state = instance._counter_state
+    if old_state is None:
+        old_state = counters.snapshot(instance) or counters.load_snapshot(instance)
+    instance._counter_contribution = counters.contribution(instance, old_state)
+
+
+@receiver(post_delete, sender=Order)
+@receiver(post_delete, sender=Payment)
+@receiver(post_delete, sender=Message)
+def update_counters_on_delete(sender, instance, using=DEFAULT_DB_ALIAS, **kwargs):
+    if using != DEFAULT_DB_ALIAS:
+        return
+    old_contribution = getattr(instance, '_counter_contribution', None)
+    if old_contribution is None:
+        old_contribution = counters.contribution(instance, instance._counter_state or counters.snapshot(instance))
+    counters.record_delete(instance, old_contribution)
+    instance._counter_state = {}
+
+
+# ============= HỘP THƯ ARTIST =============
+
+@receiver(post_save, sender=Message)
+def track_last_customer_message(sender, instance, created, using=DEFAULT_DB_ALIAS, **kwargs):
+    # update() không phát signal nên không đụng tới bộ đếm / chỉ mục của Order
+    if created and instance.sender_type == 'customer':
+        Order.objects.using(using).filter(
+            Q(last_customer_message_id__isnull=True) | Q(last_customer_message_id__lt=instance.id),
+            pk=instance.order_id,
+        ).update(last_customer_message_id=instance.id)
+
+
+@receiver(post_delete, sender=Message)
+def untrack_last_customer_message(sender, instance, using=DEFAULT_DB_ALIAS, **kwargs):
+    if instance.sender_type != 'customer':
+        return
+    latest = Message.objects.using(using).filter(
+        order_id=OuterRef('pk'), sender_type='customer'
+    ).order_by('-id').values('id')[:1]
+    Order.objects.using(using).filter(
+        pk=instance.order_id, last_customer_message_id=instance.id
+    ).update(last_customer_message_id=Subquery(latest))
+
+
+# ============= REAL-TIME =============
+
+@receiver(post_save, sender=Message)
+def publish_new_message(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(partial(publish_order_event, instance.order_id, message_event(instance)))
+
+
+@receiver(post_save, sender=OrderProgress)
+def publish_new_progress(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(partial(publish_order_event, instance.order_id, progress_event(instance)))
+
+
+# ============= TÌM KIẾM =============
+
+@receiver(post_save, sender=Order)
+@receiver(post_save, sender=Message)
+@receiver(post_save, sender=User)
+def update_search_index(sender, instance, update_fields=None, using=DEFAULT_DB_ALIAS, **kwargs):
+    if using == DEFAULT_DB_ALIAS and search.should_reindex(instance, update_fields):
+        search.index_instance(instance)
+
+
+@receiver(post_delete, sender=Order)
+@receiver(post_delete, sender=Message)
+@receiver(post_delete, sender=User)
+def remove_from_search_index(sender, instance, using=DEFAULT_DB_ALIAS, **kwargs):
+    if using == DEFAULT_DB_ALIAS:
+        search.remove_instance(instance)
+
+
+# ============= THAM CHIẾU BLOB =============
+
+@lru_cache(maxsize=None)
+def _model_blob_fields(model):
+    return tuple(
+        field for field in model._meta.concrete_fields
+        if isinstance(getattr(field, 'storage', None), ContentAddressedStorage)
+    )
+
+
+def _blob_fields(instance):
+    return _model_blob_fields(type(instance))
+
+
+def _stored_name(value):
+    return (value.name if hasattr(value, 'name') else value) or ''
+
+
+def _release_after_commit(storage, name, using):
+    # Rollback thì bản ghi vẫn còn, nên chỉ bỏ tham chiếu sau khi commit
+    transaction.on_commit(partial(storage.delete, name), using=using)
+
+
+@receiver(post_init, sender=Order)
+@receiver(post_init, sender=Message)
+@receiver(post_init, sender=OrderProgress)
+@receiver(post_init, sender=Payment)
+@receiver(post_init, sender=Sample)
+@receiver(post_save, sender=Order)
+@receiver(post_save, sender=Message)
+@receiver(post_save, sender=OrderProgress)
+@receiver(post_save, sender=Payment)
+@receiver(post_save, sender=Sample)
+def remember_blob_names(sender, instance, **kwargs):
+    # Tên file lúc tải / lưu, để biết field nào đã đổi mà không phải query; field bị defer thì không có
+    instance._blob_names = {
+        field.attname: _stored_name(instance.__dict__[field.attname])
+        for field in _blob_fields(instance) if field.attname in instance.__dict__
+    }
+
+
+@receiver(pre_save, sender=Order)
+@receiver(pre_save, sender=Message)
+@receiver(pre_save, sender=OrderProgress)
+@receiver(pre_save, sender=Payment)
+@receiver(pre_save, sender=Sample)
+def release_replaced_blobs(sender, instance, raw=False, using=DEFAULT_DB_ALIAS, update_fields=None, **kwargs):
+    """
+    Field của bản ghi đã có đổi file (file mới, tên file khác hoặc xoá trắng)
+    -> file cũ mất một tham chiếu. Gán thẳng tên một blob đã lưu thì blob đó
+    thêm một tham chiếu (file mới upload thì storage tự tăng khi lưu).
+    """
+    if raw or instance.pk is None:
+        return
+    loaded = getattr(instance, '_blob_names', {})
+    changed = []
+    for field in _blob_fields(instance):
+        if field.attname not in instance.__dict__:
+            continue
+        if update_fields is not None and field.name not in update_fields and field.attname not in update_fields:
+            continue
+        value = getattr(instance, field.attname)
+        if (value and not value._committed) or loaded.get(field.attname) != (value.name or ''):
+            changed.append(field)
+    if not changed:
+        return
+    # Tên cũ đọc lại từ database: tên lúc tải có thể không phải cái đang lưu
+    previous = sender._base_manager.using(using).filter(pk=instance.pk).values(
+        *[field.attname for field in changed]
+    ).first() or {}
+    for field in changed:
+        value = getattr(instance, field.attname)
+        old_name = previous.get(field.attname) or ''
+        new_name = (value.name or '') if not value or value._committed else None
+        if old_name and old_name != new_name:
+            _release_after_commit(field.storage, old_name, using)
+        if new_name and new_name != old_name:
+            field.storage.reference(new_name)
+
+
+@receiver(post_delete, sender=Order)
+@receiver(post_delete, sender=Message)
+@receiver(post_delete, sender=OrderProgress)
+@receiver(post_delete, sender=Payment)
+@receiver(post_delete, sender=Sample)
+def release_deleted_blobs(sender, instance, using=DEFAULT_DB_ALIAS, **kwargs):
+    for field in _blob_fields(instance):
+        name = getattr(instance, field.attname).name
+        if name:
+            _release_after_commit(field.storage, name, using)
+
+
+@receiver(post_delete, sender=Sample)
+def delete_sample_derivatives(sender, instance, using=DEFAULT_DB_ALIAS, **kwargs):
+    """Bản ảnh nhỏ có id sample trong tên, không sample nào khác dùng nữa"""
+    transaction.on_commit(instance.delete_derivatives, using=using)
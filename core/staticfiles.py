@@ -0,0 +1,211 @@
+"""
+Static file có hash trong tên + bản nén sẵn
+
+- collectstatic: CompressedManifestStaticFilesStorage ghi css/style.<hash>.css
+  và thêm style.<hash>.css.gz / .br (brotli là tuỳ chọn: pip install brotli)
+- Khi chạy: CompressedStaticMiddleware phục vụ STATIC_ROOT, chọn bản .br / .gz
+  theo Accept-Encoding. File có hash được cache 1 năm với `immutable` vì đổi
+  nội dung là đổi URL; file không hash chỉ cache ngắn.
+- DEBUG hoặc STATIC_ROOT chưa có manifest (chưa collectstatic bằng storage này)
+  thì middleware đứng ngoài, để runserver phục vụ thẳng từ STATICFILES_DIRS
+  thay vì bản collect cũ.
+"""
+
+import gzip
+import mimetypes
+import os
+import posixpath
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.base import ContentFile
+from django.http import FileResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Chỉ nén định dạng văn bản; ảnh / font woff đã được nén sẵn
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.mjs', '.map', '.svg', '.json', '.txt', '.html', '.xml', '.ico', '.ttf', '.otf', '.eot'}
+MIN_COMPRESS_SIZE = 256
+
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+MUTABLE_MAX_AGE = 60
+
+# Thứ tự ưu tiên khi trình duyệt nhận cả hai
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def available_encodings():
+    return [(encoding, suffix) for encoding, suffix in ENCODINGS if encoding != 'br' or brotli]
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+    # mtime=0 để cùng nội dung luôn cho cùng file .gz
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        # Nén cả tên gốc lẫn tên có hash (tên gốc vẫn được phục vụ, cache ngắn)
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            for encoding, suffix in self.compress_file(name):
+                yield name, name + suffix, True
+
+    def compress_file(self, name):
+        """Ghi các bản nén của `name`, bỏ qua nếu nén không nhỏ hơn đáng kể"""
+        if os.path.splitext(name)[1].lower() not in COMPRESSIBLE_EXTENSIONS or not self.exists(name):
+            return
+        with self.open(name) as original:
+            data = original.read()
+        if len(data) < MIN_COMPRESS_SIZE:
+            return
+        for encoding, suffix in available_encodings():
+            compressed = compress(data, encoding)
+            if len(compressed) >= len(data) * 0.95:
+                continue
+            if self.exists(name + suffix):
+                self.delete(name + suffix)
+            self._save(name + suffix, ContentFile(compressed))
+            yield encoding, suffix
+
+
+def accepted_encodings(header):
+    """Các encoding trình duyệt chấp nhận (bỏ những cái có q=0)"""
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def manifest_version():
+    """
+    mtime của manifest (staticfiles.json), đổi sau mỗi lần collectstatic;
+    None nếu storage không dùng manifest hoặc chưa collectstatic
+    """
+    try:
+        storage = staticfiles_storage.manifest_storage
+        return os.stat(storage.path(staticfiles_storage.manifest_name)).st_mtime_ns
+    except (AttributeError, NotImplementedError, OSError):
+        return None
+
+
+@lru_cache(maxsize=1)
+def _immutable_names(version):
+    hashed_files, _ = staticfiles_storage.load_manifest()
+    return set(hashed_files.values())
+
+
+def immutable_names():
+    """Tên file có hash trong manifest; đọc lại khi manifest đổi, rỗng nếu không có manifest"""
+    version = manifest_version()
+    if version is None:
+        return set()
+    return _immutable_names(version)
+
+
+def _static_file(name):
+    """(đường dẫn, size) của file gốc và các bản nén có sẵn, kèm mtime của file gốc"""
+    root = os.path.realpath(settings.STATIC_ROOT)
+    path = os.path.realpath(os.path.join(root, name))
+    if not path.startswith(root + os.sep) or not os.path.isfile(path):
+        raise FileNotFoundError(name)
+    stat = os.stat(path)
+    variants = {None: (path, stat.st_size)}
+    for encoding, suffix in ENCODINGS:
+        if os.path.isfile(path + suffix):
+            variants[encoding] = (path + suffix, os.path.getsize(path + suffix))
+    return variants, stat.st_mtime
+
+
+@lru_cache(maxsize=1024)
+def _cached_static_file(name, version):
+    # `version` chỉ để làm khoá: collectstatic xong là các mục cũ không còn được dùng.
+    # Chỉ cache khi tìm thấy, để file mới collect không bị 404 mãi
+    return _static_file(name)
+
+
+def find_static_file(name):
+    """
+    _static_file(name) có cache theo phiên bản manifest; không có manifest thì
+    không cache vì không biết khi nào STATIC_ROOT đổi
+    """
+    version = manifest_version()
+    try:
+        if version is None:
+            return _static_file(name)
+        return _cached_static_file(name, version)
+    except FileNotFoundError:
+        return None
+
+
+class CompressedStaticMiddleware:
+    """Phục vụ file trong STATIC_ROOT (sau collectstatic) trước mọi middleware khác"""
+
+    def __init__(self, get_response):
+        if settings.DEBUG:
+            raise MiddlewareNotUsed('DEBUG: static file do runserver phục vụ từ STATICFILES_DIRS')
+        self.get_response = get_response
+        self.prefix = settings.STATIC_URL if settings.STATIC_URL.startswith('/') else '/' + settings.STATIC_URL
+
+    def __call__(self, request):
+        if request.method in ('GET', 'HEAD') and request.path_info.startswith(self.prefix):
+            response = self.serve(request, request.path_info[len(self.prefix):])
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    def serve(self, request, name):
+        name = posixpath.normpath(name).lstrip('/')
+        if not name or name.startswith('..') or manifest_version() is None:
+            return None
+        found = find_static_file(name)
+        if found is None:
+            return None
+        variants, mtime = found
+
+        accepted = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+        encoding = next((encoding for encoding, _ in ENCODINGS if encoding in variants and encoding in accepted), None)
+        path, size = variants[encoding]
+
+        # ETag khác nhau theo encoding vì nội dung gửi đi khác nhau
+        etag = f'"{int(mtime):x}-{size:x}{"-" + encoding if encoding else ""}"'
+        response = get_conditional_response(request, etag=etag, last_modified=int(mtime))
+        if response is None:
+            content_type, _ = mimetypes.guess_type(name)
+            response = FileResponse(
+                open(path, 'rb'), content_type=content_type or 'application/octet-stream',
+                filename=posixpath.basename(name),
+            )
+            response.headers.pop('Content-Disposition', None)
+            if encoding:
+                response['Content-Encoding'] = encoding
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(mtime)
+
+        if name in immutable_names():
+            response['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+        else:
+            response['Cache-Control'] = f'public, max-age={MUTABLE_MAX_AGE}'
+        if len(variants) > 1:
+            patch_vary_headers(response, ('Accept-Encoding',))
+        return response
@@ -0,0 +1,162 @@
+"""
+Các task nền, chạy bởi `manage.py run_jobs` sau khi request đã trả về
+"""
+
+from io import BytesIO
+
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.core.mail import send_mail
+from PIL import ExifTags, Image, ImageOps
+
+from . import analytics
+from .jobs import task
+from .media import ContentAddressedStorage
+
+# Cạnh dài tối đa của ảnh upload (px), ảnh lớn hơn sẽ được thu nhỏ
+MAX_IMAGE_SIDE = 2560
+
+
+@task('sample.build_derivatives')
+def build_sample_derivatives(sample_id):
+    """Tạo bản WebP/AVIF cho sample mới upload"""
+    from .models import Sample
+
+    sample = Sample.objects.filter(pk=sample_id).first()
+    if sample is None:
+        return None
+    sample.build_derivatives()
+    return sample.derivatives
+
+
+@task('analytics.refresh')
+def refresh_analytics():
+    """Tính lại số liệu báo cáo của tháng hiện tại (và tháng vừa kết thúc nếu cần)"""
+    return [period.isoformat() for period in analytics.refresh()]
+
+
+@task('image.normalize')
+def normalize_image(model, pk, field):
+    """
+    Kiểm tra ảnh upload có hợp lệ, xoay theo EXIF và thu nhỏ nếu quá lớn.
+    Ghi đè lên chính file đó trong storage (file lưu theo nội dung thì thành blob mới).
+    """
+    obj = apps.get_model(model).objects.filter(pk=pk).first()
+    if obj is None:
+        return None
+    field_file = getattr(obj, field)
+    if not field_file:
+        return None
+
+    with field_file.open('rb') as f:
+        data = f.read()
+
+    # verify() phát hiện file hỏng/giả mạo, sau đó phải mở lại ảnh
+    with Image.open(BytesIO(data)) as probe:
+        probe.verify()
+
+    with Image.open(BytesIO(data)) as image:
+        image_format = image.format
+        rotated = image.getexif().get(ExifTags.Base.Orientation, 1) != 1
+        too_large = max(image.size) > MAX_IMAGE_SIDE
+        if not rotated and not too_large:
+            return {'width': image.width, 'height': image.height, 'changed': False}
+
+        transposed = ImageOps.exif_transpose(image)
+        if too_large:
+            transposed.thumbnail((MAX_IMAGE_SIDE, MAX_IMAGE_SIDE), Image.Resampling.LANCZOS)
+        if image_format == 'JPEG' and transposed.mode not in ('RGB', 'L'):
+            transposed = transposed.convert('RGB')
+
+        buffer = BytesIO()
+        transposed.save(buffer, format=image_format)
+        width, height = transposed.size
+
+    if isinstance(field_file.storage, ContentAddressedStorage):
+        # Blob có thể đang được bản ghi khác dùng chung: lưu nội dung mới thành blob
+        # mới rồi trỏ bản ghi sang, thay vì ghi đè
+        old_name = field_file.name
+        new_name = field_file.storage.save(old_name, ContentFile(buffer.getvalue()))
+        updated = type(obj).objects.filter(pk=pk, **{field: old_name}).update(**{field: new_name})
+        # File đã bị thay trong lúc xử lý thì bỏ kết quả này
+        field_file.storage.delete(old_name if updated else new_name)
+    else:
+        with field_file.storage.open(field_file.name, 'wb') as f:
+            f.write(buffer.getvalue())
+    return {'width': width, 'height': height, 'changed': True}
+
+
+def _artist_emails():
+    from .models import User
+
+    return list(
+        User.objects.filter(user_type='artist', is_active=True)
+        .exclude(email='')
+        .values_list('email', flat=True)
+    )
+
+
+def _notify(subject, body, recipients):
+    recipients = [email for email in recipients if email]
+    if not recipients:
+        return 0
+    return send_mail(subject, body, None, recipients)
+
+
+@task('notify.order_created')
+def notify_order_created(order_id):
+    """Báo artist có đơn hàng mới"""
+    from .models import Order
+
+    order = Order.objects.select_related('customer', 'service_type').get(pk=order_id)
+    return _notify(
+        f"Đơn hàng mới {order.order_id}",
+        f"{order.customer.username} vừa đặt {order.service_type.name}.\n\n{order.description}",
+        _artist_emails(),
+    )
+
+
+@task('notify.payment_uploaded')
+def notify_payment_uploaded(payment_id):
+    """Báo artist có chứng từ thanh toán cần xác thực"""
+    from .models import Payment
+
+    payment = Payment.objects.select_related('order', 'order__customer').get(pk=payment_id)
+    return _notify(
+        f"Thanh toán mới cho {payment.order.order_id}",
+        f"{payment.order.customer.username} đã chuyển {payment.amount:,.0f}đ, vui lòng xác thực.",
+        _artist_emails(),
+    )
+
+
+@task('notify.progress_added')
+def notify_progress_added(progress_id):
+    """Báo khách hàng có cập nhật tiến độ"""
+    from .models import OrderProgress
+
+    progress = OrderProgress.objects.select_related('order', 'order__customer').get(pk=progress_id)
+    order = progress.order
+    label = "bản hoàn thiện" if progress.is_final else "tiến độ mới"
+    return _notify(
+        f"Đơn hàng {order.order_id} có {label}",
+        progress.note or f"Artist vừa cập nhật {label} cho đơn hàng của bạn.",
+        [order.customer.email],
+    )
+
+
+@task('notify.message')
+def notify_message(message_id):
+    """Báo bên còn lại của đơn hàng có tin nhắn mới"""
+    from .models import Message
+
+    message = Message.objects.select_related('order', 'order__customer', 'sender').get(pk=message_id)
+    order = message.order
+    if message.sender.user_type == 'artist':
+        recipients = [order.customer.email]
+    else:
+        recipients = _artist_emails()
+    return _notify(
+        f"Tin nhắn mới - {order.order_id}",
+        f"{message.sender.username}: {message.content}",
+        recipients,
+    )
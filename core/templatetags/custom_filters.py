@@ -17,4 +17,33 @@ def vnd_currency(value):
         formatted = "{:,.0f}".format(value).replace(',', '.')
         return f"{formatted} VNĐ"
     except (ValueError, TypeError):
-        return value
\ No newline at end of file
+        return value
+
+@register.inclusion_tag('partials/responsive_image.html')
+def responsive_image(sample, sizes="(max-width: 480px) 50vw, (max-width: 768px) 33vw, 25vw", css_class=""):
+    """
+    Render <picture> với srcset WebP/AVIF cho một Sample
+    Example: {% responsive_image sample %}
+    """
+    from core.images import DERIVATIVE_FORMATS, build_srcset, derivative_name, derivatives_base
+    
+    derivatives = sample.derivatives or {}
+    sources = []
+    fallback_url = None
+    for ext, mime, _options in DERIVATIVE_FORMATS:
+        srcset = build_srcset(sample.image, derivatives, ext)
+        if srcset:
+            sources.append({'type': mime, 'srcset': srcset})
+            # <img> dự phòng dùng bản lớn nhất của định dạng cuối (WebP), không phải ảnh gốc
+            name = derivative_name(derivatives_base(sample.image, derivatives), derivatives[ext][-1], ext)
+            fallback_url = sample.image.storage.url(name)
+    
+    return {
+        'sample': sample,
+        'sources': sources,
+        'fallback_url': fallback_url or sample.image.url,
+        'sizes': sizes,
+        'css_class': css_class,
+        'width': derivatives.get('width'),
+        'height': derivatives.get('height'),
+    }
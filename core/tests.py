@@ -1,3 +1,1299 @@
-from django.test import TestCase
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import date, datetime, timedelta
+from unittest import mock
+from xml.etree import ElementTree
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, router, transaction
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import analytics, counters, exports, images, jobs, media, metrics, realtime, reconcile, routers, search, uploads
+from .management.commands import bench_views
+from .media import ContentAddressedStorage, ProtectedMediaStorage
+from .models import (Blob, Job, Message, MonthlyStat, Order, OrderProgress, OrderSequence, Payment, ReadCursor,
+                     Sample, SearchDocument, ServiceType, TermsOfService, Upload, User)
+from .pagination import KeysetPaginator, encode_cursor
+from .querybudget import query_budget
+from .staticfiles import CompressedStaticMiddleware
+
+TEST_MEDIA_ROOT = tempfile.mkdtemp(prefix='duyhoangsite-test-media-')
+TEST_PROTECTED_MEDIA_ROOT = tempfile.mkdtemp(prefix='duyhoangsite-test-protected-')
+TEST_UPLOAD_TEMP_DIR = tempfile.mkdtemp(prefix='duyhoangsite-test-uploads-')
+
+
+@override_settings(
+    MEDIA_ROOT=TEST_MEDIA_ROOT,
+    PROTECTED_MEDIA_ROOT=TEST_PROTECTED_MEDIA_ROOT,
+    UPLOAD_TEMP_DIR=TEST_UPLOAD_TEMP_DIR,
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    # Test không chạy collectstatic nên không có manifest
+    STORAGES={
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    },
+    QUERY_BUDGET_ENABLED=False,
+)
+class BaseTestCase(TestCase):
+    """Media, upload tạm, cache và static riêng cho test, không đụng vào thư mục của site"""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEST_MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(TEST_PROTECTED_MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(TEST_UPLOAD_TEMP_DIR, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.artist = User.objects.create_user('artist', password='pw', user_type='artist')
+        cls.customer = User.objects.create_user('customer', password='pw', user_type='customer')
+        cls.service = ServiceType.objects.create(name='Sketch', description='Sketch', price=100000)
+
+    def make_order(self, customer=None, **fields):
+        fields.setdefault('description', 'Vẽ chibi')
+        fields.setdefault('price', self.service.price)
+        return Order.objects.create(customer=customer or self.customer, service_type=self.service, **fields)
+
+
+# ============= PHÂN TRANG KEYSET =============
+
+class KeysetPaginatorTests(BaseTestCase):
+    def setUp(self):
+        now = timezone.now()
+        self.orders = [self.make_order() for _ in range(7)]
+        # Hai đơn trùng created_at: thứ tự phải dựa vào id để không lặp / sót bản ghi
+        for i, order in enumerate(self.orders):
+            Order.objects.filter(pk=order.pk).update(created_at=now - timedelta(minutes=i // 2))
+        self.paginator = KeysetPaginator(Order.objects.all(), 3, ('-created_at', '-id'))
+        self.expected = list(Order.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def test_next_pages_cover_every_row_once(self):
+        seen, cursor = [], None
+        while True:
+            page = self.paginator.page(cursor)
+            seen += [order.id for order in page]
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, self.expected)
+
+    def test_previous_cursor_returns_the_same_page(self):
+        first = self.paginator.page()
+        second = self.paginator.page(first.next_cursor)
+        third = self.paginator.page(second.next_cursor)
+        back = self.paginator.page(third.previous_cursor)
+        self.assertEqual([o.id for o in back], [o.id for o in second])
+        self.assertEqual([o.id for o in self.paginator.page(back.previous_cursor)], [o.id for o in first])
+        self.assertFalse(first.has_previous())
+
+    def test_tampered_cursor_falls_back_to_first_page(self):
+        first = [order.id for order in self.paginator.page()]
+        for values in (['abc', 2], [{'a': 1}, 2], ['not-a-date', 2], [None, 1],
+                       [timezone.now().isoformat(), 'x'], [timezone.now().isoformat(), 2 ** 70], [1]):
+            with self.subTest(values=values):
+                page = self.paginator.page(encode_cursor(values, 'next'))
+                self.assertEqual([order.id for order in page], first)
+        self.assertEqual([order.id for order in self.paginator.page('%%%not-base64')], first)
+
+    def test_tampered_cursor_in_views_is_not_a_server_error(self):
+        self.client.force_login(self.artist)
+        for url, values in ((reverse('home'), ['abc', 2]), (reverse('home'), [{'a': 1}, 2]),
+                            (reverse('artist_orders'), ['not-a-date', 2]), (reverse('artist_orders'), [None, 1])):
+            with self.subTest(url=url, values=values):
+                response = self.client.get(url, {'cursor': encode_cursor(values, 'next')})
+                self.assertEqual(response.status_code, 200)
+
+
+# ============= BỘ ĐẾM DASHBOARD =============
+
+class CounterTests(BaseTestCase):
+    def setUp(self):
+        self.order = self.make_order()
+        self.from_customer = [Message.objects.create(order=self.order, sender=self.customer, content=str(i))
+                              for i in range(3)]
+        self.from_artist = [Message.objects.create(order=self.order, sender=self.artist, content=str(i))
+                            for i in range(2)]
+
+    def unread(self):
+        values = counters.get_counters([
+            counters.UNREAD_FROM_CUSTOMERS, counters.customer_key(self.customer.pk, 'unread_from_artist'),
+        ])
+        return tuple(values.values())
+
+    def test_verify_after_create_read_and_delete(self):
+        self.assertEqual(counters.verify(), {})
+        payment = Payment.objects.create(order=self.order, amount=1, proof_image=png_file('proof.png'))
+        other = self.make_order(status='in_progress')
+        self.assertEqual(counters.get_counters([counters.ORDERS_PENDING, counters.PAYMENTS_PENDING]),
+                         {counters.ORDERS_PENDING: 1, counters.PAYMENTS_PENDING: 1})
+        self.assertEqual(counters.verify(), {})
+
+        ReadCursor.mark_read(self.order, 'artist', self.from_customer[-1].id)
+        ReadCursor.mark_read(self.order, 'customer', self.from_artist[0].id)
+        self.assertEqual(self.unread(), (0, 1))
+        self.assertEqual(counters.verify(), {})
+
+        payment.delete()
+        self.from_artist[-1].delete()
+        other.delete()
+        self.assertEqual(self.unread(), (0, 0))
+        self.assertEqual(counters.get_counters([counters.ORDERS_IN_PROGRESS, counters.PAYMENTS_PENDING]),
+                         {counters.ORDERS_IN_PROGRESS: 0, counters.PAYMENTS_PENDING: 0})
+        self.assertEqual(counters.verify(), {})
+
+    def test_mark_read_counts_once_and_never_moves_back(self):
+        self.assertEqual(ReadCursor.mark_read(self.order, 'artist', self.from_customer[1].id), 2)
+        self.assertEqual(ReadCursor.mark_read(self.order, 'artist', self.from_customer[1].id), 0)
+        self.assertEqual(ReadCursor.mark_read(self.order, 'artist', self.from_customer[0].id), 0)
+        cursor = ReadCursor.objects.get(order=self.order, participant='artist')
+        self.assertEqual(cursor.last_read_id, self.from_customer[1].id)
+        self.assertEqual(ReadCursor.mark_read(self.order, 'artist', self.from_customer[2].id), 1)
+        self.assertEqual(self.unread(), (0, 2))
+        self.assertEqual(counters.verify(), {})
+
+    def test_delete_order_after_both_sides_read(self):
+        ReadCursor.mark_read(self.order, 'artist', self.from_customer[-1].id)
+        ReadCursor.mark_read(self.order, 'customer', self.from_artist[-1].id)
+        self.assertEqual(self.unread(), (0, 0))
+        self.order.delete()
+        self.assertEqual(counters.verify(), {})
+        self.assertEqual(self.unread(), (0, 0))
+
+    def test_delete_order_with_unread_messages(self):
+        ReadCursor.mark_read(self.order, 'artist', self.from_customer[0].id)
+        self.assertEqual(self.unread(), (2, 2))
+        Order.objects.filter(pk=self.order.pk).delete()
+        self.assertEqual(counters.verify(), {})
+        self.assertEqual(self.unread(), (0, 0))
+
+
+# ============= HỘP THƯ ARTIST =============
+
+class ArtistMessagesTests(BaseTestCase):
+    def test_lists_only_unread_threads_newest_first(self):
+        orders = [self.make_order() for _ in range(4)]
+        for order in orders:
+            Message.objects.create(order=order, sender=self.customer, content='hỏi')
+        Message.objects.create(order=orders[0], sender=self.customer, content='hỏi thêm')
+        Message.objects.create(order=orders[1], sender=self.artist, content='trả lời')
+        ReadCursor.mark_read(orders[2], 'artist', orders[2].messages.last().id)
+        orders[3].messages.get().delete()
+
+        orders[0].refresh_from_db()
+        self.assertEqual(orders[0].last_customer_message_id, orders[0].messages.last().id)
+        orders[3].refresh_from_db()
+        self.assertIsNone(orders[3].last_customer_message_id)
+
+        self.client.force_login(self.artist)
+        with mock.patch('core.views.ARTIST_PAGE_SIZE', 1):
+            first = self.client.get(reverse('artist_messages')).context['orders']
+            second = self.client.get(reverse('artist_messages'), {'cursor': first.next_cursor}).context['orders']
+        self.assertEqual([(order.id, order.unread_count) for order in first], [(orders[0].id, 2)])
+        self.assertEqual([(order.id, order.unread_count) for order in second], [(orders[1].id, 1)])
+        self.assertFalse(second.has_next())
+
+
+# ============= REAL-TIME =============
+
+class OrderEventsTests(BaseTestCase):
+    def setUp(self):
+        self.order = self.make_order()
+        self.client.force_login(self.customer)
+
+    def test_wsgi_refuses_the_stream_and_page_polls(self):
+        response = self.client.get(reverse('order_events', args=[self.order.id]))
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.streaming)
+        page = self.client.get(reverse('order_detail', args=[self.order.id]))
+        self.assertContains(page, 'const liveEvents = false;')
+
+    async def test_asgi_serves_the_stream(self):
+        await self.async_client.aforce_login(self.customer)
+        response = await self.async_client.get(reverse('order_events', args=[self.order.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertTrue(response.is_async)
+
+
+    async def test_custom_hub_only_needs_add_remove_publish(self):
+        class ListHub(realtime.BaseHub):
+            def __init__(self):
+                self.subscriptions = []
+
+            def add(self, subscription):
+                self.subscriptions.append(subscription)
+
+            def remove(self, subscription):
+                self.subscriptions.remove(subscription)
+
+            def publish(self, channel, event):
+                for subscription in self.subscriptions:
+                    if subscription.channel == channel:
+                        subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+
+        hub = ListHub()
+        with hub.subscribe('order:1') as subscription:
+            hub.publish('order:2', {'type': 'status'})
+            hub.publish('order:1', {'type': 'message'})
+            self.assertEqual(await subscription.get(1), {'type': 'message'})
+            self.assertIsNone(await subscription.get(0.01))
+        self.assertEqual(hub.subscriptions, [])
+
+# ============= TÌM KIẾM =============
+
+class SearchTests(BaseTestCase):
+    def setUp(self):
+        self.order = self.make_order(description='Vẽ dragon bay trên núi')
+
+    def found(self, query, **kwargs):
+        return [(document.kind, document.object_id) for document in search.search(query, **kwargs)]
+
+    def test_sqlite_uses_fts5(self):
+        self.assertEqual(search.backend(), 'fts5')
+
+    def test_triggers_follow_save_and_delete(self):
+        self.assertEqual(self.found('dragon'), [('order', self.order.pk)])
+        self.order.description = 'Vẽ phoenix'
+        self.order.save()
+        self.assertEqual(self.found('dragon'), [])
+        self.assertEqual(self.found('phoenix'), [('order', self.order.pk)])
+        self.order.delete()
+        self.assertEqual(self.found('phoenix'), [])
+
+    def test_prefix_all_terms_and_kind_filter(self):
+        User.objects.create_user('dragonfan', password='pw', user_type='customer')
+        message = Message.objects.create(order=self.order, sender=self.customer, content='Thêm dragon màu đỏ')
+
+        self.assertEqual(set(self.found('drag')), {
+            ('order', self.order.pk), ('message', message.pk), ('customer', User.objects.get(username='dragonfan').pk),
+        })
+        # Mọi từ khoá phải khớp
+        self.assertEqual(self.found('dragon đỏ'), [('message', message.pk)])
+        self.assertEqual(self.found('drag', kind='message'), [('message', message.pk)])
+        # Title nặng hơn body
+        self.assertEqual(self.found('dragonfan')[0][0], 'customer')
+
+    def test_query_syntax_is_not_passed_to_fts(self):
+        self.assertEqual(search.terms('"drag* OR (núi) -"'), ['drag', 'OR', 'núi'])
+        self.assertEqual(self.found('"drag* (núi'), [('order', self.order.pk)])
+        self.assertEqual(search.search('*"()'), [])
+
+    def test_snippet_escapes_html(self):
+        Message.objects.create(order=self.order, sender=self.customer, content='<script>alert(1)</script> dragon')
+        snippet = search.search('dragon', kind='message')[0].snippet
+        self.assertIn('<mark>dragon</mark>', snippet)
+        self.assertIn('&lt;script&gt;', snippet)
+        self.assertNotIn('<script>', snippet)
+
+    def test_icontains_fallback(self):
+        Message.objects.create(order=self.order, sender=self.customer, content='Bé <b>Dragon</b> & mèo')
+        with mock.patch('core.search.backend', return_value='basic'):
+            results = search.search('DRAGON mèo')
+            self.assertEqual([document.kind for document in results], ['message'])
+            self.assertEqual(str(results[0].snippet), 'Bé &lt;b&gt;<mark>Dragon</mark>&lt;/b&gt; &amp; <mark>mèo</mark>')
+            self.assertEqual(self.found('dragon', kind='order'), [('order', self.order.pk)])
+
+    def test_highlight_trims_long_text(self):
+        html = search.highlight('a' * 200 + ' dragon ' + 'b' * 200, ['dragon'], width=60)
+        self.assertTrue(html.startswith('…') and html.endswith('…'))
+        self.assertIn('<mark>dragon</mark>', html)
+
+
+# ============= BÁO CÁO THEO THÁNG =============
+
+def local(*args):
+    return timezone.make_aware(datetime(*args))
+
+
+class AnalyticsTests(BaseTestCase):
+    def make_event_order(self, service=None, payment=None, **timestamps):
+        order = self.make_order(status=timestamps.pop('status', 'pending'))
+        Order.objects.filter(pk=order.pk).update(service_type=service or self.service, **timestamps)
+        if payment:
+            amount, verified_at = payment
+            Payment.objects.create(order=order, amount=amount, proof_image='payments/p.png',
+                                   status='verified', verified_at=verified_at)
+        return order
+
+    def totals(self, stats):
+        return {stat.period: stat for stat in stats if stat.service_type_id is None}
+
+    def test_build_stats_by_event_month(self):
+        other = ServiceType.objects.create(name='Chibi', description='Chibi', price=200000)
+        self.make_event_order(
+            status='completed', created_at=local(2026, 1, 10), approved_at=local(2026, 1, 11),
+            completed_at=local(2026, 2, 1), payment=(100000, local(2026, 1, 20)),
+        )
+        # 23:30 ngày 31/1 giờ Việt Nam là 16:30 UTC: vẫn thuộc tháng 1
+        self.make_event_order(service=other, created_at=local(2026, 1, 31, 23, 30),
+                              payment=(200000, local(2026, 2, 28, 23, 59)))
+
+        stats = analytics.build_stats(analytics.load_frame(), timezone.now())
+        totals = self.totals(stats)
+        self.assertEqual(sorted(totals), [date(2026, 1, 1), date(2026, 2, 1)])
+        january, february = totals[date(2026, 1, 1)], totals[date(2026, 2, 1)]
+        self.assertEqual((january.orders_created, january.orders_approved, january.payments_verified,
+                          january.revenue), (2, 1, 1, 100000))
+        self.assertEqual((february.orders_completed, february.payments_verified, february.revenue), (1, 1, 200000))
+        self.assertEqual(february.turnaround_count, 1)
+        self.assertEqual(february.turnaround_avg_hours, 21 * 24)
+        self.assertIsNone(january.turnaround_avg_hours)
+
+        by_service = {(stat.period, stat.service_type_id): stat for stat in stats if stat.service_type_id}
+        self.assertEqual(by_service[(date(2026, 2, 1), other.pk)].revenue, 200000)
+        self.assertEqual(by_service[(date(2026, 1, 1), self.service.pk)].orders_created, 1)
+
+    def test_build_stats_without_orders(self):
+        self.assertEqual(analytics.build_stats(analytics.load_frame(), timezone.now()), [])
+
+    def test_stale_periods(self):
+        MonthlyStat.objects.create(period=date(2025, 10, 1), refreshed_at=local(2025, 11, 2))
+        MonthlyStat.objects.create(period=date(2025, 11, 1), refreshed_at=local(2025, 11, 20))
+        # Tháng 10 đã được làm mới sau khi kết thúc; tháng 11 thì chưa, tháng 12 chưa có dòng tổng
+        self.assertEqual(analytics.stale_periods(local(2026, 1, 5)),
+                         [date(2025, 11, 1), date(2025, 12, 1), date(2026, 1, 1)])
+        self.assertEqual(analytics.stale_periods(local(2025, 11, 25)), [date(2025, 11, 1)])
+
+    def test_refresh_recomputes_only_stale_months(self):
+        now = timezone.now()
+        current = analytics.month_start(now)
+        old = analytics.month_start(now - timedelta(days=70))
+        self.make_event_order(created_at=now - timedelta(days=70))
+
+        # Lần đầu chưa có dữ liệu tổng hợp: dựng lại từ tháng cũ nhất, mỗi tháng một dòng tổng
+        periods = analytics.refresh(now)
+        self.assertEqual((periods[0], periods[-1]), (old, current))
+        self.assertEqual(MonthlyStat.objects.filter(service_type=None).count(), len(periods))
+
+        self.make_event_order(created_at=now)
+        self.assertEqual(analytics.refresh(now), [current])
+        total = MonthlyStat.objects.get(period=current, service_type=None)
+        self.assertEqual(total.orders_created, 1)
+        self.assertEqual(MonthlyStat.objects.get(period=old, service_type=None).orders_created, 1)
+        self.assertEqual(MonthlyStat.objects.filter(period=current).count(), 2)
+
+    def test_one_row_per_month_and_service(self):
+        MonthlyStat.objects.create(period=date(2026, 1, 1))
+        MonthlyStat.objects.create(period=date(2026, 1, 1), service_type=self.service)
+        for service_type in (None, self.service):
+            with self.subTest(service_type=service_type), self.assertRaises(IntegrityError), transaction.atomic():
+                MonthlyStat.objects.create(period=date(2026, 1, 1), service_type=service_type)
+
+
+# ============= HÀNG ĐỢI JOB =============
+
+class JobQueueTests(BaseTestCase):
+    def make_job(self, **fields):
+        fields.setdefault('run_after', timezone.now() - timedelta(seconds=1))
+        return Job.objects.create(name='analytics.refresh', **fields)
+
+    def expire(self, job):
+        Job.objects.filter(pk=job.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+
+    def test_claim_due_jobs_once(self):
+        due = self.make_job()
+        self.make_job(run_after=timezone.now() + timedelta(hours=1))
+
+        claimed = jobs.claim_jobs('worker-a')
+        self.assertEqual([job.pk for job in claimed], [due.pk])
+        self.assertEqual((claimed[0].status, claimed[0].attempts, claimed[0].locked_by), ('running', 1, 'worker-a'))
+        # Worker khác không nhận lại job đang chạy trong visibility timeout
+        self.assertEqual(jobs.claim_jobs('worker-b'), [])
+
+    def test_failed_job_is_retried_with_backoff_then_failed(self):
+        self.make_job(max_attempts=2)
+
+        job, = jobs.claim_jobs('worker-a')
+        with self.assertLogs('core.jobs', 'WARNING'):
+            jobs.mark_failed(job, 'lỗi 1')
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'queued')
+        self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=jobs.RETRY_BASE_DELAY - 5))
+        self.assertEqual(jobs.claim_jobs('worker-a'), [])
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now() - timedelta(seconds=1))
+        job, = jobs.claim_jobs('worker-a')
+        self.assertEqual(job.attempts, 2)
+        with self.assertLogs('core.jobs', 'WARNING'):
+            jobs.mark_failed(job, 'lỗi 2')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.last_error), ('failed', 'lỗi 2'))
+
+    def test_expired_lock_is_reclaimed_until_attempts_run_out(self):
+        job = self.make_job(max_attempts=2)
+
+        first, = jobs.claim_jobs('worker-a')
+        self.expire(first)
+        second, = jobs.claim_jobs('worker-b')
+        self.assertEqual((second.locked_by, second.attempts), ('worker-b', 2))
+        # Worker cũ không còn ghi được kết quả / gia hạn
+        with self.assertLogs('core.jobs', 'WARNING'):
+            self.assertEqual(jobs.heartbeat([first]), [first])
+        jobs.mark_done(first, {'stale': True})
+        second.refresh_from_db()
+        self.assertEqual(second.status, 'running')
+
+        self.expire(second)
+        with self.assertLogs('core.jobs', 'WARNING') as logs:
+            self.assertEqual(jobs.claim_jobs('worker-c'), [])
+        self.assertIn('failed', logs.output[0])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.locked_until), ('failed', 2, None))
+        self.assertIn('visibility timeout', job.last_error)
+
+    def test_heartbeat_extends_lock(self):
+        self.make_job()
+        job, = jobs.claim_jobs('worker-a', visibility_timeout=1)
+        self.assertEqual(jobs.heartbeat([job], visibility_timeout=600), [])
+        self.assertEqual(jobs.claim_jobs('worker-b'), [])
+        job.refresh_from_db()
+        self.assertGreater(job.locked_until, timezone.now() + timedelta(seconds=500))
+
+
+# ============= ĐỊNH TUYẾN BẢN SAO =============
+
+@mock.patch('core.routers.replica_configured', return_value=True)
+class ReplicaRouterTests(BaseTestCase):
+    def request(self, view, method='get', cookies=None):
+        """Chạy `view` sau ReplicaPinMiddleware; trả về (response, các alias router chọn khi đọc)"""
+        reads = []
+
+        def get_response(request):
+            view(request, reads)
+            return HttpResponse()
+
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies or {})
+        return routers.ReplicaPinMiddleware(get_response)(request), reads
+
+    @staticmethod
+    @routers.read_replica
+    def read_only(request, reads):
+        reads.append(router.db_for_read(Order))
+
+    @staticmethod
+    @routers.read_replica
+    def write_then_read(request, reads):
+        reads.append(router.db_for_read(Order))
+        reads.append(router.db_for_write(Order))
+        reads.append(router.db_for_read(Order))
+
+    @staticmethod
+    def unmarked(request, reads):
+        reads.append(router.db_for_read(Order))
+
+    def test_read_replica_view_reads_from_replica(self, configured):
+        response, reads = self.request(self.read_only)
+        self.assertEqual(reads, ['replica'])
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+
+    def test_unmarked_view_and_outside_request_read_primary(self, configured):
+        self.assertEqual(self.request(self.unmarked)[1], ['default'])
+        self.assertEqual(router.db_for_read(Order), 'default')
+
+    def test_write_pins_reads_to_primary(self, configured):
+        response, reads = self.request(self.write_then_read)
+        self.assertEqual(reads, ['replica', 'default', 'default'])
+        cookie = response.cookies[routers.PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], routers.pin_seconds())
+        self.assertTrue(cookie['httponly'])
+
+        # Request tiếp theo còn cookie: đọc từ database chính dù view cho phép bản sao
+        self.assertEqual(self.request(self.read_only, cookies={routers.PIN_COOKIE: '1'})[1], ['default'])
+
+    def test_post_reads_primary_and_sets_pin(self, configured):
+        response, reads = self.request(self.read_only, method='post')
+        self.assertEqual(reads, ['default'])
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+
+    def test_no_replica_configured(self, configured):
+        configured.return_value = False
+        response, reads = self.request(self.write_then_read)
+        self.assertEqual(reads, ['default'] * 3)
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+
+    def test_replica_is_never_migrated(self, configured):
+        self.assertFalse(router.allow_migrate('replica', 'core', model_name='order'))
+        self.assertTrue(router.allow_migrate('default', 'core', model_name='order'))
+
+
+# ============= MÃ ĐƠN HÀNG =============
+
+class OrderIdTests(BaseTestCase):
+    def setUp(self):
+        self.prefix = f"DH-{timezone.localdate():%Y%m%d}-"
+
+    def make_legacy_order(self, number):
+        """Đơn có sẵn mã (tạo theo cách cũ / thủ công), không đi qua OrderSequence"""
+        order = Order(customer=self.customer, service_type=self.service, description='cũ', price=1)
+        order.order_id = f"{self.prefix}{number:05d}"
+        order.save()
+        return order
+
+    def test_ids_are_sequential_within_a_day(self):
+        ids = [self.make_order().order_id for _ in range(3)]
+        self.assertEqual(ids, [f"{self.prefix}{n:05d}" for n in (1, 2, 3)])
+        self.assertEqual(OrderSequence.objects.get(day=timezone.localdate()).last_value, 3)
+
+    def test_sequence_seeds_from_existing_orders_of_the_day(self):
+        self.make_legacy_order(1)
+        self.make_legacy_order(2)
+        self.assertFalse(OrderSequence.objects.exists())
+        self.assertEqual(self.make_order().order_id, f"{self.prefix}00003")
+
+    def test_collision_retries_with_the_next_number(self):
+        # Dòng sequence đã có nhưng tụt lại sau một mã được tạo thủ công
+        OrderSequence.objects.create(day=timezone.localdate(), last_value=0)
+        self.make_legacy_order(1)
+        order = self.make_order()
+        self.assertEqual(order.order_id, f"{self.prefix}00002")
+        self.assertEqual(Order.objects.filter(order_id__startswith=self.prefix).count(), 2)
+
+
+# ============= STATIC FILE =============
+
+class CompressedStaticTests(BaseTestCase):
+    def setUp(self):
+        self.source = tempfile.mkdtemp(prefix='duyhoangsite-test-static-src-')
+        root = tempfile.mkdtemp(prefix='duyhoangsite-test-static-')
+        self.addCleanup(shutil.rmtree, self.source, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        settings = override_settings(
+            STATIC_ROOT=root, STATICFILES_DIRS=[self.source],
+            STORAGES={'staticfiles': {'BACKEND': 'core.staticfiles.CompressedManifestStaticFilesStorage'}},
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def collect(self, content):
+        with open(os.path.join(self.source, 'app.css'), 'w') as file:
+            file.write(content)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        return staticfiles_storage.stored_name('app.css')
+
+    def fetch(self, name):
+        response = self.client.get(f'/static/{name}', HTTP_ACCEPT_ENCODING='gzip')
+        return response['ETag'], gzip.decompress(b''.join(response.streaming_content)).decode()
+
+    def test_collectstatic_invalidates_cached_lookups(self):
+        hashed = self.collect('a {}\n' * 100)
+        etag, body = self.fetch('app.css')
+        self.assertEqual(self.fetch(hashed)[1], body)
+        # collectstatic so mtime làm tròn giây: file sửa trong cùng giây bị bỏ qua
+        time.sleep(1.1)
+        new_hashed = self.collect('b {}\n' * 200)
+        new_etag, new_body = self.fetch('app.css')
+        self.assertNotEqual(new_etag, etag)
+        self.assertEqual(new_body, 'b {}\n' * 200)
+        response = self.client.get(f'/static/{new_hashed}')
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_skipped_under_debug_or_without_manifest(self):
+        with override_settings(DEBUG=True), self.assertRaises(MiddlewareNotUsed):
+            CompressedStaticMiddleware(lambda request: HttpResponse())
+        # File cũ còn trong STATIC_ROOT nhưng chưa collectstatic bằng manifest storage: không phục vụ
+        with open(os.path.join(settings.STATIC_ROOT, 'app.css'), 'w') as file:
+            file.write('a {}\n')
+        self.assertEqual(self.client.get('/static/app.css').status_code, 404)
+        self.collect('a {}\n')
+        self.assertEqual(self.client.get('/static/app.css').status_code, 200)
+
+
+# ============= MEDIA =============
+
+def png_file(name, color='#e94e77', size=(400, 300)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, format='PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class MediaStorageTests(BaseTestCase):
+    def test_protected_blobs_live_outside_media_root(self):
+        order = self.make_order()
+        payment = Payment.objects.create(order=order, amount=order.price, proof_image=png_file('proof.png'))
+        sample = Sample.objects.create(service_type=self.service, title='Mẫu', image=png_file('sample.png'))
+        # Cùng nội dung nhưng mỗi storage một bản và một dòng Blob
+        self.assertEqual(payment.proof_image.name, sample.image.name)
+        self.assertTrue(os.path.isfile(os.path.join(TEST_PROTECTED_MEDIA_ROOT, payment.proof_image.name)))
+        self.assertEqual(
+            sorted(Blob.objects.values_list('protected', 'refcount')), [(False, 1), (True, 1)]
+        )
+
+        sample.delete()
+        stats = media.collect_garbage(grace_hours=0)
+        self.assertEqual(stats['deleted'], 1)
+        self.assertFalse(os.path.exists(os.path.join(TEST_MEDIA_ROOT, sample.image.name)))
+        self.client.force_login(self.customer)
+        response = self.client.get(payment.proof_image.url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_move_protected_files_from_media_root(self):
+        sample = Sample.objects.create(service_type=self.service, title='Mẫu', image=png_file('sample.png'))
+        # Chứng từ lưu trước khi có PROTECTED_MEDIA_ROOT: nằm trong MEDIA_ROOT, dùng chung blob với sample
+        legacy = ContentAddressedStorage()
+        only_proof = legacy.save('payments/other.png', png_file('other.png', '#000000'))
+        Payment.objects.bulk_create([
+            Payment(order=self.make_order(), amount=1, proof_image=sample.image.name),
+            Payment(order=self.make_order(), amount=1, proof_image=only_proof),
+        ])
+
+        self.assertEqual(media.move_protected_files(), {'copied': 1, 'moved': 1})
+        for name in (sample.image.name, only_proof):
+            self.assertTrue(os.path.isfile(os.path.join(TEST_PROTECTED_MEDIA_ROOT, name)))
+        self.assertTrue(os.path.isfile(os.path.join(TEST_MEDIA_ROOT, sample.image.name)))
+        self.assertFalse(os.path.exists(os.path.join(TEST_MEDIA_ROOT, only_proof)))
+        self.assertEqual(Blob.objects.filter(protected=True).count(), 2)
+        self.assertEqual(media.move_protected_files(), {'present': 2})
+
+    def test_samples_sharing_a_blob_keep_their_own_derivatives(self):
+        first = Sample.objects.create(service_type=self.service, title='A', image=png_file('a.png'))
+        second = Sample.objects.create(service_type=self.service, title='B', image=png_file('b.png'))
+        self.assertEqual(first.image.name, second.image.name)
+        first.build_derivatives()
+        second.build_derivatives()
+
+        def files(sample):
+            base = images.derivatives_base(sample.image, sample.derivatives)
+            return [default_storage.path(images.derivative_name(base, width, ext))
+                    for ext, _mime, _options in images.available_formats() for width in sample.derivatives[ext]]
+
+        self.assertTrue(files(first))
+        self.assertFalse(set(files(first)) & set(files(second)))
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        second.build_derivatives()
+        self.assertTrue(all(os.path.isfile(path) for path in files(second)))
+        self.assertFalse(any(os.path.exists(path) for path in files(first)))
+
+    def test_clearing_or_changing_a_file_releases_the_old_blob(self):
+        order = self.make_order(brief_file=png_file('brief.png'))
+        first = order.brief_file.name
+        self.assertEqual(Blob.objects.get(name=first).refcount, 1)
+
+        # Xoá trắng field: blob cũ hết tham chiếu sau khi commit và gc dọn được
+        order = Order.objects.get(pk=order.pk)
+        order.brief_file = ''
+        with self.captureOnCommitCallbacks(execute=True):
+            order.save()
+        self.assertEqual(Blob.objects.get(name=first).refcount, 0)
+        self.assertEqual(media.collect_garbage(grace_hours=0)['deleted'], 1)
+
+        # Thay file: file cũ mất một tham chiếu, file mới có một
+        order.brief_file = png_file('a.png', '#123456')
+        order.save()
+        second = order.brief_file.name
+        order.brief_file = png_file('b.png', '#654321')
+        with self.captureOnCommitCallbacks(execute=True):
+            order.save()
+        third = order.brief_file.name
+        self.assertEqual(Blob.objects.get(name=second).refcount, 0)
+        self.assertEqual(Blob.objects.get(name=third).refcount, 1)
+
+        # Trỏ sang tên một blob đã lưu: số tham chiếu vẫn khớp với số bản ghi
+        other = self.make_order()
+        other.brief_file = third
+        with self.captureOnCommitCallbacks(execute=True):
+            other.save()
+        self.assertEqual(Blob.objects.get(name=third).refcount, 2)
+        order.brief_file = second
+        with self.captureOnCommitCallbacks(execute=True):
+            order.save()
+        self.assertEqual(
+            dict(Blob.objects.filter(name__in=[second, third]).values_list('name', 'refcount')),
+            {second: 1, third: 1},
+        )
+        # Lưu lại mà không đổi gì thì không đụng tới blob
+        with self.assertNumQueries(1):
+            order.save(update_fields=['brief_file'])
+
+
+class RangeTests(BaseTestCase):
+    def test_parse_range(self):
+        for header, expected in (
+            ('bytes=0-99', (0, 99)),
+            ('bytes=900-', (900, 999)),
+            ('bytes=500-5000', (500, 999)),
+            ('bytes=-100', (900, 999)),
+            ('bytes=-2000', (0, 999)),
+            (' bytes = 10-20', (10, 20)),
+            ('bytes=1000-', 'unsatisfiable'),
+            ('bytes=-0', 'unsatisfiable'),
+            ('bytes=0-1,5-6', None),
+            ('items=0-1', None),
+            ('bytes=abc', None),
+            ('bytes=5-2', None),
+            ('bytes=', None),
+        ):
+            with self.subTest(header=header):
+                self.assertEqual(media.parse_range(header, 1000), expected)
+
+    def test_protected_file_serves_one_range(self):
+        order = self.make_order()
+        payment = Payment.objects.create(order=order, amount=1, proof_image=png_file('proof.png'))
+        content = payment.proof_image.read()
+        self.client.force_login(self.customer)
+        url = payment.proof_image.url
+
+        response = self.client.get(url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(content)}')
+        self.assertEqual(b''.join(response.streaming_content), content[10:20])
+
+        response = self.client.get(url, HTTP_RANGE=f'bytes={len(content)}-')
+        self.assertEqual(response.status_code, 416)
+        # If-Range không khớp (file đã đổi): gửi cả file
+        response = self.client.get(url, HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE='"cu"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), content)
+
+
+# ============= UPLOAD CHIA NHỎ =============
+
+@override_settings(UPLOAD_CHUNK_SIZE=8)
+class ChunkedUploadTests(BaseTestCase):
+    CONTENT = b'0123456789abcdefghij'
+
+    def setUp(self):
+        self.upload = uploads.create_upload(self.customer, 'brief', 'brief.txt', len(self.CONTENT))
+
+    def send(self, upload, offset, checksum=None):
+        chunk = self.CONTENT[offset:offset + 8]
+        return uploads.write_chunk(upload, offset, io.BytesIO(chunk), len(chunk), checksum)
+
+    def patch(self, offset):
+        self.client.force_login(self.customer)
+        return self.client.generic(
+            'PATCH', reverse('upload_detail', args=[self.upload.pk]), self.CONTENT[offset:offset + 8],
+            content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def test_chunks_are_assembled_in_order(self):
+        upload = self.send(self.upload, 0)
+        upload = self.send(upload, 8)
+        self.assertEqual((upload.offset, upload.status), (16, 'uploading'))
+        upload = self.send(upload, 16)
+        self.assertEqual(upload.status, 'complete')
+        self.assertEqual(upload.sha256, hashlib.sha256(self.CONTENT).hexdigest())
+        with open(uploads.assembled_path(upload), 'rb') as f:
+            self.assertEqual(f.read(), self.CONTENT)
+        self.assertEqual(uploads.completed_upload(upload.pk, self.customer, 'brief'), upload)
+
+    def test_offset_conflict_and_bad_checksum_keep_position(self):
+        stale = self.upload
+        self.send(self.upload, 0)
+        # Client gửi lại chunk đã tới server (bản upload cũ trong tay vẫn ở offset 0)
+        with self.assertRaises(uploads.OffsetMismatch):
+            self.send(stale, 0)
+        with self.assertRaises(uploads.OffsetMismatch):
+            self.send(Upload.objects.get(pk=self.upload.pk), 16)
+        with self.assertRaises(uploads.ChecksumMismatch):
+            self.send(Upload.objects.get(pk=self.upload.pk), 8, checksum='0' * 64)
+        self.assertEqual(Upload.objects.get(pk=self.upload.pk).offset, 8)
+
+        response = self.patch(0)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual((response.json()['offset'], response['Upload-Offset']), (8, '8'))
+
+    def test_damaged_chunk_restarts_upload(self):
+        upload = self.send(self.send(self.upload, 0), 8)
+        with open(uploads.chunk_path(upload, 0), 'wb') as f:
+            f.write(b'xxxxxxxx')
+
+        response = self.patch(16)
+        self.assertEqual(response.status_code, 460)
+        self.assertEqual(response.json()['offset'], 0)
+        upload.refresh_from_db()
+        self.assertEqual((upload.offset, upload.chunk_checksums, upload.status), (0, [], 'uploading'))
+
+        # Gửi lại từ đầu thì hoàn tất
+        upload = self.send(self.send(self.send(upload, 0), 8), 16)
+        self.assertEqual(upload.sha256, hashlib.sha256(self.CONTENT).hexdigest())
+
+    def test_missing_chunk_restarts_upload(self):
+        upload = self.send(self.upload, 0)
+        os.remove(uploads.chunk_path(upload, 0))
+        with self.assertRaises(uploads.ChecksumMismatch):
+            self.send(self.send(upload, 8), 16)
+        self.assertEqual(Upload.objects.get(pk=upload.pk).offset, 0)
+
+    def test_invalid_image_is_discarded(self):
+        upload = uploads.create_upload(self.artist, 'progress', 'step.png', 8)
+        with self.assertRaises(uploads.UploadError):
+            uploads.write_chunk(upload, 0, io.BytesIO(b'notimage'), 8)
+        self.assertFalse(Upload.objects.filter(pk=upload.pk).exists())
+        self.assertFalse(os.path.exists(uploads.upload_dir(upload)))
+
+
+# ============= ĐỐI SOÁT SAO KÊ =============
+
+def statement(*rows):
+    content = 'Ngày giao dịch,Nội dung,Số tiền ghi có,Số tham chiếu\n' + ''.join(f'{row}\n' for row in rows)
+    return io.BytesIO(content.encode('utf-8'))
+
+
+class ReconcileTests(BaseTestCase):
+    def make_payment(self, **fields):
+        order = self.make_order(status='approved', **fields)
+        return Payment.objects.create(order=order, amount=order.price, proof_image=png_file('proof.png'))
+
+    def test_verify_runs_the_manual_side_effects_after_commit(self):
+        payment = self.make_payment()
+        order = payment.order
+        SearchDocument.objects.filter(kind='order', object_id=order.pk).delete()
+        row = f'{timezone.localdate():%d/%m/%Y},CK {order.order_id},{order.price},FT001'
+        with mock.patch('core.reconcile.publish_order_event') as publish:
+            with self.captureOnCommitCallbacks() as callbacks:
+                lines, summary = reconcile.import_statement(statement(row), 'sk.csv', self.artist)
+            publish.assert_not_called()
+            for callback in callbacks:
+                callback()
+
+        self.assertEqual(summary['verified'], 1)
+        publish.assert_called_once_with(order.pk, {'type': 'status', 'status': 'paid', 'status_display': mock.ANY})
+        self.assertTrue(SearchDocument.objects.filter(kind='order', object_id=order.pk).exists())
+        payment.refresh_from_db()
+        self.assertEqual((payment.status, payment.transaction_id, payment.order.status), ('verified', 'FT001', 'paid'))
+        self.assertEqual(counters.verify(), {})
+
+    def test_verified_payment_counts_in_current_month_report(self):
+        payment = self.make_payment()
+        order = payment.order
+        long_ago = timezone.now() - timedelta(days=90)
+        Order.objects.filter(pk=order.pk).update(status='in_progress', created_at=long_ago, updated_at=long_ago)
+        analytics.rebuild()
+
+        row = f'{timezone.localdate():%d/%m/%Y},CK {order.order_id},{order.price},FT002'
+        with self.captureOnCommitCallbacks():
+            reconcile.import_statement(statement(row), 'sk.csv', self.artist)
+
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'in_progress')
+        self.assertGreater(order.updated_at, long_ago)
+        analytics.refresh()
+        current = MonthlyStat.objects.get(period=analytics.month_start(timezone.now()), service_type=None)
+        self.assertEqual((current.payments_verified, current.revenue), (1, order.price))
+
+    def make_dated_payment(self, order_id, day, amount=100000):
+        order = Order(customer=self.customer, service_type=self.service, description='cũ', price=amount,
+                      status='approved')
+        order.order_id = order_id
+        order.save()
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.make_aware(datetime(*day, 10)))
+        return Payment.objects.create(order=order, amount=amount, proof_image=png_file('proof.png'))
+
+    def match(self, *rows):
+        lines = reconcile.match_lines(reconcile.read_statement(statement(*rows), 'sk.csv'), reconcile.pending_index())
+        return [(entry['result'], entry['payment'] and entry['payment']['id']) for entry in lines]
+
+    def test_short_code_shared_by_two_days_is_ambiguous(self):
+        first = self.make_dated_payment('DH-20261001-00023', (2026, 10, 1))
+        second = self.make_dated_payment('DH-20261005-00023', (2026, 10, 5))
+        self.assertEqual(self.match(',CK DH00023,100000,'), [('ambiguous', None)])
+        # Ngày chuyển khoản loại được đơn tạo sau đó
+        self.assertEqual(self.match('03/10/2026,CK DH00023,100.000,'), [('matched', first.pk)])
+        self.assertEqual(self.match('06/10/2026,CK DH00023,100000,'), [('ambiguous', None)])
+        # Mã đầy đủ có ngày thì không nhầm
+        self.assertEqual(self.match('06/10/2026,CK DH-20261005-00023,100000,'), [('matched', second.pk)])
+
+    def test_duplicate_mismatch_and_unmatched_lines(self):
+        payment = self.make_dated_payment('DH-20261001-00023', (2026, 10, 1))
+        self.assertEqual(self.match(
+            ',CK DH00023,100000,',
+            ',chuyen lai DH 20261001 00023,100000,',
+            ',DH00023 thieu,50000,',
+            ',DH99999,100000,',
+            ',tien nha,100000,',
+            ',DH000231,100000,',
+        ), [
+            ('matched', payment.pk),
+            ('duplicate', payment.pk),
+            ('amount_mismatch', None),
+            ('unmatched', None),
+            ('unmatched', None),
+            ('unmatched', None),
+        ])
+        lines = reconcile.match_lines(
+            reconcile.read_statement(statement(',CK DH00023,100000,', ',CK DH00023,100000,'), 'sk.csv'),
+            reconcile.pending_index(),
+        )
+        # Dòng trùng không xác thực thêm lần nữa
+        self.assertEqual(reconcile.verify_matches(lines, self.artist), 1)
+
+
+# ============= XUẤT DỮ LIỆU =============
+
+class ExportTests(BaseTestCase):
+    def setUp(self):
+        self.orders = [self.make_order(description=f'Đơn {i}') for i in range(7)]
+        self.client.force_login(self.artist)
+
+    def download(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_keyset_batches(self):
+        ids = [order.pk for order in self.orders]
+        with CaptureQueriesContext(connection) as queries:
+            rows = list(exports.iterate_rows(Order.objects.all(), ['pk'], batch_size=3))
+        self.assertEqual([row[0] for row in rows], ids[::-1])
+        # 3 + 3 + 1 dòng; lô sau lọc theo khoá chính thay vì OFFSET
+        self.assertEqual(len(queries), 3)
+        self.assertNotIn('OFFSET', queries[-1]['sql'])
+        rows = list(exports.iterate_rows(Order.objects.filter(pk__gt=ids[0]), ['pk'], descending=False, batch_size=3))
+        self.assertEqual([row[0] for row in rows], ids[1:])
+
+    def test_csv_rows_and_formula_guard(self):
+        Order.objects.filter(pk=self.orders[0].pk).update(description='=HYPERLINK("http://x","y")')
+        Order.objects.filter(pk=self.orders[1].pk).update(description='-2+3')
+        with mock.patch('core.exports.FLUSH_ROWS', 2):
+            content = self.download(reverse('export_data', args=['orders', 'csv']) + '?sort=oldest')
+
+        self.assertTrue(content.startswith('\ufeff'.encode()))
+        rows = list(csv.reader(io.StringIO(content.decode('utf-8-sig'))))
+        self.assertEqual(rows[0][:2], ['Mã đơn', 'Khách hàng'])
+        self.assertEqual([row[0] for row in rows[1:]], [order.order_id for order in self.orders])
+        self.assertEqual(rows[1][-1], '\'=HYPERLINK("http://x","y")')
+        self.assertEqual(rows[2][-1], "'-2+3")
+        self.assertEqual(rows[3][-1], 'Đơn 2')
+        self.assertEqual((rows[1][4], rows[1][5]), ('Chờ duyệt', '100000'))
+
+    def test_xlsx_is_a_valid_workbook(self):
+        Order.objects.filter(pk=self.orders[0].pk).update(description='<b>A & B</b>\x01')
+        with mock.patch('core.exports.FLUSH_ROWS', 2):
+            content = self.download(reverse('export_data', args=['orders', 'xlsx']))
+
+        ns = {'s': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertIn('[Content_Types].xml', archive.namelist())
+            workbook = ElementTree.fromstring(archive.read('xl/workbook.xml'))
+            sheet = ElementTree.fromstring(archive.read('xl/worksheets/sheet1.xml'))
+        self.assertEqual(workbook.find('s:sheets/s:sheet', ns).get('name'), 'Đơn hàng')
+
+        rows = sheet.findall('s:sheetData/s:row', ns)
+        self.assertEqual(len(rows), 1 + len(self.orders))
+
+        def cells(row):
+            return [cell.findtext('s:is/s:t', namespaces=ns) or cell.findtext('s:v', namespaces=ns)
+                    for cell in row.findall('s:c', ns)]
+
+        last = cells(rows[-1])
+        self.assertEqual(last[0], self.orders[0].order_id)
+        self.assertEqual(last[-1], '<b>A & B</b>')
+        # Số ghi dạng số, không phải chuỗi
+        self.assertIsNone(rows[-1].findall('s:c', ns)[5].get('t'))
+        self.assertEqual(last[5], '100000')
+
+    def test_unknown_dataset(self):
+        self.assertEqual(self.client.get(reverse('export_data', args=['users', 'csv'])).status_code, 404)
+
+
+# ============= SỐ LIỆU REQUEST =============
+
+class MetricsTests(BaseTestCase):
+    LABELS = (('view', 'home'),)
+
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def test_render_prometheus_text(self):
+        metrics.observe('request_duration_seconds', self.LABELS, 0.02)
+        metrics.observe('request_duration_seconds', self.LABELS, 3)
+        metrics.increment('requests_total', self.LABELS + (('status', '2xx'),), 2)
+        metrics.increment('db_queries_total', (('view', 'a"b\\c\nd'),), 4)
+
+        lines = metrics.render().splitlines()
+        name = 'duyhoangsite_request_duration_seconds'
+        self.assertIn(f'# TYPE {name} histogram', lines)
+        self.assertIn(f'{name}_bucket{{view="home",le="0.01"}} 0', lines)
+        self.assertIn(f'{name}_bucket{{view="home",le="0.025"}} 1', lines)
+        self.assertIn(f'{name}_bucket{{view="home",le="2.5"}} 1', lines)
+        self.assertIn(f'{name}_bucket{{view="home",le="5"}} 2', lines)
+        self.assertIn(f'{name}_bucket{{view="home",le="+Inf"}} 2', lines)
+        self.assertIn(f'{name}_sum{{view="home"}} 3.02', lines)
+        self.assertIn(f'{name}_count{{view="home"}} 2', lines)
+        self.assertIn('# TYPE duyhoangsite_requests_total counter', lines)
+        self.assertIn('duyhoangsite_requests_total{view="home",status="2xx"} 2', lines)
+        self.assertIn('duyhoangsite_db_queries_total{view="a\\"b\\\\c\\nd"} 4', lines)
+
+    def test_thread_shards_are_summed(self):
+        def work():
+            for _ in range(100):
+                metrics.observe('request_db_seconds', self.LABELS, 0.001)
+                metrics.increment('requests_total', self.LABELS)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        work()
+
+        for _ in range(2):
+            # Lần đọc thứ 2: số liệu của thread đã kết thúc nằm ở bộ chung, không mất cũng không cộng lặp
+            total = metrics.collect()
+            self.assertEqual(total.counters[('requests_total', self.LABELS)], 500)
+            self.assertEqual(sum(total.histograms[('request_db_seconds', self.LABELS)][:-1]), 500)
+        self.assertFalse(any(shard.thread in threads for shard in metrics._shards))
+
+    def test_server_timing_only_for_staff_or_debug(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('home')))
+
+        staff = User.objects.create_user('staff', password='pw', is_staff=True)
+        self.client.force_login(self.customer)
+        self.assertNotIn('Server-Timing', self.client.get(reverse('home')))
+        self.client.force_login(staff)
+        self.assertIn('db;dur=', self.client.get(reverse('home'))['Server-Timing'])
+
+        self.client.logout()
+        with self.settings(METRICS_SERVER_TIMING=True):
+            self.assertIn('Server-Timing', self.client.get(reverse('home')))
+        # Số liệu vẫn được ghi khi không gửi header
+        self.assertEqual(metrics.collect().counters[('requests_total', (('view', 'home'), ('status', '2xx')))], 4)
+
+    @override_settings(METRICS_TOKEN='token')
+    def test_scrape_needs_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer token')
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        self.assertIn(b'# TYPE duyhoangsite_requests_total counter', response.content)
+
+
+# ============= DỮ LIỆU VÀ ĐO BENCHMARK =============
+
+class BenchTests(BaseTestCase):
+    def seed(self, **options):
+        options = {'customers': 3, 'orders_per_customer': 4, 'messages_per_order': 2, 'services': 2,
+                   'samples': 3, 'days': 60, **options}
+        call_command('seed_bench', stdout=io.StringIO(), **options)
+
+    def test_seed_bench_builds_consistent_data(self):
+        self.seed()
+        orders = Order.objects.filter(customer__username__startswith='bench_')
+        self.assertEqual(User.objects.filter(username__startswith='bench_customer_').count(), 3)
+        self.assertEqual(orders.count(), 12)
+        self.assertTrue(all(re.fullmatch(r'DH-\d{8}-\d{5}', order_id) for order_id in orders.values_list('order_id', flat=True)))
+        # Dữ liệu dẫn xuất được dựng lại sau bulk_create
+        self.assertEqual(counters.verify(), {})
+        self.assertEqual(SearchDocument.objects.filter(kind='order').count(), 12)
+        self.assertTrue(MonthlyStat.objects.exists())
+
+        with self.assertRaises(CommandError):
+            self.seed()
+        self.seed(flush=True, customers=2)
+        self.assertEqual(orders.count(), 8)
+        # Mã đơn mới nối tiếp số thứ tự đã cấp
+        self.make_order()
+        self.assertEqual(counters.verify(), {})
+
+    def test_bench_views_writes_baseline_and_compares(self):
+        self.seed()
+        output = os.path.join(TEST_MEDIA_ROOT, 'baseline.json')
+        options = {'iterations': 2, 'warmup': 0, 'only': 'home,artist_orders,order_detail,logout',
+                   'output': output, 'stdout': io.StringIO()}
+        call_command('bench_views', **options)
+
+        with open(output, encoding='utf-8') as f:
+            baseline = json.load(f)
+        self.assertEqual(set(baseline['views']), {'home', 'artist_orders', 'order_detail'})
+        self.assertEqual(set(baseline['skipped']), {'logout'})
+        detail = baseline['views']['order_detail']
+        self.assertEqual((detail['status'], detail['role']), (200, 'customer'))
+        self.assertGreater(detail['queries'], 0)
+        self.assertLessEqual(detail['p50_ms'], detail['p95_ms'])
+        self.assertEqual(baseline['data']['orders'], 12)
+
+        # Baseline cũ ít query hơn: --compare báo lỗi
+        baseline['views']['order_detail']['queries'] = 0
+        old = os.path.join(TEST_MEDIA_ROOT, 'old.json')
+        with open(old, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f)
+        with self.assertRaisesMessage(CommandError, 'order_detail: query 0 ->'):
+            call_command('bench_views', compare=old, **options)
+
+    def test_regressions_ignore_small_slowdowns(self):
+        def run(p95, queries=3, status=200):
+            return {'views': {'home': {'p95_ms': p95, 'queries': queries, 'status': status}}}
+
+        self.assertEqual(bench_views.regressions(run(10), run(14), 0.25), [])
+        self.assertEqual(bench_views.regressions(run(100), run(120), 0.25), [])
+        self.assertEqual([reason for _, reason in bench_views.regressions(run(100), run(140), 0.25)],
+                         ['p95 100.0ms -> 140.0ms'])
+        self.assertEqual(len(bench_views.regressions(run(10), run(10, queries=4, status=500), 0.25)), 2)
+
+
+# ============= NGÂN SÁCH QUERY =============
+
+@override_settings(METRICS_TOKEN='token')
+class QueryBudgetTests(BaseTestCase):
+    """Mỗi tên URL trong QUERY_BUDGETS được gọi (GET và POST chính) trong query_budget(tên)"""
+
+    ROWS = 6
+
+    def setUp(self):
+        cache.clear()
+        proof = ProtectedMediaStorage().save('payments/proof.png', png_file('proof.png'))
+        image = ContentAddressedStorage().save('samples/sample.png', png_file('sample.png'))
+        customers = [self.customer] + [
+            User.objects.create_user(f'customer{i}', password='pw', user_type='customer') for i in range(self.ROWS)
+        ]
+        for i in range(self.ROWS):
+            ServiceType.objects.create(name=f'Dịch vụ {i}', description='Mô tả', price=100000)
+            Sample.objects.create(service_type=self.service, title=f'Mẫu {i}', image=image, display_order=i)
+        orders = []
+        for customer in customers:
+            order = self.make_order(customer=customer, status='approved')
+            Payment.objects.create(order=order, amount=order.price, proof_image=proof)
+            for i in range(self.ROWS):
+                Message.objects.create(order=order, sender=customer, content=f'sketch {i}')
+                Message.objects.create(order=order, sender=self.artist, content=f'trả lời {i}')
+            orders.append(order)
+        self.order = orders[0]
+        for i in range(self.ROWS):
+            OrderProgress.objects.create(order=self.order, image=proof, note=f'Bước {i}', created_by=self.artist)
+        self.unpaid = self.make_order(status='approved')
+        self.unread = self.make_order(status='in_progress')
+        for i in range(self.ROWS):
+            Message.objects.create(order=self.unread, sender=self.artist, content=f'mới {i}')
+        self.payment = self.order.payment
+        TermsOfService.objects.create(content='Điều khoản', version='v1', is_active=True)
+        self.job = Job.objects.create(name='analytics.refresh', status='done', owner=self.artist, result={})
+        self.upload = uploads.create_upload(self.customer, 'brief', 'brief.png', 1024)
+        self.brief = self.completed_upload(self.customer, 'brief')
+        self.step = self.completed_upload(self.artist, 'progress')
+
+    def completed_upload(self, owner, purpose):
+        content = png_file(f'{purpose}.png', '#444444').read()
+        upload = uploads.create_upload(owner, purpose, f'{purpose}.png', len(content))
+        return uploads.write_chunk(upload, 0, io.BytesIO(content), len(content))
+
+    def scenarios(self):
+        """(tên URL, vai trò, method, path, data)"""
+        order, unpaid, upload = self.order, self.unpaid, self.upload
+        url = lambda name, *args: reverse(name, args=args)  # noqa: E731
+        return [
+            ('home', None, 'get', url('home'), {}),
+            ('register', None, 'get', url('register'), {}),
+            ('register', None, 'post', url('register'), {
+                'username': 'newcustomer', 'email': 'new@example.com', 'phone': '0900000000',
+                'password1': 'Xk9!pass-word', 'password2': 'Xk9!pass-word',
+            }),
+            ('login', None, 'get', url('login'), {}),
+            ('login', None, 'post', url('login'), {'username': 'customer', 'password': 'pw'}),
+            ('tos', None, 'get', url('tos'), {}),
+            ('check_username', None, 'get', url('check_username'), {'username': 'customer'}),
+            ('metrics', None, 'get', url('metrics'), {}),
+
+            ('customer_dashboard', 'customer', 'get', url('customer_dashboard'), {}),
+            ('create_order', 'customer', 'get', url('create_order'), {}),
+            ('create_order', 'customer', 'post', url('create_order'), {
+                'service_type': self.service.pk, 'description': 'Vẽ chân dung', 'brief_file': png_file('brief.png'),
+            }),
+            ('create_order', 'customer', 'post', url('create_order'),
+             {'service_type': self.service.pk, 'description': 'Vẽ chân dung', 'upload_id': self.brief.pk}),
+            ('order_detail', 'customer', 'get', url('order_detail', order.pk), {}),
+            ('upload_payment', 'customer', 'get', url('upload_payment', unpaid.pk), {}),
+            ('upload_payment', 'customer', 'post', url('upload_payment', unpaid.pk), {
+                'amount': unpaid.price, 'transaction_id': 'FT123', 'proof_image': png_file('new-proof.png', '#111111'),
+            }),
+            ('send_message', 'customer', 'post', url('send_message', order.pk), {'content': 'Cảm ơn'}),
+            ('order_events', 'customer', 'get', url('order_events', order.pk), {}),
+            ('order_messages', 'customer', 'get', url('order_messages', order.pk), {'after': 0}),
+            # Đơn chưa có ReadCursor: đường tạo cursor tốn query nhất
+            ('mark_messages_read', 'customer', 'post', url('mark_messages_read', self.unread.pk),
+             {'last_id': self.unread.messages.last().pk}),
+            ('upload_create', 'customer', 'post', url('upload_create'),
+             {'purpose': 'brief', 'filename': 'b.png', 'size': 10}),
+            ('upload_detail', 'customer', 'get', url('upload_detail', upload.pk), {}),
+            ('protected_media', 'customer', 'get', self.payment.proof_image.url, {}),
+            ('logout', 'customer', 'get', url('logout'), {}),
+
+            ('artist_dashboard', 'artist', 'get', url('artist_dashboard'), {}),
+            ('artist_messages', 'artist', 'get', url('artist_messages'), {}),
+            ('artist_profile', 'artist', 'get', url('artist_profile'), {}),
+            ('artist_profile', 'artist', 'post', url('artist_profile'), {
+                'bio': 'Họa sĩ', 'bank_name': 'VCB', 'bank_account_number': '0123', 'bank_account_name': 'A',
+            }),
+            ('manage_services', 'artist', 'get', url('manage_services'), {}),
+            ('add_service', 'artist', 'get', url('add_service'), {}),
+            ('add_service', 'artist', 'post', url('add_service'),
+             {'name': 'Mới', 'description': 'Mô tả', 'price': 5000, 'is_active': 'on'}),
+            ('edit_service', 'artist', 'get', url('edit_service', self.service.pk), {}),
+            ('edit_service', 'artist', 'post', url('edit_service', self.service.pk),
+             {'name': 'Sketch', 'description': 'Mô tả', 'price': 120000, 'is_active': 'on'}),
+            ('manage_samples', 'artist', 'get', url('manage_samples'), {}),
+            ('add_sample', 'artist', 'get', url('add_sample'), {}),
+            ('add_sample', 'artist', 'post', url('add_sample'), {
+                'service_type': self.service.pk, 'title': 'Mẫu mới', 'image': png_file('new.png', '#222222'),
+                'description': '', 'display_order': 0,
+            }),
+            ('manage_tos', 'artist', 'get', url('manage_tos'), {}),
+            ('manage_tos', 'artist', 'post', url('manage_tos'),
+             {'content': 'Điều khoản mới', 'version': 'v2', 'is_active': 'on'}),
+            ('artist_orders', 'artist', 'get', url('artist_orders'), {}),
+            ('artist_order_detail', 'artist', 'get', url('artist_order_detail', order.pk), {}),
+            ('artist_order_detail', 'artist', 'post', url('artist_order_detail', order.pk),
+             {'send_message': '1', 'content': 'Đang vẽ'}),
+            ('approve_order', 'artist', 'get', url('approve_order', unpaid.pk), {}),
+            ('approve_order', 'artist', 'post', url('approve_order', unpaid.pk),
+             {'approve': 'on', 'price': 150000, 'admin_note': 'OK'}),
+            ('update_order_status', 'artist', 'get', url('update_order_status', order.pk), {}),
+            ('update_order_status', 'artist', 'post', url('update_order_status', order.pk),
+             {'status': 'in_progress', 'admin_note': ''}),
+            ('add_progress', 'artist', 'get', url('add_progress', order.pk), {}),
+            ('add_progress', 'artist', 'post', url('add_progress', order.pk),
+             {'image': png_file('step.png', '#333333'), 'note': 'Lineart'}),
+            ('add_progress', 'artist', 'post', url('add_progress', order.pk),
+             {'upload_id': self.step.pk, 'note': 'Tô màu', 'is_final': 'on'}),
+            ('artist_payments', 'artist', 'get', url('artist_payments'), {'status': ''}),
+            ('verify_payment', 'artist', 'get', url('verify_payment', self.payment.pk), {}),
+            ('verify_payment', 'artist', 'post', url('verify_payment', self.payment.pk),
+             {'verify': 'on', 'admin_note': 'Đã nhận'}),
+            ('manage_customers', 'artist', 'get', url('manage_customers'), {}),
+            ('artist_search', 'artist', 'get', url('artist_search'), {'q': 'sketch'}),
+            ('artist_reports', 'artist', 'get', url('artist_reports'), {}),
+            ('job_detail', 'artist', 'get', url('job_detail', self.job.pk), {}),
+        ]
+
+    def test_every_budgeted_view_stays_within_budget(self):
+        users = {'customer': self.customer, 'artist': self.artist}
+        covered = set()
+        for name, role, method, path, data in self.scenarios():
+            covered.add(name)
+            client = Client(HTTP_AUTHORIZATION='Bearer token')
+            if role:
+                client.force_login(users[role])
+            with self.subTest(name=name, method=method):
+                with query_budget(name):
+                    response = getattr(client, method)(path, data)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                self.assertLess(response.status_code, 500)
+                # POST hợp lệ chuyển trang; form lỗi (200) thì không đo được đường ghi
+                if method == 'post' and not response.headers.get('Content-Type', '').startswith('application/json'):
+                    self.assertEqual(response.status_code, 302, response.content[:2000])
+        self.assertEqual(set(settings.QUERY_BUDGETS) - covered, set())
@@ -0,0 +1,263 @@
+"""
+Upload chia nhỏ, tiếp tục được khi mất mạng (giao thức kiểu tus)
+
+    POST   /uploads/               purpose, filename, size -> 201 {id, offset, chunk_size}
+    HEAD   /uploads/<id>/          -> Upload-Offset: số byte server đã nhận
+    PATCH  /uploads/<id>/          Upload-Offset: n, Upload-Checksum: sha256 <base64>, body = chunk
+    DELETE /uploads/<id>/          huỷ
+
+Mỗi chunk được ghi thẳng ra đĩa (UPLOAD_TEMP_DIR/<id>/<số thứ tự>.chunk) trong lúc
+đọc request, kèm SHA-256; khi đủ `size` byte thì nối thành 1 file. File đó được
+chuyển (rename, không copy) vào storage của field khi form được lưu. Không bước
+nào giữ cả file trong bộ nhớ.
+
+Dọn upload bỏ dở: python manage.py purge_uploads
+"""
+
+import base64
+import binascii
+import hashlib
+import os
+import shutil
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.validators import validate_image_file_extension
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from .media import MovableFile
+
+READ_BLOCK_SIZE = 64 * 1024
+
+# Mục đích upload -> (loại user được phép, field đích)
+PURPOSES = {
+    'brief': ('customer', 'brief_file'),
+    'progress': ('artist', 'image'),
+}
+
+
+class UploadError(Exception):
+    """Lỗi giao thức upload; `status` là HTTP status trả về cho client"""
+    status = 400
+
+
+class OffsetMismatch(UploadError):
+    status = 409
+
+
+class ChecksumMismatch(UploadError):
+    # Mã của tus cho "Checksum Mismatch"
+    status = 460
+
+
+class UploadTooLarge(UploadError):
+    status = 413
+
+
+def upload_dir(upload):
+    return os.path.join(settings.UPLOAD_TEMP_DIR, str(upload.id))
+
+
+def assembled_path(upload):
+    return os.path.join(upload_dir(upload), 'assembled')
+
+
+def chunk_path(upload, index):
+    return os.path.join(upload_dir(upload), f'{index:06d}.chunk')
+
+
+def upload_state(upload):
+    return {
+        'id': str(upload.id),
+        'offset': upload.offset,
+        'size': upload.size,
+        'status': upload.status,
+        'chunk_size': settings.UPLOAD_CHUNK_SIZE,
+    }
+
+
+def create_upload(owner, purpose, filename, size):
+    from .models import Upload
+
+    if purpose not in PURPOSES or owner.user_type != PURPOSES[purpose][0]:
+        raise UploadError("Loại upload không hợp lệ.")
+    filename = os.path.basename(filename or '').strip()
+    if not filename:
+        raise UploadError("Thiếu tên file.")
+    if size <= 0:
+        raise UploadError("File rỗng.")
+    if size > settings.UPLOAD_MAX_SIZE:
+        raise UploadTooLarge(f"File quá lớn (tối đa {settings.UPLOAD_MAX_SIZE // (1024 * 1024)}MB).")
+    if purpose == 'progress':
+        try:
+            validate_image_file_extension(File(None, name=filename))
+        except ValidationError as error:
+            raise UploadError(error.messages[0])
+
+    upload = Upload.objects.create(owner=owner, purpose=purpose, filename=filename[:255], size=size)
+    os.makedirs(upload_dir(upload), exist_ok=True)
+    return upload
+
+
+def parse_checksum(header):
+    """'sha256 <base64>' -> digest hex; None nếu client không gửi"""
+    if not header:
+        return None
+    algorithm, _, value = header.strip().partition(' ')
+    if algorithm.lower() != 'sha256':
+        raise UploadError("Chỉ hỗ trợ checksum sha256.")
+    try:
+        return base64.b64decode(value, validate=True).hex()
+    except (binascii.Error, ValueError):
+        raise UploadError("Checksum không hợp lệ.")
+
+
+def write_chunk(upload, offset, stream, length, checksum=None):
+    """
+    Ghi `length` byte từ `stream` (request) thành chunk tiếp theo bắt đầu tại `offset`.
+    Đọc request trước, ngoài transaction (mạng di động có thể chậm), rồi mới
+    khoá dòng Upload để xác nhận chunk. Trả về upload đã cập nhật.
+    """
+    from .models import Upload
+
+    if upload.status != 'uploading':
+        raise OffsetMismatch("Upload đã hoàn tất.")
+    if offset != upload.offset:
+        raise OffsetMismatch(f"Server đang ở byte {upload.offset}.")
+    if length <= 0 or length > settings.UPLOAD_CHUNK_SIZE:
+        raise UploadTooLarge("Chunk rỗng hoặc quá lớn.")
+    if offset + length > upload.size:
+        raise UploadTooLarge("Chunk vượt quá kích thước file đã khai báo.")
+
+    temp_chunk = os.path.join(upload_dir(upload), f'{uuid.uuid4().hex}.tmp')
+    digest = hashlib.sha256()
+    received = 0
+    try:
+        with open(temp_chunk, 'wb') as f:
+            while received < length:
+                block = stream.read(min(READ_BLOCK_SIZE, length - received))
+                if not block:
+                    break
+                digest.update(block)
+                f.write(block)
+                received += len(block)
+        if received != length:
+            raise UploadError("Kết nối bị ngắt giữa chừng, hãy gửi lại chunk.")
+        if checksum is not None and digest.hexdigest() != checksum:
+            raise ChecksumMismatch("Checksum của chunk không khớp, hãy gửi lại.")
+
+        with transaction.atomic():
+            upload = Upload.objects.select_for_update().get(pk=upload.pk)
+            if upload.status != 'uploading' or upload.offset != offset:
+                # Một request khác (VD client gửi lại) đã ghi chunk này trước
+                raise OffsetMismatch(f"Server đang ở byte {upload.offset}.")
+            os.replace(temp_chunk, chunk_path(upload, len(upload.chunk_checksums)))
+            upload.chunk_checksums.append(digest.hexdigest())
+            upload.offset += length
+            upload.save(update_fields=['chunk_checksums', 'offset', 'updated_at'])
+    finally:
+        if os.path.exists(temp_chunk):
+            os.remove(temp_chunk)
+
+    if upload.offset == upload.size:
+        assemble(upload)
+    return upload
+
+
+def assemble(upload):
+    """
+    Nối các chunk thành 1 file (đọc/ghi theo khối), kiểm tra ảnh nếu cần.
+    Chunk trên đĩa bị mất / hỏng (khác checksum lúc nhận) thì upload quay về
+    byte 0 và raise ChecksumMismatch: client gửi lại từ offset server báo.
+    """
+    path = assembled_path(upload)
+    digest = hashlib.sha256()
+    damaged = False
+    try:
+        with open(path, 'wb') as out:
+            for index, expected in enumerate(upload.chunk_checksums):
+                chunk_digest = hashlib.sha256()
+                with open(chunk_path(upload, index), 'rb') as chunk:
+                    while block := chunk.read(READ_BLOCK_SIZE):
+                        digest.update(block)
+                        chunk_digest.update(block)
+                        out.write(block)
+                if chunk_digest.hexdigest() != expected:
+                    damaged = True
+                    break
+    except FileNotFoundError:
+        damaged = True
+    if damaged or os.path.getsize(path) != upload.size:
+        restart(upload)
+        raise ChecksumMismatch("File ghép lại bị hỏng, hãy gửi lại từ đầu.")
+
+    if upload.purpose == 'progress':
+        try:
+            with Image.open(path) as image:
+                image.verify()
+        except Exception:
+            discard(upload)
+            raise UploadError("File không phải ảnh hợp lệ.")
+
+    for index in range(len(upload.chunk_checksums)):
+        os.remove(chunk_path(upload, index))
+    upload.sha256 = digest.hexdigest()
+    upload.status = 'complete'
+    upload.save(update_fields=['sha256', 'status', 'updated_at'])
+
+
+def restart(upload):
+    """Xoá dữ liệu đã nhận, đưa upload về byte 0 để client gửi lại"""
+    shutil.rmtree(upload_dir(upload), ignore_errors=True)
+    os.makedirs(upload_dir(upload), exist_ok=True)
+    upload.offset = 0
+    upload.chunk_checksums = []
+    upload.status = 'uploading'
+    upload.save(update_fields=['offset', 'chunk_checksums', 'status', 'updated_at'])
+
+
+def completed_upload(upload_id, owner, purpose):
+    """Upload đã nhận đủ của `owner` dùng cho form; ValidationError nếu chưa dùng được"""
+    from .models import Upload
+
+    upload = Upload.objects.filter(id=upload_id, owner=owner, purpose=purpose).first()
+    if upload is None:
+        raise ValidationError("Không tìm thấy file đã upload, vui lòng chọn lại.")
+    if upload.status == 'attached':
+        raise ValidationError("File này đã được dùng, vui lòng chọn lại.")
+    if upload.status != 'complete':
+        raise ValidationError("File chưa upload xong.")
+    return upload
+
+
+def attach(upload, instance, field_name=None):
+    """Chuyển file đã ghép vào field của instance (chưa save instance)"""
+    field_name = field_name or PURPOSES[upload.purpose][1]
+    with open(assembled_path(upload), 'rb') as f:
+        getattr(instance, field_name).save(upload.filename, MovableFile(f, name=upload.filename), save=False)
+    shutil.rmtree(upload_dir(upload), ignore_errors=True)
+    upload.status = 'attached'
+    upload.save(update_fields=['status', 'updated_at'])
+
+
+def discard(upload):
+    shutil.rmtree(upload_dir(upload), ignore_errors=True)
+    upload.delete()
+
+
+def purge_expired(now=None):
+    """Xoá upload bỏ dở / đã gắn quá UPLOAD_EXPIRY_HOURS. Trả về số upload đã xoá."""
+    from .models import Upload
+
+    cutoff = (now or timezone.now()) - timedelta(hours=settings.UPLOAD_EXPIRY_HOURS)
+    expired = Upload.objects.filter(updated_at__lt=cutoff)
+    count = 0
+    for upload in expired.iterator():
+        discard(upload)
+        count += 1
+    return count
@@ -33,7 +33,27 @@ urlpatterns = [
     path('artist/order/<int:order_id>/progress/', views.add_progress, name='add_progress'),
     path('artist/payments/', views.artist_payments, name='artist_payments'),
     path('artist/payment/<int:payment_id>/verify/', views.verify_payment, name='verify_payment'),
+    path('artist/payments/import/', views.import_statement, name='import_statement'),
     path('artist/customers/', views.manage_customers, name='manage_customers'),
+    path('artist/search/', views.artist_search, name='artist_search'),
+    path('artist/reports/', views.artist_reports, name='artist_reports'),
+    path('artist/export/<slug:dataset>.<slug:file_format>', views.export_data, name='export_data'),
 
      path('check-username/', views.check_username, name='check_username'),
+     path('jobs/<int:job_id>/', views.job_detail, name='job_detail'),
+
+    # Real-time chat
+    path('order/<int:order_id>/events/', views.order_events, name='order_events'),
+    path('order/<int:order_id>/messages/', views.order_messages, name='order_messages'),
+    path('order/<int:order_id>/read/', views.mark_messages_read, name='mark_messages_read'),
+
+    # Upload chia nhỏ, tiếp tục được (brief, ảnh tiến độ)
+    path('uploads/', views.upload_create, name='upload_create'),
+    path('uploads/<uuid:upload_id>/', views.upload_detail, name='upload_detail'),
+
+    # Số liệu cho Prometheus (core/metrics.py)
+    path('metrics', views.metrics_view, name='metrics'),
+
+    # Media được bảo vệ (PROTECTED_MEDIA_URL)
+    path('protected-media/<path:name>', views.protected_media, name='protected_media'),
 ]
\ No newline at end of file
@@ -1,64 +1,217 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.db.models import Q, Count  # ← QUAN TRỌNG!
+from django.db.models import Q, Count, Sum, Value, DecimalField, OuterRef, Subquery  # ← QUAN TRỌNG!
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from .models import *
 from .forms import *
+from .jobs import enqueue, job_status
+from .cache import PAGE_TIMEOUT, get_generation, is_cacheable_request, versioned_key
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_http_methods, require_POST
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import quote_etag
+from .pagination import KeysetPaginator
+from .realtime import message_event, order_event_stream, publish_order_event, status_event, streaming_supported
+from .routers import read_replica
+from . import analytics, exports, media, metrics, reconcile, search, uploads
+from . import counters
+import re
+from datetime import datetime, time, timedelta
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 
 # ============= HELPER FUNCTIONS =============
+CURSOR_RE = re.compile(r'^[A-Za-z0-9_-]{1,200}$')
+
+# Các kiểu sắp xếp danh sách khách hàng (?sort=...)
+CUSTOMER_SORTS = {
+    'spent': ('-total_spent', '-id'),
+    'orders': ('-total_orders', '-id'),
+    'newest': ('-date_joined', '-id'),
+    'username': ('username',),
+}
+
+# Danh sách của artist (đơn hàng, thanh toán, samples)
+ARTIST_PAGE_SIZE = 25
+
+# Các kiểu sắp xếp danh sách đơn hàng (?sort=...), khớp index (status|customer, created_at)
+ORDER_SORTS = {
+    'newest': ('-created_at', '-id'),
+    'oldest': ('created_at', 'id'),
+}
+
+# Số tin nhắn mỗi lần tải (trang chi tiết đơn và feed JSON)
+MESSAGE_PAGE_SIZE = 30
+
 def is_artist(user):
     return user.is_authenticated and user.user_type == 'artist'
 
 def is_customer(user):
     return user.is_authenticated and user.user_type == 'customer'
 
+def with_unread_count(orders, participant):
+    """
+    Annotate unread_count: số tin của bên kia có id > cursor đã đọc của `participant`.
+    Mỗi đơn là một lần quét theo index (order, sender_type, id).
+    """
+    last_read = ReadCursor.objects.filter(
+        order=OuterRef('order_id'), participant=participant
+    ).values('last_read_id')[:1]
+    unread = Message.objects.filter(
+        order=OuterRef('pk'),
+        sender_type=ReadCursor.other_side(participant),
+        id__gt=Coalesce(Subquery(last_read), Value(0)),
+    ).order_by().values('order').annotate(total=Count('id')).values('total')
+    return orders.annotate(unread_count=Coalesce(Subquery(unread), Value(0)))
+
+def apply_list_filters(queryset, filters, customer_field='customer'):
+    """
+    Lọc theo khoảng ngày tạo và tên khách (cleaned_data của DateRangeFilterForm).
+    Ngày được đổi thành mốc giờ địa phương để so sánh trực tiếp trên cột created_at
+    (dùng được index), thay vì created_at__date.
+    """
+    tz = timezone.get_current_timezone()
+    if filters.get('date_from'):
+        start = datetime.combine(filters['date_from'], time.min, tzinfo=tz)
+        queryset = queryset.filter(created_at__gte=start)
+    if filters.get('date_to'):
+        end = datetime.combine(filters['date_to'] + timedelta(days=1), time.min, tzinfo=tz)
+        queryset = queryset.filter(created_at__lt=end)
+    if filters.get('customer'):
+        customers = User.objects.filter(user_type='customer', username__icontains=filters['customer'])
+        queryset = queryset.filter(**{f'{customer_field}__in': customers.values('id')})
+    return queryset
+
+def filtered_orders(filters):
+    """Đơn hàng theo bộ lọc của danh sách artist (cleaned_data của OrderFilterForm)"""
+    orders = Order.objects.all()
+    if filters.get('status'):
+        orders = orders.filter(status=filters['status'])
+    if filters.get('service'):
+        orders = orders.filter(service_type=filters['service'])
+    return apply_list_filters(orders, filters)
+
+def payment_filters(request):
+    """Bộ lọc thanh toán từ query string, mặc định chỉ các thanh toán chờ xác thực"""
+    data = request.GET.copy()
+    data.setdefault('status', 'pending')
+    form = PaymentFilterForm(data)
+    form.is_valid()
+    return form
+
+def filtered_payments(filters):
+    payments = Payment.objects.all()
+    if filters.get('status'):
+        payments = payments.filter(status=filters['status'])
+    return apply_list_filters(payments, filters, customer_field='order__customer')
+
+def customers_with_totals():
+    """Khách hàng kèm tổng số đơn / đơn hoàn thành / tổng chi, 1 query (conditional aggregation)"""
+    return User.objects.filter(user_type='customer').annotate(
+        total_orders=Count('orders'),
+        completed_orders=Count('orders', filter=Q(orders__status='completed')),
+        total_spent=Coalesce(
+            Sum('orders__price', filter=Q(orders__status='completed')),
+            Value(0),
+            output_field=DecimalField(max_digits=12, decimal_places=0),
+        ),
+    )
+
+def message_window(order, after=None, before=None, limit=MESSAGE_PAGE_SIZE):
+    """
+    Một trang tin nhắn của đơn, tăng dần theo id: tin mới hơn `after`, hoặc trang
+    mới nhất trước `before` (mặc định là trang mới nhất). Trả về (messages, has_more).
+    Lọc theo (order_id, id) nên chỉ quét đúng `limit` dòng trên index của order.
+    """
+    queryset = order.messages.select_related('sender')
+    if after is not None:
+        items = list(queryset.filter(id__gt=after).order_by('id')[:limit + 1])
+        return items[:limit], len(items) > limit
+    if before is not None:
+        queryset = queryset.filter(id__lt=before)
+    items = list(queryset.order_by('-id')[:limit + 1])
+    return items[:limit][::-1], len(items) > limit
+
+def is_ajax(request):
+    return request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+
+def enqueue_message_jobs(request, message):
+    """Xử lý ảnh đính kèm và thông báo tin nhắn mới ở background"""
+    if message.image:
+        enqueue('image.normalize', owner=request.user, model='core.Message', pk=message.id, field='image')
+    enqueue('notify.message', owner=request.user, message_id=message.id)
+
 # ============= PUBLIC VIEWS =============
+@read_replica
 def home(request):
     """Trang chủ - hiển thị samples và giá với filter"""
-    services = ServiceType.objects.filter(is_active=True)
+    # Lấy service filter và cursor phân trang từ URL parameter
+    selected_service = request.GET.get('service', '')
+    selected_service = int(selected_service) if selected_service.isdigit() else None
+    cursor = request.GET.get('cursor', '')
+    if not CURSOR_RE.match(cursor):
+        cursor = ''
+    as_json = request.GET.get('format') == 'json'
     
-    # Lấy service filter từ URL parameter
-    selected_service = request.GET.get('service')
+    # Khách chưa đăng nhập được phục vụ từ cache, key theo filter + cursor
+    cacheable = is_cacheable_request(request)
+    if cacheable:
+        cache_key = versioned_key('home', 'json' if as_json else 'html', selected_service or '', cursor)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            content, content_type = cached
+            response = HttpResponse(content, content_type=content_type)
+            patch_vary_headers(response, ['Cookie'])
+            return response
     
-    # Lọc samples theo service nếu có
+    samples_list = Sample.objects.select_related('service_type')
     if selected_service:
-        try:
-            selected_service = int(selected_service)
-            samples_list = Sample.objects.filter(
-                service_type_id=selected_service
-            ).select_related('service_type').order_by('display_order', '-id')
-        except (ValueError, TypeError):
-            # Nếu service ID không hợp lệ, hiện tất cả
-            samples_list = Sample.objects.select_related('service_type').order_by('display_order', '-id')
-            selected_service = None
-    else:
-        # Hiện tất cả samples
-        samples_list = Sample.objects.select_related('service_type').order_by('display_order', '-id')
-        selected_service = None
+        samples_list = samples_list.filter(service_type_id=selected_service)
     
-    # Pagination: 12 samples per page
-    paginator = Paginator(samples_list, 12)
-    page = request.GET.get('page')
+    # Keyset pagination: 12 samples mỗi lần, không dùng OFFSET/COUNT(*)
+    paginator = KeysetPaginator(samples_list, 12, ('display_order', '-id'))
+    samples = paginator.page(cursor)
     
-    try:
-        samples = paginator.page(page)
-    except PageNotAnInteger:
-        samples = paginator.page(1)
-    except EmptyPage:
-        samples = paginator.page(paginator.num_pages)
+    # Tổng số sample chỉ để hiển thị, được cache theo generation
+    total_samples = cache.get_or_set(
+        versioned_key('sample_count', selected_service or ''),
+        samples_list.count,
+        PAGE_TIMEOUT,
+    )
     
-    tos = TermsOfService.objects.filter(is_active=True).first()
+    if as_json:
+        # Dùng cho nút "Xem thêm" (infinite scroll)
+        html = render_to_string('partials/sample_items.html', {'samples': samples}, request=request)
+        response = JsonResponse({
+            'html': html,
+            'count': len(samples),
+            'next_cursor': samples.next_cursor,
+            'total': total_samples,
+        })
+    else:
+        services = ServiceType.objects.filter(is_active=True)
+        tos = TermsOfService.objects.filter(is_active=True).first()
+        
+        context = {
+            'services': services,
+            'samples': samples,
+            'total_samples': total_samples,
+            'tos': tos,
+            'selected_service': selected_service,  # ← THÊM DÒNG NÀY
+            'cursor': cursor,
+            'cache_generation': get_generation(),
+        }
+        response = render(request, 'home.html', context)
     
-    context = {
-        'services': services,
-        'samples': samples,
-        'tos': tos,
-        'selected_service': selected_service,  # ← THÊM DÒNG NÀY
-    }
-    return render(request, 'home.html', context)
+    if cacheable:
+        cache.set(cache_key, (response.content, response['Content-Type']), PAGE_TIMEOUT)
+    patch_vary_headers(response, ['Cookie'])
+    return response
 
 def register(request):
     """Đăng ký tài khoản khách hàng"""
@@ -107,40 +260,34 @@ def user_logout(request):
     messages.success(request, 'Đã đăng xuất thành công.')
     return redirect('home')
 
+@read_replica
 def tos_view(request):
     """Xem điều khoản dịch vụ"""
     tos = TermsOfService.objects.filter(is_active=True).first()
     return render(request, 'tos.html', {'tos': tos})
 
 # ============= CUSTOMER VIEWS =============
-from django.db.models import Count, Q
 
 @login_required
 @user_passes_test(is_customer)
+@read_replica
 def customer_dashboard(request):
     """Dashboard khách hàng"""
     # Lấy orders và annotate số tin nhắn chưa đọc từ artist
-    orders = Order.objects.filter(customer=request.user).select_related('service_type').annotate(
-        unread_count=Count(
-            'messages',
-            filter=Q(messages__sender__user_type='artist', messages__is_read=False)
-        )
+    orders = with_unread_count(
+        Order.objects.filter(customer=request.user).select_related('service_type'),
+        'customer',
     )
     
-    # Đếm số đơn hoàn thành
-    completed_count = orders.filter(status='completed').count()
-    
-    # Đếm tổng tin nhắn chưa đọc
-    unread_messages = Message.objects.filter(
-        order__customer=request.user,
-        sender__user_type='artist',
-        is_read=False
-    ).count()
+    # Số liệu tổng hợp đọc từ bộ đếm dựng sẵn (1 query)
+    total_key, completed_key, unread_key = counters.customer_keys(request.user.id)
+    stats = counters.get_counters((total_key, completed_key, unread_key))
     
     context = {
         'orders': orders,
-        'completed_count': completed_count,
-        'unread_messages': unread_messages,
+        'total_orders': stats[total_key],
+        'completed_count': stats[completed_key],
+        'unread_messages': stats[unread_key],
     }
     return render(request, 'customer/dashboard.html', context)
 
@@ -149,16 +296,19 @@ def customer_dashboard(request):
 def create_order(request):
     """Tạo đơn hàng mới"""
     if request.method == 'POST':
-        form = OrderForm(request.POST, request.FILES)
+        form = OrderForm(request.POST, request.FILES, owner=request.user)
         if form.is_valid():
             order = form.save(commit=False)
             order.customer = request.user
             order.price = order.service_type.price
+            if form.cleaned_data['upload']:
+                uploads.attach(form.cleaned_data['upload'], order)
             order.save()
+            enqueue('notify.order_created', owner=request.user, order_id=order.id)
             messages.success(request, f'Đơn hàng {order.order_id} đã được tạo thành công!')
             return redirect('order_detail', order_id=order.id)
     else:
-        form = OrderForm()
+        form = OrderForm(owner=request.user)
     
     services = ServiceType.objects.filter(is_active=True)
     tos = TermsOfService.objects.filter(is_active=True).first()
@@ -175,7 +325,7 @@ def create_order(request):
 def order_detail(request, order_id):
     """Chi tiết đơn hàng"""
     order = get_object_or_404(Order, id=order_id, customer=request.user)
-    messages_list = order.messages.all()
+    messages_list, has_older_messages = message_window(order)
     progress_updates = order.progress_updates.all()
     
     # Lấy artist profile để hiển thị QR code
@@ -184,14 +334,17 @@ def order_detail(request, order_id):
     except ArtistProfile.DoesNotExist:
         artist_profile = None
     
-    # Đánh dấu tin nhắn đã đọc
-    messages_list.filter(sender__user_type='artist', is_read=False).update(is_read=True)
+    # Đánh dấu đã đọc đến tin nhắn mới nhất
+    if messages_list:
+        ReadCursor.mark_read(order, 'customer', messages_list[-1].id)
     
     context = {
         'order': order,
         'messages_list': messages_list,
+        'has_older_messages': has_older_messages,
         'progress_updates': progress_updates,
         'artist_profile': artist_profile,  # ← THÊM DÒNG NÀY
+        'live_events': streaming_supported(request),
     }
     return render(request, 'customer/order_detail.html', context)
 
@@ -215,6 +368,8 @@ def upload_payment(request, order_id):
             payment = form.save(commit=False)
             payment.order = order
             payment.save()
+            enqueue('image.normalize', owner=request.user, model='core.Payment', pk=payment.id, field='proof_image')
+            enqueue('notify.payment_uploaded', owner=request.user, payment_id=payment.id)
             messages.success(request, 'Đã upload chứng từ thanh toán. Vui lòng chờ xác thực.')
             return redirect('order_detail', order_id=order.id)
     else:
@@ -237,43 +392,41 @@ def send_message(request, order_id):
         image = request.FILES.get('image')
         
         if content or image:
-            Message.objects.create(
+            message = Message.objects.create(
                 order=order,
                 sender=request.user,
                 content=content or '',
                 image=image
             )
+            enqueue_message_jobs(request, message)
+            if is_ajax(request):
+                return JsonResponse({'message': message_event(message)}, status=201)
             messages.success(request, 'Đã gửi tin nhắn.')
+        elif is_ajax(request):
+            return JsonResponse({'error': 'Tin nhắn trống.'}, status=400)
     
     return redirect('order_detail', order_id=order.id)
 # ============= ARTIST VIEWS =============
 @login_required
 @user_passes_test(is_artist)
+@read_replica
 def artist_dashboard(request):
     """Dashboard artist"""
-    pending_orders = Order.objects.filter(status='pending').count()
-    pending_payments = Payment.objects.filter(status='pending').count()
-    in_progress_orders = Order.objects.filter(status='in_progress').count()
+    # Số liệu tổng hợp đọc từ bộ đếm dựng sẵn (1 query)
+    stats = counters.get_counters(counters.ARTIST_KEYS)
     
     # Lấy orders gần đây và đếm tin nhắn chưa đọc từ customer
-    recent_orders = Order.objects.select_related('customer', 'service_type').annotate(
-        unread_count=Count(
-            'messages',
-            filter=Q(messages__sender__user_type='customer', messages__is_read=False)
-        )
-    ).all()[:10]
-    
-    unread_messages = Message.objects.filter(
-        sender__user_type='customer',
-        is_read=False
-    ).count()
+    recent_orders = with_unread_count(
+        Order.objects.select_related('customer', 'service_type'),
+        'artist',
+    )[:10]
     
     context = {
-        'pending_orders': pending_orders,
-        'pending_payments': pending_payments,
-        'in_progress_orders': in_progress_orders,
+        'pending_orders': stats[counters.ORDERS_PENDING],
+        'pending_payments': stats[counters.PAYMENTS_PENDING],
+        'in_progress_orders': stats[counters.ORDERS_IN_PROGRESS],
         'recent_orders': recent_orders,
-        'unread_messages': unread_messages,
+        'unread_messages': stats[counters.UNREAD_FROM_CUSTOMERS],
     }
     return render(request, 'artist/dashboard.html', context)
 
@@ -288,6 +441,9 @@ def artist_profile(request):
         form = ArtistProfileForm(request.POST, request.FILES, instance=profile)
         if form.is_valid():
             form.save()
+            for field in ('avatar', 'bank_qr_code'):
+                if field in request.FILES:
+                    enqueue('image.normalize', owner=request.user, model='core.ArtistProfile', pk=profile.id, field=field)
             messages.success(request, 'Đã cập nhật thông tin thành công!')
             return redirect('artist_profile')
     else:
@@ -298,6 +454,7 @@ def artist_profile(request):
 
 @login_required
 @user_passes_test(is_artist)
+@read_replica
 def manage_services(request):
     """Quản lý loại dịch vụ"""
     services = ServiceType.objects.all()
@@ -344,10 +501,24 @@ def edit_service(request, service_id):
 
 @login_required
 @user_passes_test(is_artist)
+@read_replica
 def manage_samples(request):
     """Quản lý samples"""
-    samples = Sample.objects.select_related('service_type').all()
-    return render(request, 'artist/samples/list.html', {'samples': samples})
+    form = SampleFilterForm(request.GET)
+    form.is_valid()
+    
+    samples = Sample.objects.select_related('service_type')
+    if form.cleaned_data.get('service'):
+        samples = samples.filter(service_type=form.cleaned_data['service'])
+    
+    # Cùng thứ tự và index với gallery trang chủ
+    page = KeysetPaginator(samples, ARTIST_PAGE_SIZE, ('display_order', '-id')).page(request.GET.get('cursor'))
+    
+    context = {
+        'samples': page,
+        'form': form,
+    }
+    return render(request, 'artist/samples/list.html', context)
 
 
 @login_required
@@ -357,7 +528,8 @@ def add_sample(request):
     if request.method == 'POST':
         form = SampleForm(request.POST, request.FILES)
         if form.is_valid():
-            form.save()
+            sample = form.save()
+            enqueue('sample.build_derivatives', owner=request.user, sample_id=sample.id)
             messages.success(request, 'Đã thêm sample mới!')
             return redirect('manage_samples')
     else:
@@ -388,18 +560,22 @@ def manage_tos(request):
 
 @login_required
 @user_passes_test(is_artist)
+@read_replica
 def artist_orders(request):
     """Danh sách đơn hàng"""
-    status_filter = request.GET.get('status', 'all')
+    form = OrderFilterForm(request.GET)
+    form.is_valid()
+    filters = form.cleaned_data
     
-    orders = Order.objects.select_related('customer', 'service_type').all()
+    orders = filtered_orders(filters).select_related('customer', 'service_type')
     
-    if status_filter != 'all':
-        orders = orders.filter(status=status_filter)
+    sort = filters.get('sort') or 'newest'
+    page = KeysetPaginator(orders, ARTIST_PAGE_SIZE, ORDER_SORTS[sort]).page(request.GET.get('cursor'))
     
     context = {
-        'orders': orders,
-        'status_filter': status_filter,
+        'orders': page,
+        'form': form,
+        'status_filter': filters.get('status') or 'all',
     }
     return render(request, 'artist/orders/list.html', context)
 
@@ -409,11 +585,6 @@ def artist_orders(request):
 def artist_order_detail(request, order_id):
     """Chi tiết đơn hàng (artist view)"""
     order = get_object_or_404(Order, id=order_id)
-    messages_list = order.messages.all()
-    progress_updates = order.progress_updates.all()
-    
-    # Đánh dấu tin nhắn đã đọc
-    messages_list.filter(sender__user_type='customer', is_read=False).update(is_read=True)
     
     # Form gửi tin nhắn
     if request.method == 'POST' and 'send_message' in request.POST:
@@ -421,19 +592,33 @@ def artist_order_detail(request, order_id):
         image = request.FILES.get('image')
         
         if content or image:
-            Message.objects.create(
+            message = Message.objects.create(
                 order=order,
                 sender=request.user,
                 content=content or '',
                 image=image
             )
+            enqueue_message_jobs(request, message)
+            if is_ajax(request):
+                return JsonResponse({'message': message_event(message)}, status=201)
             messages.success(request, 'Đã gửi tin nhắn.')
             return redirect('artist_order_detail', order_id=order.id)
+        elif is_ajax(request):
+            return JsonResponse({'error': 'Tin nhắn trống.'}, status=400)
+    
+    messages_list, has_older_messages = message_window(order)
+    progress_updates = order.progress_updates.all()
+    
+    # Đánh dấu đã đọc đến tin nhắn mới nhất
+    if messages_list:
+        ReadCursor.mark_read(order, 'artist', messages_list[-1].id)
     
     context = {
         'order': order,
         'messages_list': messages_list,
+        'has_older_messages': has_older_messages,
         'progress_updates': progress_updates,
+        'live_events': streaming_supported(request),
     }
     return render(request, 'artist/orders/detail.html', context)
 
@@ -498,35 +683,41 @@ def add_progress(request, order_id):
     order = get_object_or_404(Order, id=order_id)
     
     if request.method == 'POST':
-        form = OrderProgressForm(request.POST, request.FILES)
+        form = OrderProgressForm(request.POST, request.FILES, owner=request.user)
         if form.is_valid():
             progress = form.save(commit=False)
             progress.order = order
             progress.created_by = request.user
+            if form.cleaned_data['upload']:
+                uploads.attach(form.cleaned_data['upload'], progress)
             progress.save()
+            enqueue('image.normalize', owner=request.user, model='core.OrderProgress', pk=progress.id, field='image')
+            enqueue('notify.progress_added', owner=request.user, progress_id=progress.id)
             messages.success(request, 'Đã cập nhật tiến độ!')
             return redirect('artist_order_detail', order_id=order.id)
     else:
-        form = OrderProgressForm()
+        form = OrderProgressForm(owner=request.user)
     
     return render(request, 'artist/orders/add_progress.html', {'form': form, 'order': order})
 
 
 @login_required
 @user_passes_test(is_artist)
+@read_replica
 def artist_payments(request):
-    """Danh sách thanh toán chờ xác thực"""
-    payments = Payment.objects.select_related('order', 'order__customer').filter(
-        status='pending'
-    )
+    """Danh sách thanh toán (mặc định: chờ xác thực)"""
+    form = payment_filters(request)
+    filters = form.cleaned_data
+    
+    payments = filtered_payments(filters).select_related('order', 'order__customer')
     
-    verified_payments = Payment.objects.select_related('order', 'order__customer').filter(
-        status='verified'
-    )[:20]
+    page = KeysetPaginator(payments, ARTIST_PAGE_SIZE, ('-created_at', '-id')).page(request.GET.get('cursor'))
     
     context = {
-        'payments': payments,
-        'verified_payments': verified_payments,
+        'payments': page,
+        'form': form,
+        'status_filter': filters.get('status') or 'all',
+        'pending_count': counters.get_counters([counters.PAYMENTS_PENDING])[counters.PAYMENTS_PENDING],
     }
     return render(request, 'artist/payments/list.html', context)
 
@@ -562,6 +753,8 @@ def verify_payment(request, payment_id):
                 
                 messages.warning(request, 'Đã từ chối thanh toán.')
             
+            # Trang đơn hàng khách đang mở tải lại để thấy trạng thái mới
+            publish_order_event(payment.order_id, status_event(payment.order))
             return redirect('artist_payments')
     else:
         form = PaymentVerificationForm()
@@ -575,40 +768,146 @@ def verify_payment(request, payment_id):
 
 @login_required
 @user_passes_test(is_artist)
+def import_statement(request):
+    """Đối soát sao kê ngân hàng: xác thực hàng loạt thanh toán khớp mã đơn + số tiền"""
+    summary = groups = None
+    if request.method == 'POST':
+        form = StatementImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            statement = form.cleaned_data['statement']
+            dry_run = form.cleaned_data['dry_run']
+            try:
+                lines, summary = reconcile.import_statement(statement, statement.name, request.user, dry_run=dry_run)
+            except reconcile.StatementError as error:
+                form.add_error('statement', str(error))
+            else:
+                groups = reconcile.report(lines, summary)
+                if not dry_run and summary['verified']:
+                    messages.success(request, f"Đã xác thực {summary['verified']} thanh toán từ sao kê.")
+    else:
+        form = StatementImportForm()
+
+    context = {
+        'form': form,
+        'summary': summary,
+        'groups': groups,
+        'report_limit': reconcile.REPORT_LIMIT,
+    }
+    return render(request, 'artist/payments/import_statement.html', context)
+
+
+@login_required
+@user_passes_test(is_artist)
+@read_replica
 def manage_customers(request):
     """Quản lý khách hàng"""
-    customers = User.objects.filter(user_type='customer').prefetch_related('orders')
-    
-    customer_data = []
-    for customer in customers:
-        customer_data.append({
-            'user': customer,
-            'total_orders': customer.orders.count(),
-            'completed_orders': customer.orders.filter(status='completed').count(),
-            'total_spent': sum(
-                order.price for order in customer.orders.filter(status='completed')
-            ),
-        })
+    customers = customers_with_totals()
+    
+    sort = request.GET.get('sort', 'spent')
+    if sort not in CUSTOMER_SORTS:
+        sort = 'spent'
+    customers = customers.order_by(*CUSTOMER_SORTS[sort])
+    
+    # Pagination: 25 khách mỗi trang
+    paginator = Paginator(customers, 25)
+    page = request.GET.get('page')
+    
+    try:
+        customer_page = paginator.page(page)
+    except PageNotAnInteger:
+        customer_page = paginator.page(1)
+    except EmptyPage:
+        customer_page = paginator.page(paginator.num_pages)
     
     context = {
-        'customer_data': customer_data,
+        'customers': customer_page,
+        'sort': sort,
     }
     return render(request, 'artist/customers/list.html', context)
 
 @login_required
 @user_passes_test(is_artist)
+@read_replica
+def export_data(request, dataset, file_format):
+    """Tải CSV/XLSX đơn hàng, thanh toán hoặc khách hàng theo cùng bộ lọc với trang danh sách"""
+    if dataset not in exports.DATASETS or file_format not in exports.CONTENT_TYPES:
+        raise Http404
+    
+    descending = True
+    if dataset == 'orders':
+        form = OrderFilterForm(request.GET)
+        form.is_valid()
+        queryset = filtered_orders(form.cleaned_data)
+        descending = form.cleaned_data.get('sort') != 'oldest'
+    elif dataset == 'payments':
+        queryset = filtered_payments(payment_filters(request).cleaned_data)
+    else:
+        queryset = customers_with_totals()
+    return exports.streaming_response(dataset, queryset, file_format, descending=descending)
+
+@login_required
+@user_passes_test(is_artist)
+@read_replica
+def artist_reports(request):
+    """Báo cáo doanh thu / thời gian xử lý theo tháng, chỉ đọc bảng MonthlyStat đã tổng hợp"""
+    refresh_job = analytics.schedule_refresh()
+    yearly = analytics.yearly_totals()
+    years = [row['year'] for row in yearly]
+    year = request.GET.get('year', '')
+    year = int(year) if year.isdigit() and int(year) in years else (years[-1] if years else timezone.localdate().year)
+    
+    context = {
+        'year': year,
+        'yearly': yearly,
+        'refreshing': refresh_job is not None,
+        **analytics.year_report(year),
+    }
+    return render(request, 'artist/reports.html', context)
+
+@login_required
+@user_passes_test(is_artist)
+@read_replica
+def artist_search(request):
+    """Tìm kiếm toàn văn đơn hàng, tin nhắn, khách hàng"""
+    query = request.GET.get('q', '').strip()
+    kind = request.GET.get('kind', '')
+    if kind not in dict(SearchDocument.KIND_CHOICES):
+        kind = ''
+    
+    results = search.search(query, kind=kind or None) if query else []
+    
+    context = {
+        'query': query,
+        'kind': kind,
+        'kind_choices': SearchDocument.KIND_CHOICES,
+        'results': results,
+    }
+    return render(request, 'artist/search.html', context)
+
+
+@login_required
+@user_passes_test(is_artist)
+@read_replica
 def artist_messages(request):
     """Xem tất cả đơn hàng có tin nhắn mới"""
-    # Lấy tất cả orders có tin nhắn chưa đọc từ customer
-    orders_with_messages = Order.objects.select_related('customer', 'service_type').annotate(
-        unread_count=Count(
-            'messages',
-            filter=Q(messages__sender__user_type='customer', messages__is_read=False)
-        )
-    ).filter(unread_count__gt=0).order_by('-updated_at')
+    # Đơn có tin khách gửi sau cursor đã đọc của artist, tin mới nhất lên đầu.
+    # Đi theo index last_customer_message_id và dừng khi đủ 1 trang; số tin
+    # chưa đọc chỉ được đếm cho các đơn trong trang
+    artist_read = ReadCursor.objects.filter(
+        order=OuterRef('pk'), participant='artist'
+    ).values('last_read_id')[:1]
+    orders = with_unread_count(
+        Order.objects.select_related('customer', 'service_type').filter(
+            last_customer_message_id__gt=Coalesce(Subquery(artist_read), Value(0))
+        ),
+        'artist',
+    )
+    page = KeysetPaginator(orders, ARTIST_PAGE_SIZE, ('-last_customer_message_id', '-id')).page(
+        request.GET.get('cursor')
+    )
     
     context = {
-        'orders': orders_with_messages,
+        'orders': page,
     }
     return render(request, 'artist/messages.html', context)
 # THÊM VÀO CUỐI FILE views.py
@@ -618,4 +917,182 @@ def check_username(request):
     """API endpoint to check if username exists"""
     username = request.GET.get('username', '')
     exists = User.objects.filter(username=username).exists()
-    return JsonResponse({'exists': exists})
\ No newline at end of file
+    return JsonResponse({'exists': exists})
+
+@login_required
+def job_detail(request, job_id):
+    """API endpoint trả về trạng thái job nền"""
+    jobs = Job.objects.all()
+    if not is_artist(request.user):
+        jobs = jobs.filter(owner=request.user)
+    job = get_object_or_404(jobs, id=job_id)
+    return JsonResponse(job_status(job))
+
+
+# ============= REAL-TIME CHAT =============
+
+def participant_orders(user, order_id):
+    """Queryset đơn hàng mà user được xem (khách chỉ thấy đơn của mình)"""
+    orders = Order.objects.filter(id=order_id)
+    if user.user_type == 'customer':
+        return orders.filter(customer=user)
+    return orders
+
+
+async def order_events(request, order_id):
+    """
+    Luồng Server-Sent Events của một đơn hàng: tin nhắn và tiến độ mới.
+    Trình duyệt tự kết nối lại và gửi Last-Event-ID (id tin nhắn cuối đã nhận)
+    để nhận bù các tin bị lỡ. Cần chạy bằng server ASGI (xem duyhoangsite/asgi.py);
+    dưới WSGI trả 404 ngay để EventSource dừng hẳn và trang chuyển sang poll.
+    """
+    if not streaming_supported(request):
+        return HttpResponse("Luồng sự kiện cần server ASGI", status=404, content_type='text/plain; charset=utf-8')
+    user = await request.auser()
+    if not user.is_authenticated or user.user_type not in ('artist', 'customer'):
+        return HttpResponseForbidden()
+    if not await participant_orders(user, order_id).aexists():
+        raise Http404
+    
+    last_id = request.headers.get('Last-Event-ID') or request.GET.get('last_id') or ''
+    last_id = int(last_id) if last_id.isdigit() else None
+    
+    response = StreamingHttpResponse(
+        order_event_stream(order_id, last_id), content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Tắt buffer của nginx để sự kiện tới ngay
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@login_required
+def order_messages(request, order_id):
+    """
+    Feed JSON tin nhắn của đơn, mỗi lần tối đa MESSAGE_PAGE_SIZE tin:
+      ?after=<id>   tin mới hơn id (poll)
+      ?before=<id>  trang cũ hơn id (cuộn lên xem lại)
+    ETag là id tin mới nhất của đơn: chưa có gì mới thì trả 304, không query thêm.
+    """
+    if request.user.user_type not in ('artist', 'customer'):
+        return HttpResponseForbidden()
+    order = get_object_or_404(participant_orders(request.user, order_id))
+    
+    bounds = {}
+    for name in ('after', 'before'):
+        value = request.GET.get(name)
+        if value is not None:
+            if not value.isdigit():
+                return JsonResponse({'error': f'{name} không hợp lệ.'}, status=400)
+            bounds[name] = int(value)
+    
+    latest_id = order.messages.order_by('-id').values_list('id', flat=True).first() or 0
+    etag = quote_etag(str(latest_id))
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        messages_list, has_more = message_window(order, **bounds)
+        response = JsonResponse({
+            'messages': [message_event(message) for message in messages_list],
+            'has_more': has_more,
+            'latest_id': latest_id,
+        })
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@login_required
+@require_POST
+def mark_messages_read(request, order_id):
+    """Trang chat đang mở nhận tin mới qua SSE -> tiến cursor đã đọc"""
+    if request.user.user_type not in ('artist', 'customer'):
+        return HttpResponseForbidden()
+    order = get_object_or_404(participant_orders(request.user, order_id))
+    
+    last_id = request.POST.get('last_id', '')
+    if not last_id.isdigit():
+        return JsonResponse({'error': 'last_id không hợp lệ.'}, status=400)
+    # Không cho cursor vượt quá tin nhắn đang có, tránh "đọc trước" tin tương lai
+    last_id = order.messages.filter(id__lte=int(last_id)).order_by('-id').values_list('id', flat=True).first()
+    read_count = ReadCursor.mark_read(order, request.user.user_type, last_id) if last_id else 0
+    return JsonResponse({'read': read_count})
+
+
+# ============= SỐ LIỆU =============
+
+def metrics_view(request):
+    """Histogram thời gian xử lý theo tên URL, định dạng text của Prometheus"""
+    if not metrics.can_scrape(request):
+        raise Http404
+    response = HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+# ============= MEDIA ĐƯỢC BẢO VỆ =============
+
+@login_required
+def protected_media(request, name):
+    """Chứng từ / brief / ảnh tiến độ / ảnh chat: chỉ artist và khách của đơn đó được xem"""
+    if request.user.user_type not in ('artist', 'customer'):
+        raise Http404
+    # Blob có thể được nhiều đơn dùng chung: chỉ cần user tham gia một trong số đó
+    orders = Order.objects.filter(id__in=media.owning_order_ids(name))
+    if request.user.user_type == 'customer':
+        orders = orders.filter(customer=request.user)
+    # 404 thay vì 403 để không lộ file nào tồn tại
+    if not orders.exists():
+        raise Http404
+    return media.send_file(request, name)
+
+
+
+# ============= UPLOAD CHIA NHỎ =============
+
+@login_required
+@require_POST
+def upload_create(request):
+    """Bắt đầu một upload chia nhỏ (xem core/uploads.py)"""
+    try:
+        size = int(request.POST.get('size', ''))
+    except ValueError:
+        return JsonResponse({'error': 'Thiếu kích thước file.'}, status=400)
+    try:
+        upload = uploads.create_upload(request.user, request.POST.get('purpose'), request.POST.get('filename'), size)
+    except uploads.UploadError as error:
+        return JsonResponse({'error': str(error)}, status=error.status)
+    response = JsonResponse(uploads.upload_state(upload), status=201)
+    response['Location'] = reverse('upload_detail', args=[upload.id])
+    response['Upload-Offset'] = upload.offset
+    return response
+
+
+@login_required
+@require_http_methods(['GET', 'HEAD', 'PATCH', 'DELETE'])
+def upload_detail(request, upload_id):
+    """HEAD/GET: vị trí hiện tại, PATCH: gửi chunk tiếp theo, DELETE: huỷ"""
+    upload = get_object_or_404(Upload, id=upload_id, owner=request.user)
+    if request.method == 'DELETE':
+        uploads.discard(upload)
+        return HttpResponse(status=204)
+
+    if request.method == 'PATCH':
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            length = int(request.headers.get('Content-Length', ''))
+        except ValueError:
+            return JsonResponse({'error': 'Thiếu Upload-Offset hoặc Content-Length.'}, status=400)
+        try:
+            checksum = uploads.parse_checksum(request.headers.get('Upload-Checksum'))
+            upload = uploads.write_chunk(upload, offset, request, length, checksum)
+        except uploads.UploadError as error:
+            # Báo lại vị trí thật để client gửi tiếp từ đó
+            offset = Upload.objects.filter(pk=upload.pk).values_list('offset', flat=True).first() or 0
+            response = JsonResponse({'error': str(error), 'offset': offset}, status=error.status)
+            response['Upload-Offset'] = offset
+            return response
+
+    response = JsonResponse(uploads.upload_state(upload))
+    response['Upload-Offset'] = upload.offset
+    response['Cache-Control'] = 'no-store'
+    return response
@@ -5,6 +5,12 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Chat real-time (core.views.order_events) giữ kết nối SSE lâu dài nên cần chạy
+bằng server ASGI, VD:
+    uvicorn duyhoangsite.asgi:application --workers 1
+Hub mặc định chỉ phân phối trong 1 process; nhiều worker thì đặt REALTIME_HUB
+(xem core/realtime.py).
 """
 
 import os
@@ -25,10 +25,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.staticfiles.CompressedStaticMiddleware',
+    'core.metrics.MetricsMiddleware',
+    'core.querybudget.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.routers.ReplicaPinMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -37,7 +41,8 @@ ROOT_URLCONF = 'duyhoangsite.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates có đo thời gian render (core/metrics.py)
+        'BACKEND': 'core.metrics.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -55,10 +60,101 @@ TEMPLATES = [
 WSGI_APPLICATION = 'duyhoangsite.wsgi.application'
 
 # Database
+# SQLite cho nhiều process/thread ghi đồng thời (benchmark: manage.py bench_sqlite):
+# - WAL: người đọc không chặn người ghi và ngược lại
+# - synchronous=NORMAL: an toàn với WAL, bớt fsync mỗi lần commit
+# - busy_timeout (OPTIONS['timeout']): chờ khoá thay vì báo "database is locked" ngay
+# - BEGIN IMMEDIATE: transaction giành khoá ghi từ đầu, tránh lỗi khi nâng cấp
+#   từ khoá đọc lên khoá ghi (SQLite không chờ busy_timeout trong trường hợp này)
+SQLITE_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA mmap_size=268435456',  # 256 MB
+    'PRAGMA cache_size=-32000',  # ~32 MB mỗi connection
+    'PRAGMA temp_store=MEMORY',
+)
+
+SQLITE_PATH = Path(os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'))
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': SQLITE_PATH,
+        'OPTIONS': {
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': ';'.join(SQLITE_PRAGMAS),
+        },
+        # Giữ connection giữa các request để không chạy lại PRAGMA mỗi lần
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+
+# MySQL: DB_ENGINE=mysql, cấu hình bằng biến môi trường MYSQL_*.
+# Có MYSQL_REPLICA_HOST thì thêm alias 'replica' cho các view chỉ đọc (core/routers.py)
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'mysql':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.mysql',
+        'NAME': os.environ.get('MYSQL_DATABASE', 'duyhoangsite'),
+        'USER': os.environ.get('MYSQL_USER', 'duyhoangsite'),
+        'PASSWORD': os.environ.get('MYSQL_PASSWORD', ''),
+        'HOST': os.environ.get('MYSQL_HOST', '127.0.0.1'),
+        'PORT': os.environ.get('MYSQL_PORT', '3306'),
+        'OPTIONS': {
+            'charset': 'utf8mb4',
+            'isolation_level': 'read committed',
+            'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
+        },
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+    }
+    # File SQLite cũ, nguồn cho `manage.py copy_database --source sqlite`
+    DATABASES['sqlite'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': SQLITE_PATH,
+        'OPTIONS': {'timeout': 20},
+    }
+    if os.environ.get('MYSQL_REPLICA_HOST'):
+        DATABASES['replica'] = {
+            **DATABASES['default'],
+            'HOST': os.environ['MYSQL_REPLICA_HOST'],
+            'PORT': os.environ.get('MYSQL_REPLICA_PORT', DATABASES['default']['PORT']),
+            'USER': os.environ.get('MYSQL_REPLICA_USER', DATABASES['default']['USER']),
+            'PASSWORD': os.environ.get('MYSQL_REPLICA_PASSWORD', DATABASES['default']['PASSWORD']),
+            'TEST': {'MIRROR': 'default'},
+        }
+elif os.environ.get('SQLITE_REPLICA'):
+    # Cặp thay thế khi chạy local: 'replica' là connection chỉ đọc (mode=ro) tới
+    # cùng file SQLite, lệnh ghi nào bị định tuyến nhầm sẽ báo lỗi ngay
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f"file:{SQLITE_PATH}?mode=ro",
+        'OPTIONS': {
+            'uri': True,
+            'timeout': 20,
+            'init_command': 'PRAGMA mmap_size=268435456;PRAGMA cache_size=-32000',
+        },
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['core.routers.PrimaryReplicaRouter']
+
+# Sau khi ghi, người dùng đọc từ database chính trong ngần này giây (read-your-writes)
+REPLICA_PIN_SECONDS = 10
+
+# Cache
+# Dùng file để mọi worker (gunicorn, run_jobs) chia sẻ generation của cache trang chủ
+CACHES = {
+    'default': {
+        # FileBasedCache có đếm trúng / trượt (core/metrics.py)
+        'BACKEND': 'core.metrics.InstrumentedFileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+        'TIMEOUT': 60 * 15,
     }
 }
 
@@ -89,10 +185,91 @@ STATIC_URL = '/static/'  # ← THÊM DẤU / Ở ĐẦU
 STATICFILES_DIRS = [BASE_DIR / 'static']
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# collectstatic ghi tên có hash + bản .gz/.br; xem core/staticfiles.py
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'core.staticfiles.CompressedManifestStaticFilesStorage'},
+}
+
 # Media files (User uploads)
 MEDIA_URL = '/media/'  # ← THÊM DẤU / Ở ĐẦU
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Chứng từ, brief, ảnh tiến độ / chat: lưu ngoài MEDIA_ROOT, URL đi qua view kiểm tra quyền (core/media.py).
+# MEDIA_DELIVERY: 'django' (FileResponse), 'nginx' (X-Accel-Redirect) hoặc 'apache' (X-Sendfile)
+PROTECTED_MEDIA_ROOT = Path(os.environ.get('PROTECTED_MEDIA_ROOT', BASE_DIR / 'protected_media'))
+PROTECTED_MEDIA_URL = '/protected-media/'
+MEDIA_DELIVERY = os.environ.get('MEDIA_DELIVERY', 'django')
+MEDIA_ACCEL_PREFIX = '/internal-media/'
+
+# Blob (file lưu theo nội dung) không còn tham chiếu được giữ thêm bấy nhiêu giờ
+# trước khi `manage.py gc_blobs` xoá
+BLOB_GC_GRACE_HOURS = 24
+
+# Trang báo cáo xếp job làm mới số liệu tháng hiện tại khi đã cũ hơn bấy nhiêu phút (core/analytics.py)
+ANALYTICS_REFRESH_MINUTES = 15
+
+# Upload chia nhỏ cho brief / ảnh tiến độ (core/uploads.py)
+UPLOAD_TEMP_DIR = Path(os.environ.get('UPLOAD_TEMP_DIR', BASE_DIR / 'partial_uploads'))
+UPLOAD_CHUNK_SIZE = 2 * 1024 * 1024
+UPLOAD_MAX_SIZE = 200 * 1024 * 1024
+UPLOAD_EXPIRY_HOURS = 24
+
+# Server-Timing và /metrics (core/metrics.py). Ngoài DEBUG, Server-Timing chỉ gửi
+# cho user staff (True: gửi cho mọi người); Prometheus phải gửi
+# Authorization: Bearer <METRICS_TOKEN>; để trống thì /metrics trả 404
+METRICS_SERVER_TIMING = False
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Ngân sách query theo tên URL (core/querybudget.py), tính cả session / user / savepoint,
+# cho cả GET và POST. Vượt ngân sách hoặc 1 dạng query lặp lại từ QUERY_REPEAT_THRESHOLD
+# lần (N+1) thì ghi log cảnh báo, hoặc raise nếu QUERY_BUDGET_STRICT (dùng khi chạy test).
+# Không khai báo: import_statement, export_data (số query tăng theo số lô dữ liệu)
+QUERY_BUDGET_ENABLED = DEBUG
+QUERY_BUDGET_STRICT = False
+QUERY_BUDGET_DEFAULT = None
+QUERY_REPEAT_THRESHOLD = 5
+QUERY_BUDGETS = {
+    'home': 6,
+    'register': 14,
+    'login': 9,
+    'logout': 5,
+    'tos': 3,
+    'customer_dashboard': 6,
+    'create_order': 26,
+    'order_detail': 18,
+    'upload_payment': 18,
+    'send_message': 12,
+    'artist_dashboard': 6,
+    'artist_messages': 5,
+    'artist_profile': 10,
+    'manage_services': 5,
+    'add_service': 10,
+    'edit_service': 10,
+    'manage_samples': 6,
+    'add_sample': 14,
+    'manage_tos': 10,
+    'artist_orders': 6,
+    'artist_order_detail': 20,
+    'approve_order': 12,
+    'update_order_status': 12,
+    'add_progress': 18,
+    'artist_payments': 6,
+    'verify_payment': 14,
+    'manage_customers': 6,
+    'artist_search': 7,
+    'artist_reports': 10,
+    'check_username': 1,
+    'job_detail': 4,
+    'order_events': 4,
+    'order_messages': 6,
+    'mark_messages_read': 14,
+    'upload_create': 6,
+    'upload_detail': 10,
+    'protected_media': 8,
+    'metrics': 2,
+}
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 